@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Async JSON API for the dashboard
+
+Serves /api/dashboard (the same payload as bot_data.json) plus per-section,
+per-bot and per-horse filtered endpoints from a snapshot held in memory. Every
+response body is built once per snapshot and cached with its gzip encoding and
+ETag, so repeat requests (and If-None-Match revalidations) cost almost nothing.
+When the updater replaces bot_data.json the new snapshot is loaded in the
+background and swapped in; requests never wait on it.
+
+    python api_server.py                  # http://localhost:8080/
+    python api_server.py --port 9000 --data bot_data.json
+
+Endpoints:
+    GET /api/dashboard                    full snapshot
+    GET /api/sections                     section names and row counts
+    GET /api/sections/<name>?user_id=&user_horse_id=
+    GET /api/bots/<user_id>               every section filtered to one bot
+    GET /api/horses/<user_horse_id>       every horse-level section filtered to one horse
+    GET /api/races/<section>?user_id=&user_horse_id=&cursor=&limit=
+                                          older race history, one keyset page at a time
+                                          (needs --history or --history --mirror)
+    GET /api/health
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import signal
+import time
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import parse_qs, unquote, urlsplit
+from bot_data_output import from_columnar_section, get_section_dir
+from db_routing import create_router, dispose_router, engine_for
+from race_history import HISTORY_SECTIONS, fetch_race_history, get_history_page_size
+
+STATUS_TEXT = {
+    200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Request Entity Too Large', 503: 'Service Unavailable',
+}
+
+CONTENT_TYPES = {'.html': 'text/html; charset=utf-8', '.json': 'application/json'}
+
+# Smaller bodies are not worth compressing
+GZIP_MIN_BYTES = 1024
+MAX_HEADER_BYTES = 16384
+MAX_HISTORY_PAGE = 1000
+
+def get_api_host():
+    """Get the interface to listen on from environment variables"""
+    return os.getenv('API_HOST', '0.0.0.0')
+
+def get_api_port():
+    """Get the port to listen on from environment variables"""
+    return int(os.getenv('API_PORT', '8080'))
+
+def get_data_file():
+    """Get the snapshot file the API serves from environment variables"""
+    return os.getenv('API_DATA_FILE', 'bot_data.json')
+
+def get_reload_interval():
+    """Seconds between checks for a newly published snapshot"""
+    return max(float(os.getenv('API_RELOAD_SECONDS', '2')), 0.1)
+
+def get_cache_entries():
+    """Number of filtered responses cached per snapshot"""
+    return max(int(os.getenv('API_CACHE_ENTRIES', '512')), 1)
+
+def get_idle_timeout():
+    """Seconds an idle keep-alive connection is held open"""
+    return float(os.getenv('API_IDLE_TIMEOUT', '30'))
+
+def file_signature(path):
+    """(mtime, size, inode) of a file, or None when it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def build_body(payload):
+    """Compact JSON body with its gzip encoding and ETag"""
+    body = payload if isinstance(payload, bytes) else json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    return {
+        'body': body,
+        'gzip': gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= GZIP_MIN_BYTES else None,
+        'etag': '"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+    }
+
+def load_snapshot(path):
+    """Read a published bot_data.json (records or columnar) into a servable snapshot"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    payload = json.loads(raw)
+    if isinstance(payload, dict) and payload.get('format') == 'columnar':
+        data = {
+            name: from_columnar_section({**schema, 'data': payload['data'][name]})
+            for name, schema in payload['schema'].items()
+        }
+    else:
+        data = payload
+
+    # /api/dashboard sends the published payload as is, compacted when it was pretty-printed
+    body = raw if payload.get('format') == 'columnar' else json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+    return {
+        'data': data,
+        'dashboard': build_body(body),
+        'loaded_at': datetime.now().isoformat(),
+        'cache': OrderedDict(),
+    }
+
+def id_text(value):
+    """An id as text, with integral floats (ids in sections that had NULLs) written as ints"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def filter_records(records, filters):
+    """Records whose columns equal every filter value"""
+    return [
+        record for record in records
+        if all(id_text(record.get(column)) == value for column, value in filters.items())
+    ]
+
+def filtered_sections(data, columns, value):
+    """Every section keyed by one of `columns`, reduced to the rows where it equals value"""
+    out = {}
+    for name, records in data.items():
+        column = next((column for column in columns if records and column in records[0]), None)
+        if column:
+            out[name] = filter_records(records, {column: value})
+    return out
+
+def route(snapshot, path, query):
+    """Resolve an API path to (status, payload); payloads are cached per snapshot by the caller"""
+    data = snapshot['data']
+    parts = [unquote(part) for part in path.strip('/').split('/')]
+    if parts == ['api', 'sections']:
+        return 200, {
+            'loaded_at': snapshot['loaded_at'],
+            'sections': {name: {'rows': len(records)} for name, records in data.items()},
+        }
+    if len(parts) == 3 and parts[:2] == ['api', 'sections']:
+        if parts[2] not in data:
+            return 404, {'error': f"unknown section {parts[2]}"}
+        filters = {column: values[-1] for column, values in query.items() if column in ('user_id', 'user_horse_id', 'horse_id')}
+        return 200, filter_records(data[parts[2]], filters) if filters else data[parts[2]]
+    if len(parts) == 3 and parts[:2] == ['api', 'bots']:
+        return 200, filtered_sections(data, ['user_id'], parts[2])
+    if len(parts) == 3 and parts[:2] == ['api', 'horses']:
+        # Horse_Inventory and Horse_Distance_Analysis name the same id horse_id
+        return 200, filtered_sections(data, ['user_horse_id', 'horse_id'], parts[2])
+    return 404, {'error': f"unknown endpoint {path}"}
+
+def cached_response(state, path, query_string):
+    """(status, response body) for an API path, built once per snapshot"""
+    snapshot = state['snapshot']
+    if snapshot is None:
+        return 503, build_body({'error': 'no snapshot loaded yet'})
+    if path == '/api/dashboard':
+        return 200, snapshot['dashboard']
+    if path == '/api/health':
+        return 200, build_body({'status': 'ok', 'loaded_at': snapshot['loaded_at'], 'served': state['served']})
+
+    cache = snapshot['cache']
+    key = (path, query_string)
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    status, payload = route(snapshot, path, parse_qs(query_string))
+    cache[key] = (status, build_body(payload))
+    if len(cache) > get_cache_entries():
+        cache.popitem(last=False)
+    return cache[key]
+
+async def history_response(state, path, query_string):
+    """One page of race history, read from the database off the event loop (never cached)"""
+    router = state['history_router']
+    if router is None:
+        return 404, build_body({'error': 'race history is not enabled (start the server with --history)'})
+    section = unquote(path[len('/api/races/'):])
+    query = {name: values[-1] for name, values in parse_qs(query_string).items()}
+    if section not in HISTORY_SECTIONS:
+        return 404, build_body({'error': f"unknown race history section {section}"})
+    try:
+        page_size = min(int(query.get('limit') or get_history_page_size()), MAX_HISTORY_PAGE)
+        args = (int(query['user_id']), query.get('user_horse_id'), query.get('cursor'), page_size, section)
+    except (KeyError, ValueError):
+        return 400, build_body({'error': 'user_id is required; user_horse_id and limit must be integers'})
+
+    loop = asyncio.get_running_loop()
+    try:
+        # Picking a replica may check its lag, so that happens off the event loop too
+        page = await loop.run_in_executor(None, lambda: fetch_race_history(engine_for(router, 'Race_History'), *args))
+    except ValueError as e:
+        return 400, build_body({'error': f"bad parameter - {e}"})
+    except Exception as e:
+        print(f"ERROR Race history: Error - {e}")
+        return 503, build_body({'error': 'race history query failed'})
+    return 200, build_body(page)
+
+def static_response(state, path):
+    """The dashboard page and the updater's data files, for same-origin hosting"""
+    if path in ('/', '/index.html'):
+        path = '/static_dashboard.html'
+    allowed = path in ('/static_dashboard.html', '/bot_data.json') or (
+        path.startswith(f"/{state['section_dir']}/") and path.endswith('.json') and '..' not in path
+    )
+    file_path = os.path.join(state['static_root'], path.lstrip('/'))
+    if not allowed or not os.path.isfile(file_path):
+        return 404, build_body({'error': f"not found {path}"}), 'application/json'
+
+    signature = file_signature(file_path)
+    cached = state['static'].get(path)
+    if cached is None or cached[0] != signature:
+        with open(file_path, 'rb') as f:
+            cached = (signature, build_body(f.read()))
+        state['static'][path] = cached
+    return 200, cached[1], CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+
+def render_response(status, response, content_type, method, headers, keep_alive):
+    """Serialize an HTTP/1.1 response, honouring If-None-Match and Accept-Encoding"""
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}"]
+    out = {
+        'Content-Type': content_type,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+        'ETag': response['etag'],
+        'Connection': 'keep-alive' if keep_alive else 'close',
+    }
+    body = response['body']
+    if status == 200 and response['etag'] in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+        lines[0] = f"HTTP/1.1 304 {STATUS_TEXT[304]}"
+        body = b''
+    elif response['gzip'] is not None and 'gzip' in headers.get('accept-encoding', ''):
+        out['Content-Encoding'] = 'gzip'
+        body = response['gzip']
+    out['Content-Length'] = str(len(body))
+    lines += [f"{name}: {value}" for name, value in out.items()]
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+    return head if method == 'HEAD' else head + body
+
+async def read_request(reader):
+    """Request line and lower-cased headers, or None when the client went away"""
+    try:
+        raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), get_idle_timeout())
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        return 'too_large'
+    request_line, *header_lines = raw.decode('latin-1').split("\r\n")
+    headers = {}
+    for line in header_lines:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return request_line, headers
+
+async def handle_connection(state, reader, writer):
+    """Serve requests on one keep-alive connection"""
+    try:
+        while True:
+            request = await read_request(reader)
+            if request is None:
+                break
+            if request == 'too_large':
+                writer.write(render_response(413, build_body({'error': 'headers too large'}), 'application/json', 'GET', {}, False))
+                break
+            request_line, headers = request
+            try:
+                method, target, version = request_line.split(' ', 2)
+            except ValueError:
+                writer.write(render_response(400, build_body({'error': 'bad request line'}), 'application/json', 'GET', {}, False))
+                break
+
+            keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+            url = urlsplit(target)
+            if method not in ('GET', 'HEAD'):
+                status, response, content_type = 405, build_body({'error': f"{method} not allowed"}), 'application/json'
+            elif url.path.startswith('/api/races/'):
+                status, response = await history_response(state, url.path, url.query)
+                content_type = 'application/json'
+            elif url.path.startswith('/api/'):
+                status, response = cached_response(state, url.path, url.query)
+                content_type = 'application/json'
+            else:
+                status, response, content_type = static_response(state, url.path)
+            state['served'] += 1
+            writer.write(render_response(status, response, content_type, method, headers, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def watch_snapshot(state):
+    """Swap in a new snapshot whenever the data file is replaced"""
+    loop = asyncio.get_running_loop()
+    while True:
+        signature = file_signature(state['data_file'])
+        if signature is not None and signature != state['signature']:
+            try:
+                start = time.perf_counter()
+                # Parsing happens off the event loop so requests keep being served from the old snapshot
+                snapshot = await loop.run_in_executor(None, load_snapshot, state['data_file'])
+                state['snapshot'] = snapshot
+                state['signature'] = signature
+                print(f"SUCCESS Snapshot: loaded {state['data_file']} "
+                      f"({len(snapshot['data'])} sections) in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                # A half-published or broken file keeps the previous snapshot in service
+                print(f"ERROR Snapshot: Error - {e}")
+                state['signature'] = signature
+        await asyncio.sleep(get_reload_interval())
+
+async def serve(host, port, data_file, static_root='.', history_router=None):
+    """Run the API until SIGINT/SIGTERM"""
+    state = {
+        'history_router': history_router,
+        'data_file': data_file,
+        'static_root': static_root,
+        'section_dir': get_section_dir().strip('/'),
+        'snapshot': None,
+        'signature': None,
+        'static': {},
+        'served': 0,
+    }
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(state, reader, writer),
+        host, port, limit=MAX_HEADER_BYTES,
+    )
+    watcher = asyncio.create_task(watch_snapshot(state))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"Dashboard API listening on http://{host}:{port}/ (serving {data_file})")
+    async with server:
+        await stop.wait()
+    watcher.cancel()
+    print(f"Stopped after {state['served']} requests")
+
+def main(argv=None):
+    """Start the API server from the command line"""
+    parser = argparse.ArgumentParser(description="Async JSON API backing the dashboard's /api endpoints")
+    parser.add_argument('--host', default=None, help="Interface to listen on (default: API_HOST or 0.0.0.0)")
+    parser.add_argument('--port', type=int, default=None, help="Port to listen on (default: API_PORT or 8080)")
+    parser.add_argument('--data', default=None, help="Snapshot file to serve (default: API_DATA_FILE or bot_data.json)")
+    parser.add_argument('--root', default='.', help="Directory holding static_dashboard.html and the data/ files")
+    parser.add_argument('--history', action='store_true', help="Serve /api/races from the live database")
+    parser.add_argument('--mirror', action='store_true', help="With --history, read race history from the local mirror")
+    args = parser.parse_args(argv)
+
+    history_router = None
+    if args.history and args.mirror:
+        from local_mirror import create_mirror_engine
+        history_router = create_router(create_mirror_engine(), replica_urls=[])
+    elif args.history:
+        from sqlalchemy import create_engine
+        from manual_report_updater import get_database_config
+        history_router = create_router(create_engine(get_database_config(), pool_pre_ping=True))
+
+    asyncio.run(serve(args.host or get_api_host(), args.port or get_api_port(), args.data or get_data_file(),
+                      args.root, history_router))
+    if history_router is not None:
+        dispose_router(history_router)
+
+if __name__ == "__main__":
+    main()
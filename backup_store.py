@@ -0,0 +1,234 @@
+"""
+Deduplicated backup store for the dashboard data
+
+Each backup splits every section into row chunks, stores each distinct chunk
+once as a gzip object named by its SHA-256, and writes a small snapshot manifest
+listing the chunk hashes per section. Chunk boundaries are content-defined: a
+chunk ends after a row whose own hash picks it, not at a fixed row offset.
+Rows added at the top of a newest-first section (Complete_Races, Daily_PnL)
+therefore only change the first chunk, and unchanged rows keep deduplicating.
+Unchanged sections cost nothing but a few hashes in the manifest. Old
+snapshots are thinned out by a retention policy (hourly for BACKUP_KEEP_HOURS
+hours, daily for BACKUP_KEEP_DAYS days) and objects no snapshot refers to any
+more are removed.
+
+Usage:
+    python backup_store.py --list
+    python backup_store.py --restore 20251001_120000 --output bot_data.json
+    python backup_store.py --prune
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from bot_data_output import clean_value, write_atomic
+from result_store import section_records
+
+SNAPSHOT_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+# A chunk is cut early when it reaches this many times BACKUP_CHUNK_ROWS
+MAX_CHUNK_FACTOR = 4
+
+def get_backup_dir():
+    """Get the backup store directory from environment variables"""
+    return os.getenv('BACKUP_STORE_DIR', 'backups')
+
+def get_chunk_rows():
+    """Get the number of rows per backup chunk from environment variables"""
+    return max(int(os.getenv('BACKUP_CHUNK_ROWS', '1000')), 1)
+
+def get_retention():
+    """Get the (hourly hours, daily days) retention windows from environment variables"""
+    return int(os.getenv('BACKUP_KEEP_HOURS', '48')), int(os.getenv('BACKUP_KEEP_DAYS', '90'))
+
+def object_path(store_dir, digest):
+    """Objects are fanned out by the first two hex digits of their hash"""
+    return os.path.join(store_dir, 'objects', digest[:2], f"{digest}.json.gz")
+
+def snapshot_path(store_dir, snapshot_id):
+    """Path of a snapshot manifest"""
+    return os.path.join(store_dir, 'snapshots', f"{snapshot_id}.json")
+
+def put_object(store_dir, blob):
+    """Store a chunk once under its content hash, return the hash and whether it was new"""
+    digest = hashlib.sha256(blob).hexdigest()
+    path = object_path(store_dir, digest)
+    if os.path.exists(path):
+        return digest, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_atomic(path, gzip.compress(blob, compresslevel=6, mtime=0))
+    return digest, True
+
+def content_chunks(rows, chunk_rows):
+    """Group serialized rows into chunks ending where a row's hash hits 1 in chunk_rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if zlib.crc32(row.encode('utf-8')) % chunk_rows == 0 or len(chunk) >= MAX_CHUNK_FACTOR * chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk or not rows:
+        yield chunk
+
+def snapshot_time(snapshot_id):
+    """When a snapshot was taken (ids may carry a _NN suffix)"""
+    return datetime.strptime(snapshot_id[:15], SNAPSHOT_ID_FORMAT)
+
+def write_manifest(store_dir, now, sections):
+    """Write the manifest under a snapshot id no other backup has; returns the id"""
+    os.makedirs(os.path.join(store_dir, 'snapshots'), exist_ok=True)
+    base = now.strftime(SNAPSHOT_ID_FORMAT)
+    attempt = 0
+    while True:
+        snapshot_id = base if attempt == 0 else f"{base}_{attempt:02d}"
+        manifest = {'snapshot_id': snapshot_id, 'created_at': now.isoformat(), 'sections': sections}
+        path = snapshot_path(store_dir, snapshot_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(manifest, indent=2).encode('utf-8'))
+        try:
+            # link() never replaces an existing file, so two backups in the same second both survive
+            os.link(tmp_path, path)
+            return snapshot_id
+        except FileExistsError:
+            attempt += 1
+        finally:
+            os.remove(tmp_path)
+
+def get_object(store_dir, digest):
+    """Read a chunk back as records"""
+    with gzip.open(object_path(store_dir, digest), 'rb') as f:
+        return json.loads(f.read())
+
+def save_backup(data, store_dir=None, chunk_rows=None, now=None):
+    """Back up {section: records} as a snapshot, storing only chunks not already in the store"""
+    store_dir = store_dir or get_backup_dir()
+    chunk_rows = chunk_rows or get_chunk_rows()
+    now = now or datetime.now()
+
+    sections = {}
+    new_objects = 0
+    stored_bytes = 0
+    for name, section in data.items():
+        records = section_records(section)
+        rows = [
+            json.dumps({col: clean_value(value) for col, value in record.items()}, separators=(',', ':'), default=str)
+            for record in records
+        ]
+        hashes = []
+        for chunk in content_chunks(rows, chunk_rows):
+            blob = f"[{','.join(chunk)}]".encode('utf-8')
+            digest, created = put_object(store_dir, blob)
+            hashes.append(digest)
+            if created:
+                new_objects += 1
+                stored_bytes += os.path.getsize(object_path(store_dir, digest))
+        sections[name] = {'rows': len(records), 'chunks': hashes}
+
+    snapshot_id = write_manifest(store_dir, now, sections)
+    return snapshot_id, new_objects, stored_bytes
+
+def list_snapshots(store_dir=None):
+    """Snapshot ids in the store, oldest first"""
+    store_dir = store_dir or get_backup_dir()
+    try:
+        names = os.listdir(os.path.join(store_dir, 'snapshots'))
+    except OSError:
+        return []
+    return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+def restore_snapshot(snapshot_id, store_dir=None):
+    """Rebuild {section: records} for a snapshot"""
+    store_dir = store_dir or get_backup_dir()
+    with open(snapshot_path(store_dir, snapshot_id)) as f:
+        manifest = json.load(f)
+    data = {}
+    for name, section in manifest['sections'].items():
+        records = []
+        for digest in section['chunks']:
+            records.extend(get_object(store_dir, digest))
+        data[name] = records
+    return data
+
+def snapshots_to_keep(snapshot_ids, now=None, keep_hours=None, keep_days=None):
+    """Newest snapshot per hour inside the hourly window and per day inside the daily window"""
+    default_hours, default_days = get_retention()
+    keep_hours = default_hours if keep_hours is None else keep_hours
+    keep_days = default_days if keep_days is None else keep_days
+    now = now or datetime.now()
+
+    keep = set(snapshot_ids[-1:])
+    buckets = set()
+    for snapshot_id in sorted(snapshot_ids, reverse=True):
+        taken_at = snapshot_time(snapshot_id)
+        age = now - taken_at
+        if age <= timedelta(hours=keep_hours):
+            bucket = taken_at.strftime('H%Y%m%d%H')
+        elif age <= timedelta(days=keep_days):
+            bucket = taken_at.strftime('D%Y%m%d')
+        else:
+            continue
+        if bucket not in buckets:
+            buckets.add(bucket)
+            keep.add(snapshot_id)
+    return keep
+
+def prune_backups(store_dir=None, now=None, keep_hours=None, keep_days=None):
+    """Apply the retention policy, then delete objects no remaining snapshot refers to"""
+    store_dir = store_dir or get_backup_dir()
+    snapshot_ids = list_snapshots(store_dir)
+    keep = snapshots_to_keep(snapshot_ids, now, keep_hours, keep_days)
+
+    removed_snapshots = 0
+    for snapshot_id in snapshot_ids:
+        if snapshot_id not in keep:
+            os.remove(snapshot_path(store_dir, snapshot_id))
+            removed_snapshots += 1
+
+    referenced = set()
+    for snapshot_id in keep:
+        with open(snapshot_path(store_dir, snapshot_id)) as f:
+            for section in json.load(f)['sections'].values():
+                referenced.update(section['chunks'])
+
+    removed_objects = 0
+    objects_dir = os.path.join(store_dir, 'objects')
+    for root, _, files in os.walk(objects_dir):
+        for name in files:
+            if name.endswith('.json.gz') and name[:-len('.json.gz')] not in referenced:
+                os.remove(os.path.join(root, name))
+                removed_objects += 1
+    return removed_snapshots, removed_objects
+
+def main(argv=None):
+    """List, restore or prune backups from the command line"""
+    parser = argparse.ArgumentParser(description="Deduplicated bot data backup store")
+    parser.add_argument('--list', action='store_true', help="List stored snapshots")
+    parser.add_argument('--restore', metavar='SNAPSHOT_ID', help="Restore a snapshot (use 'latest' for the newest)")
+    parser.add_argument('--output', default=None, help="File to write the restored data to (default: stdout)")
+    parser.add_argument('--prune', action='store_true', help="Apply the retention policy now")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for snapshot_id in list_snapshots():
+            print(snapshot_id)
+    if args.restore:
+        snapshot_ids = list_snapshots()
+        snapshot_id = snapshot_ids[-1] if args.restore == 'latest' and snapshot_ids else args.restore
+        data = restore_snapshot(snapshot_id)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(data, f, indent=2, default=str)
+            print(f"Restored {snapshot_id} to {args.output}")
+        else:
+            print(json.dumps(data, indent=2, default=str))
+    if args.prune:
+        removed_snapshots, removed_objects = prune_backups()
+        print(f"Pruned {removed_snapshots} snapshots and {removed_objects} objects")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Synthetic-data benchmark for the dashboard updater
+
+Generates a seeded stand-in database (SQLite, same schema and indexes as the
+local mirror) at a configurable scale, then times the fetch, serialize and
+report stages of manual_report_updater.py against it and writes the timings
+as JSON so runs can be compared:
+
+    python benchmark_updater.py generate --entrants 7300000 --db bench.sqlite
+    python benchmark_updater.py run --db bench.sqlite --modes plain,stream --repeat 3 \\
+        --output bench_results.json --compare previous_results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from local_mirror import MIRROR_TABLES
+
+DEFAULT_BOT_USER_IDS = [10111491, 10211493, 10411491, 10711491, 11011491]
+TRAITS = ['speed', 'stamina', 'acceleration']
+SKILLS = ['first_out', 'front', 'rail', 'closing', 'dueling', 'turning',
+          'working', 'breezing', 'drafting', 'final_kick', 'overtaking']
+ZONES = ['EU', 'NA', 'AP']
+TRACKS = ['Ascot', 'Tayport', 'Aintree', 'Epsom', 'Kelso', 'Ayr']
+
+# updater flags exercised by each benchmark mode
+BENCHMARK_MODES = {
+    'plain': {},
+    'shared-scan': {'shared_scan': True},
+    'stream': {'stream': True},
+    'incremental': {'incremental': True},
+}
+
+def bot_user_ids(bots):
+    """The real bot ids first, then made-up ones for larger cohorts"""
+    return (DEFAULT_BOT_USER_IDS + [20000000 + i for i in range(max(bots - 5, 0))])[:bots]
+
+def generate_dataset(db_path, entrants=200000, bots=5, bot_share=0.1, horses_per_bot=100,
+                     days=90, seed=42, chunk_rows=500000):
+    """Build the synthetic tables, written in chunks so millions of rows fit in memory"""
+    rng = np.random.default_rng(seed)
+    users = np.array(bot_user_ids(bots))
+    now = int(time.time())
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+
+    events = max(entrants // 10, 1)
+    event_zone = rng.choice(ZONES, events)
+    event_time = now - rng.integers(0, days * 86400, events)
+
+    # Races: ~10 runners each, one result row per event
+    for start in range(0, events, chunk_rows):
+        ids = np.arange(start, min(start + chunk_rows, events))
+        pd.DataFrame({
+            '_id': ids, 'Zone': event_zone[ids],
+            'distance': rng.integers(1, 7, len(ids)), 'surface': rng.integers(1, 3, len(ids)),
+            'weather': rng.integers(1, 4, len(ids)), 'condition': rng.integers(1, 4, len(ids)),
+            'track_name': rng.choice(TRACKS, len(ids)),
+        }).to_sql('full_WC_event', engine, if_exists='append', index=False)
+        pd.DataFrame({'_id': ids, 'event_id': ids, 'Zone': event_zone[ids]}).to_sql(
+            'full_WC_result', engine, if_exists='append', index=False)
+
+    # One horse snapshot per entrant; a bot_share of them belong to the bots
+    for start in range(0, entrants, chunk_rows):
+        n = min(chunk_rows, entrants - start)
+        ids = np.arange(start + 1, start + n + 1)
+        event_id = rng.integers(0, events, n)
+        is_bot = rng.random(n) < bot_share
+        bot_index = rng.integers(0, len(users), n)
+        user_id = np.where(is_bot, users[bot_index], rng.integers(1, 5000000, n))
+        user_horse_id = np.where(is_bot, bot_index * 100000 + rng.integers(1, horses_per_bot + 1, n), rng.integers(1, 10 ** 9, n))
+
+        snapshots = pd.DataFrame({
+            '_id': ids, 'Zone': event_zone[event_id], 'user_id': user_id, 'user_horse_id': user_horse_id,
+            'name': 'Horse ' + pd.Series(user_horse_id).astype(str),
+        })
+        for column in ['generation', 'gender', 'age', 'trainer_id', 'rating', 'speed', 'stamina',
+                       'acceleration', 'wins', 'shows', 'place', 'trend']:
+            snapshots[column] = rng.integers(1, 100, n)
+        snapshots['career_earnings'] = rng.integers(0, 10 ** 10, n).astype(float)
+        snapshots['grade'] = rng.integers(1, 4, n)
+        snapshots['final_position'] = rng.integers(1, 13, n)
+        snapshots['created_ts'] = pd.to_datetime(event_time[event_id], unit='s').strftime('%Y-%m-%d %H:%M:%S')
+        for trait in TRAITS:
+            for k in (1, 2):
+                snapshots[f'{trait}_trait_{k}'] = rng.choice(['A', 'B', 'C', 'D'], n)
+                snapshots[f'{trait}_trait_{k}_pwr'] = rng.integers(1, 10, n)
+        for skill in SKILLS:
+            snapshots[f'skill_{skill}'] = rng.integers(1, 10, n)
+        snapshots.to_sql('full_WC_horse_snapshot', engine, if_exists='append', index=False)
+
+        pd.DataFrame({
+            '_id': ids, 'event_id': event_id, 'horse_snapshot_id': ids, 'Zone': event_zone[event_id],
+        }).to_sql('full_WC_entrant', engine, if_exists='append', index=False)
+
+        # Entry fees (negative) and winnings per entrant; recent unsettled ones make up In_Play
+        pd.DataFrame({
+            '_id': ids, 'user_id': user_id,
+            'amount': np.where(rng.random(n) < 0.7, -rng.integers(1, 5 * 10 ** 6, n), rng.integers(1, 2 * 10 ** 7, n)).astype(float),
+            'ctx_type': 1, 'source_trx_id': np.where(rng.random(n) < 0.02, events + ids, event_id),
+            'created_at': event_time[event_id],
+        }).to_sql('player_token_transaction', engine, if_exists='append', index=False)
+
+    pd.DataFrame({'user_id': users, 'amount': rng.integers(10 ** 9, 10 ** 10, len(users)).astype(float)}).to_sql(
+        'player_token_account', engine, if_exists='append', index=False)
+
+    horse_users = np.repeat(np.arange(len(users)), horses_per_bot)
+    horse_ids = horse_users * 100000 + np.tile(np.arange(1, horses_per_bot + 1), len(users))
+    pd.DataFrame({
+        '_id': horse_ids, 'user_id': users[horse_users], 'oc_shard': 1,
+        'name': 'Horse ' + pd.Series(horse_ids).astype(str), 'grade': rng.integers(1, 4, len(horse_ids)),
+        'bloodline': rng.integers(1, 3, len(horse_ids)), 'gen': rng.integers(1, 5, len(horse_ids)),
+        'gender': rng.integers(1, 3, len(horse_ids)), 'age': rng.integers(2, 8, len(horse_ids)),
+        'trainer_id': 1, 'status': rng.integers(0, 2, len(horse_ids)), 'horse_type_id': 1,
+        'modified_utc': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }).to_sql('player_horse', engine, if_exists='append', index=False)
+
+    dates = pd.date_range(end=datetime.now().date(), periods=days).strftime('%Y-%m-%d')
+    for table, column, values in [('distance', 'distance', 7), ('grade', 'grade', 4), ('track', 'track_id', 30)]:
+        grid = pd.MultiIndex.from_product([users, dates, range(1, values)], names=['user_id', 'gaming_date', column])
+        facts = grid.to_frame(index=False)
+        facts['count'] = rng.integers(0, 20, len(facts))
+        facts.to_sql(f'player_daily_fact_{table}', engine, if_exists='append', index=False)
+
+    # Same indexes the mirror builds
+    with engine.begin() as conn:
+        for table, spec in MIRROR_TABLES.items():
+            for columns in spec.get('indexes', []):
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{'_'.join(columns)} ON {table} ({', '.join(columns)})"))
+    engine.dispose()
+
+    scale = {'entrants': entrants, 'events': events, 'bots': bots, 'bot_share': bot_share,
+             'horses_per_bot': horses_per_bot, 'days': days, 'seed': seed}
+    with open(f"{db_path}.scale.json", 'w') as f:
+        json.dump(scale, f, indent=2)
+    return scale
+
+def timed(fn, *args, **kwargs):
+    """Run fn quietly and return (result, seconds)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 4)
+
+def git_commit():
+    """Current commit, so results can be tied to the code that produced them"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def run_benchmark(db_path, modes=None, repeat=3, workers=None):
+    """Time fetch, serialize and report for each mode against the synthetic database"""
+    with open(f"{db_path}.scale.json") as f:
+        scale = json.load(f)
+    workdir = tempfile.mkdtemp(prefix='updater_bench_')
+    os.environ.update({
+        'LOCAL_MIRROR_PATH': os.path.abspath(db_path),
+        'BOT_USER_IDS': ','.join(map(str, bot_user_ids(scale['bots']))),
+        'UPDATER_STATE_FILE': os.path.join(workdir, 'updater_state.json'),
+        'QUERY_METRICS_FILE': os.path.join(workdir, 'query_metrics.jsonl'),
+        # Freshness markers and carried-over sections stay out of the real output
+        'SECTION_FRESHNESS_FILE': os.path.join(workdir, 'section_freshness.json'),
+        'SECTION_DATA_DIR': os.path.join(workdir, 'data'),
+        'RACE_ROLLUP_FILE': os.path.join(workdir, 'race_rollup.json'),
+        'OPEN_POSITIONS_FILE': os.path.join(workdir, 'open_positions.json'),
+        'QUERY_EXPLAIN': '0',
+    })
+
+    # Imported after the environment is set up
+    import manual_report_updater as updater
+    from bot_data_output import serialize_bot_data, write_section_files
+
+    runs = []
+    for mode in modes or list(BENCHMARK_MODES):
+        for i in range(repeat):
+            options = dict(BENCHMARK_MODES[mode])
+            if mode == 'incremental':
+                options['rebuild'] = i == 0
+            data, fetch_seconds = timed(updater.fetch_bot_data, max_workers=workers, mirror=True, **options)
+            if data is None:
+                raise RuntimeError(f"fetch failed in mode {mode}")
+            records, records_seconds = timed(serialize_bot_data, data, 'records')
+            columnar, columnar_seconds = timed(serialize_bot_data, data, 'columnar')
+            _, sections_seconds = timed(write_section_files, data, 'columnar', os.path.join(workdir, f'data_{mode}'))
+            _, report_seconds = timed(updater.generate_summary_report, data)
+            runs.append({
+                'mode': mode,
+                'repeat': i,
+                'fetch_seconds': fetch_seconds,
+                'serialize_records_seconds': records_seconds,
+                'serialize_columnar_seconds': columnar_seconds,
+                'section_files_seconds': sections_seconds,
+                'report_seconds': report_seconds,
+                'rows': sum(len(records_) for records_ in data.values()),
+                'records_bytes': len(records),
+                'columnar_bytes': len(columnar),
+            })
+            print(f"SUCCESS {mode} #{i + 1}: fetch {fetch_seconds:.2f}s, serialize {records_seconds:.2f}s, report {report_seconds:.3f}s")
+
+    stages = [key for key in runs[0] if key.endswith('_seconds')] if runs else []
+    summary = pd.DataFrame(runs).groupby('mode')[stages].median().round(4).to_dict('index') if runs else {}
+    return {
+        'benchmark_version': 1,
+        'run_at': datetime.now().isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'scale': scale,
+        'repeat': repeat,
+        'runs': runs,
+        'summary': summary,
+    }
+
+def compare_results(current, previous):
+    """Stage-by-stage median ratios against an earlier results file"""
+    if current['scale'] != previous.get('scale'):
+        print("WARNING: the two results were produced at different scales")
+    lines = []
+    for mode, stages in current['summary'].items():
+        old = previous.get('summary', {}).get(mode)
+        if not old:
+            continue
+        for stage, seconds in stages.items():
+            if old.get(stage):
+                lines.append(f"{mode:12} {stage:28} {old[stage]:9.3f}s -> {seconds:9.3f}s  ({seconds / old[stage]:.2f}x)")
+    return "\n".join(lines)
+
+def main(argv=None):
+    """Generate a synthetic database or benchmark the updater against one"""
+    parser = argparse.ArgumentParser(description="Benchmark manual_report_updater.py on synthetic data")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    gen = sub.add_parser('generate', help="Build the synthetic database")
+    gen.add_argument('--db', default='bench.sqlite')
+    gen.add_argument('--entrants', type=int, default=200000, help="Rows in full_WC_entrant (production is ~7.3M)")
+    gen.add_argument('--bots', type=int, default=5)
+    gen.add_argument('--bot-share', type=float, default=0.1, help="Fraction of entrants that belong to the bots")
+    gen.add_argument('--horses-per-bot', type=int, default=100)
+    gen.add_argument('--days', type=int, default=90)
+    gen.add_argument('--seed', type=int, default=42)
+
+    run = sub.add_parser('run', help="Time the updater stages")
+    run.add_argument('--db', default='bench.sqlite')
+    run.add_argument('--modes', default=','.join(BENCHMARK_MODES), help="Comma separated: " + ', '.join(BENCHMARK_MODES))
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--workers', type=int, default=None)
+    run.add_argument('--output', default='bench_results.json')
+    run.add_argument('--compare', default=None, help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        start = time.perf_counter()
+        scale = generate_dataset(args.db, args.entrants, args.bots, args.bot_share,
+                                 args.horses_per_bot, args.days, args.seed)
+        print(f"Generated {args.db} in {time.perf_counter() - start:.1f}s: {scale}")
+        return
+
+    results = run_benchmark(args.db, [m.strip() for m in args.modes.split(',') if m.strip()], args.repeat, args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+    print(json.dumps(results['summary'], indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare_results(results, json.load(f)))
+
+if __name__ == "__main__":
+    main()
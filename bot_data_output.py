@@ -0,0 +1,224 @@
+"""
+Compact output for bot_data.json
+
+The dashboard data is serialized once, written atomically and emitted together
+with pre-compressed .gz (and .br, when the brotli package is installed)
+siblings. The columnar format stores each section as a schema header plus one
+array per column instead of repeating every column name on every row.
+
+Each section is also written to its own file under SECTION_DATA_DIR together
+with a manifest of content hashes, so the dashboard can poll the manifest and
+only download the sections that changed. The manifest also says how old each
+section is and whether it is being served stale.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+from datetime import datetime
+from result_store import column_values, section_records
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+OUTPUT_FORMATS = ['records', 'columnar']
+COLUMNAR_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+def get_output_format():
+    """Get the bot_data.json format from environment variables"""
+    output_format = os.getenv('OUTPUT_FORMAT', 'records').lower()
+    return output_format if output_format in OUTPUT_FORMATS else 'records'
+
+def get_section_dir():
+    """Get the per-section data directory from environment variables"""
+    return os.getenv('SECTION_DATA_DIR', 'data')
+
+def column_type(values):
+    """Name the JSON type of a column from its first non-null value"""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        return 'string'
+    return 'null'
+
+def clean_value(value):
+    """NaN/inf are not valid JSON, send them as null"""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def columnar_section(records):
+    """Schema header and column arrays for one section (records or a typed frame)"""
+    if hasattr(records, 'columns'):
+        # Typed frames go straight to column arrays without building a dict per row
+        columns = list(records.columns)
+        arrays = [[clean_value(value) for value in column_values(records[col])] for col in columns]
+    else:
+        columns = []
+        for record in records:
+            columns.extend(col for col in record if col not in columns)
+        arrays = [[clean_value(record.get(col)) for record in records] for col in columns]
+    schema = {
+        'columns': columns,
+        'types': [column_type(values) for values in arrays],
+        'rows': len(records),
+    }
+    return schema, arrays
+
+def to_columnar(data, generated_at=None):
+    """Turn {section: records} into a schema header plus column arrays"""
+    schema = {}
+    sections = {}
+    for name, records in data.items():
+        schema[name], sections[name] = columnar_section(records)
+    return {
+        'format': 'columnar',
+        'version': COLUMNAR_VERSION,
+        'generated_at': generated_at or datetime.now().isoformat(),
+        'schema': schema,
+        'data': sections,
+    }
+
+def serialize_bot_data(data, output_format=None):
+    """Serialize the dashboard data to bytes exactly once"""
+    output_format = output_format or get_output_format()
+    if output_format == 'columnar':
+        payload = to_columnar(data)
+        return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    if not data:
+        return b'{}'
+    # Same bytes as json.dumps(data, indent=2), with only one section's records alive at a time
+    parts = []
+    for name, section in data.items():
+        body = json.dumps(section_records(section), indent=2, default=str).replace('\n', '\n  ')
+        parts.append(f"  {json.dumps(name)}: {body}")
+    return ("{\n" + ",\n".join(parts) + "\n}").encode('utf-8')
+
+def serialize_section(records, output_format=None):
+    """Serialize one section for its own file (no timestamps, so equal data hashes equal)"""
+    output_format = output_format or get_output_format()
+    if output_format == 'columnar':
+        schema, arrays = columnar_section(records)
+        payload = {'format': 'columnar', 'version': COLUMNAR_VERSION, **schema, 'data': arrays}
+        return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    cleaned = [{col: clean_value(value) for col, value in record.items()} for record in section_records(records)]
+    return json.dumps(cleaned, separators=(',', ':'), default=str).encode('utf-8')
+
+def write_atomic(path, blob):
+    """Write bytes to a temp file and rename it so readers never see a partial file"""
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_file, path)
+
+def write_compressed_siblings(path, blob):
+    """Write path.gz (and path.br when brotli is available) next to path"""
+    written = [f"{path}.gz"]
+    write_atomic(f"{path}.gz", gzip.compress(blob, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_atomic(f"{path}.br", brotli.compress(blob, quality=11))
+        written.append(f"{path}.br")
+    return written
+
+def from_columnar_section(payload):
+    """Rebuild records from one columnar section file"""
+    arrays = payload['data']
+    return [
+        {col: arrays[c][i] for c, col in enumerate(payload['columns'])}
+        for i in range(payload['rows'])
+    ]
+
+def read_section_file(path):
+    """Read a section file back into records, whichever format it was written in"""
+    with open(path) as f:
+        payload = json.load(f)
+    if isinstance(payload, dict) and payload.get('format') == 'columnar':
+        return from_columnar_section(payload)
+    return payload
+
+def load_manifest(directory):
+    """Read the previous section manifest, or an empty one"""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'sections': {}}
+
+def write_section_files(data, output_format=None, directory=None, markers=None):
+    """Write one file per section plus a manifest of content hashes, skipping unchanged sections
+
+    markers are extra per-section manifest fields (the staleness markers of
+    section_freshness.py). Returns the manifest, the changed section names and
+    the records each changed section had before it was overwritten (for the
+    delta feed).
+    """
+    output_format = output_format or get_output_format()
+    directory = directory or get_section_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    previous_manifest = load_manifest(directory)
+    previous = previous_manifest.get('sections', {})
+    generated_at = datetime.now().isoformat()
+    sections = {}
+    changed = []
+    replaced = {}
+    for name, records in data.items():
+        blob = serialize_section(records, output_format)
+        digest = hashlib.sha256(blob).hexdigest()[:16]
+        file_name = f"{name}.json"
+        old = previous.get(name, {})
+        if old.get('hash') == digest and old.get('file') == file_name and os.path.exists(os.path.join(directory, file_name)):
+            updated_at = old.get('updated_at', generated_at)
+        else:
+            old_path = os.path.join(directory, old.get('file', file_name))
+            if old and os.path.exists(old_path):
+                try:
+                    replaced[name] = read_section_file(old_path)
+                except (OSError, ValueError, KeyError):
+                    pass
+            write_atomic(os.path.join(directory, file_name), blob)
+            updated_at = generated_at
+            changed.append(name)
+        sections[name] = {
+            'file': file_name,
+            'hash': digest,
+            'bytes': len(blob),
+            'rows': len(records),
+            'updated_at': updated_at,
+            **(markers or {}).get(name, {}),
+        }
+
+    # Sections that are no longer produced would otherwise be served stale
+    removed = [name for name in previous if name not in sections]
+    for name in removed:
+        replaced[name] = None
+        try:
+            os.remove(os.path.join(directory, previous[name]['file']))
+        except (OSError, KeyError):
+            pass
+
+    snapshot = previous_manifest.get('snapshot', 0)
+    if changed or removed:
+        snapshot += 1
+
+    manifest = {
+        'version': COLUMNAR_VERSION,
+        'format': output_format,
+        'snapshot': snapshot,
+        'generated_at': generated_at,
+        'sections': sections,
+    }
+    # The manifest goes last so it never points at a section file that is not there yet
+    write_atomic(os.path.join(directory, MANIFEST_FILE), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest, changed + removed, replaced
@@ -0,0 +1,133 @@
+"""
+Read-replica routing
+
+The heavy horse analytics (the All_Horses_* joins, the snapshot scans, the
+entrant stream) can be served by read replicas listed in DB_REPLICA_URLS, so
+they no longer compete with the latency-sensitive balance reads on the
+primary. Every DSN gets its own connection pool. Sections matching
+REPLICA_SECTIONS go to the least-lagged replica whose lag (Seconds_Behind_Source,
+re-checked every REPLICA_LAG_CHECK_SECONDS) is within REPLICA_MAX_LAG_SECONDS
+(or the section's entry in REPLICA_MAX_LAGS); otherwise they fall back to the
+primary. Balances and anything not listed always read from the primary.
+"""
+
+import os
+import threading
+import time
+from fnmatch import fnmatch
+from sqlalchemy import create_engine
+
+# Sections routed to a replica by default (fnmatch patterns)
+DEFAULT_REPLICA_SECTIONS = [
+    'All_Horses_*', 'Horse_*', 'Recent_Race_Performance', 'Races_Entered', 'Stable_Composition',
+    'Bot_*', 'Snapshot_Scan', 'Entrant_Stream', 'Race_History',
+]
+
+# Always read from the primary, whatever REPLICA_SECTIONS says
+PRIMARY_SECTIONS = ['Reserve_Balance', 'In_Play_Balance']
+
+def get_replica_urls():
+    """Get the read-replica DSNs (comma separated) from environment variables"""
+    return [url.strip() for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url.strip()]
+
+def get_replica_sections():
+    """Section patterns served by replicas (REPLICA_SECTIONS=All_Horses_*,Horse_*,...)"""
+    patterns = os.getenv('REPLICA_SECTIONS')
+    if patterns is None:
+        return list(DEFAULT_REPLICA_SECTIONS)
+    return [pattern.strip() for pattern in patterns.split(',') if pattern.strip()]
+
+def get_max_lag():
+    """Get the default replica lag (seconds) a section tolerates"""
+    return max(float(os.getenv('REPLICA_MAX_LAG_SECONDS', '30')), 0)
+
+def get_max_lags():
+    """Per-section lag tolerances, overridable with REPLICA_MAX_LAGS=All_Horses_Complete_Races=600,..."""
+    lags = {}
+    for item in os.getenv('REPLICA_MAX_LAGS', '').split(','):
+        if '=' in item:
+            section, seconds = item.split('=', 1)
+            lags[section.strip()] = max(float(seconds), 0)
+    return lags
+
+def get_lag_check_interval():
+    """Seconds a measured replica lag is reused before checking again"""
+    return max(float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '15')), 0)
+
+def create_pooled_engine(DATABASE_URL, max_workers):
+    """Create an engine whose connection pool can serve every fetch worker at once"""
+    return create_engine(
+        DATABASE_URL,
+        pool_size=max_workers,
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+
+def create_router(primary, max_workers=1, replica_urls=None):
+    """The primary engine plus one pooled engine per replica DSN"""
+    replica_urls = get_replica_urls() if replica_urls is None else replica_urls
+    replicas = [
+        {'engine': create_pooled_engine(url, max_workers), 'lag': None, 'checked_at': None}
+        for url in replica_urls
+    ]
+    if replicas:
+        print(f"Routing {', '.join(get_replica_sections())} to {len(replicas)} replica(s)")
+    return {'primary': primary, 'replicas': replicas, 'lock': threading.Lock()}
+
+def replica_lag(engine):
+    """Seconds the replica is behind its source (inf when replication is stopped or unreadable)"""
+    try:
+        with engine.connect() as conn:
+            try:
+                row = conn.exec_driver_sql("SHOW REPLICA STATUS").mappings().first()
+            except Exception:
+                # MySQL before 8.0.22 / MariaDB
+                row = conn.exec_driver_sql("SHOW SLAVE STATUS").mappings().first()
+    except Exception as e:
+        print(f"ERROR Replica {engine.url.host}: Error - {e}")
+        return float('inf')
+    if row is None:
+        # Not a classic async replica (e.g. a managed reader endpoint); nothing to wait for
+        return 0.0
+    lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+    return float('inf') if lag is None else float(lag)
+
+def current_lags(router):
+    """Lag of every replica, re-measured when older than REPLICA_LAG_CHECK_SECONDS"""
+    now = time.monotonic()
+    with router['lock']:
+        stale = [
+            replica for replica in router['replicas']
+            if replica['checked_at'] is None or now - replica['checked_at'] >= get_lag_check_interval()
+        ]
+        for replica in stale:
+            replica['lag'] = replica_lag(replica['engine'])
+            replica['checked_at'] = now
+            if replica['lag'] > get_max_lag():
+                print(f"ROUTE Replica {replica['engine'].url.host}: {replica['lag']:g}s behind, "
+                      f"sections tolerating less read from the primary")
+        return [replica['lag'] for replica in router['replicas']]
+
+def routes_to_replica(key):
+    """Whether a section may be served by a replica"""
+    if key in PRIMARY_SECTIONS:
+        return False
+    return any(fnmatch(key, pattern) for pattern in get_replica_sections())
+
+def engine_for(router, key):
+    """Engine a section reads from: the least-lagged replica within its tolerance, else the primary"""
+    if not router['replicas'] or not routes_to_replica(key):
+        return router['primary']
+    max_lag = get_max_lags().get(key, get_max_lag())
+    lags = current_lags(router)
+    best = min(range(len(lags)), key=lambda i: lags[i])
+    if lags[best] <= max_lag:
+        return router['replicas'][best]['engine']
+    return router['primary']
+
+def dispose_router(router):
+    """Close every pool"""
+    router['primary'].dispose()
+    for replica in router['replicas']:
+        replica['engine'].dispose()
@@ -0,0 +1,116 @@
+"""
+Row-level delta feed between consecutive dashboard snapshots
+
+Every run that changes a section appends a patch to data/deltas.json: per
+section, the rows inserted or updated and the natural keys of removed rows since
+the previous snapshot. Clients holding snapshot N apply the patches from N
+onwards; when N is older than the oldest patch kept they reload the full section
+files instead.
+"""
+
+import json
+import os
+from bot_data_output import clean_value, get_section_dir, write_atomic
+from result_store import section_records
+
+DELTA_FILE = 'deltas.json'
+
+# Natural keys identifying a row in each section. Sections not listed here (or
+# whose keys turn out not to be unique) are sent whole.
+SECTION_KEYS = {
+    'Total_PnL': ['user_id'],
+    'Daily_PnL': ['user_id', 'date'],
+    'Weekly_PnL': ['user_id', 'week'],
+    'Rolling_PnL': ['user_id'],
+    'Reserve_Balance': ['user_id'],
+    'In_Play_Balance': ['user_id'],
+    'Races_Entered': ['user_id'],
+    'Stable_Composition': ['user_id'],
+    'Horse_Inventory': ['user_id', 'horse_id'],
+    'Horse_Performance': ['user_id', 'user_horse_id', 'horse_name', 'gen', 'grade', 'gender', 'age', 'trainer_id'],
+    'Horse_Performance_By_Grade': ['user_id', 'user_horse_id', 'grade'],
+    'Horse_Traits_Performance': ['user_id', 'user_horse_id'],
+    'Horse_Skills_From_Races': ['user_id', 'user_horse_id'],
+    'Recent_Race_Performance': ['user_id', 'user_horse_id', 'snapshot_id'],
+    'All_Horses_Distance_Performance': ['user_id', 'user_horse_id', 'distance'],
+    'All_Horses_Surface_Performance': ['user_id', 'user_horse_id', 'surface', 'weather', 'condition'],
+    'All_Horses_Complete_Races': ['user_id', 'user_horse_id', 'event_id'],
+    'Horse_Distance_Analysis': ['user_id', 'horse_id'],
+    'Bot_Distance_Breakdown': ['user_id', 'distance'],
+    'Bot_Grade_Distribution': ['user_id', 'grade'],
+    'Bot_Track_Preferences': ['user_id', 'track_id'],
+}
+
+def get_delta_history():
+    """Get the number of patches to keep from environment variables"""
+    return max(int(os.getenv('DELTA_HISTORY', '24')), 1)
+
+def plain_records(records):
+    """Records as they read back from JSON, so old and new rows compare equal"""
+    cleaned = [{col: clean_value(value) for col, value in record.items()} for record in records]
+    return json.loads(json.dumps(cleaned, default=str))
+
+def section_delta(name, old_records, new_records):
+    """Upserts and removed keys turning old_records into new_records"""
+    if new_records is None:
+        return {'drop': True}
+    new_records = plain_records(new_records)
+    keys = SECTION_KEYS.get(name)
+    if old_records is None or not keys:
+        return {'replace': new_records}
+
+    old_records = plain_records(old_records)
+    old_rows = {tuple(r.get(k) for k in keys): r for r in old_records}
+    new_rows = {tuple(r.get(k) for k in keys): r for r in new_records}
+    if len(old_rows) != len(old_records) or len(new_rows) != len(new_records):
+        return {'replace': new_records}
+
+    patch = {
+        'keys': keys,
+        'upsert': [row for key, row in new_rows.items() if old_rows.get(key) != row],
+        'remove': [list(key) for key in old_rows if key not in new_rows],
+    }
+    # A patch touching most rows is no cheaper than the section itself
+    if len(json.dumps(patch, default=str)) >= len(json.dumps(new_records, default=str)):
+        return {'replace': new_records}
+    return patch
+
+def load_delta_log(directory):
+    """Read the existing delta log, or an empty one"""
+    try:
+        with open(os.path.join(directory, DELTA_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'patches': []}
+
+def update_delta_feed(manifest, changed, replaced, data, directory=None, history=None):
+    """Append the patch for this run to the delta log and trim it to the history limit"""
+    directory = directory or get_section_dir()
+    history = history or get_delta_history()
+    snapshot = manifest['snapshot']
+    log = load_delta_log(directory)
+    patches = log.get('patches', [])
+
+    # The first snapshot has nothing to patch against
+    if snapshot <= 1:
+        patches = []
+    elif changed:
+        sections = {
+            name: section_delta(name, replaced.get(name), section_records(data.get(name)))
+            for name in changed
+        }
+        patches.append({
+            'base': snapshot - 1,
+            'snapshot': snapshot,
+            'generated_at': manifest['generated_at'],
+            'sections': sections,
+        })
+
+    patches = patches[-history:]
+    log = {
+        'snapshot': snapshot,
+        'oldest_base': patches[0]['base'] if patches else snapshot,
+        'patches': patches,
+    }
+    write_atomic(os.path.join(directory, DELTA_FILE), json.dumps(log, separators=(',', ':'), default=str).encode('utf-8'))
+    return log
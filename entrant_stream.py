@@ -0,0 +1,103 @@
+"""
+Streaming, bounded-memory reads for the snapshot x entrant x event sections
+
+All_Horses_Distance_Performance, All_Horses_Surface_Performance and
+All_Horses_Complete_Races are built from one pass over the join, read through
+a server-side cursor in chunks. Each chunk is folded into running partial
+aggregates and a bounded buffer of complete races, so peak memory stays flat
+as the bot history grows.
+"""
+
+import os
+import time
+import pandas as pd
+from metric_registry import COMPLETE_RACES_PER_BOT, ENTRANT_STREAM, compile_metric
+from query_deadlines import query_deadline, section_timeout
+from query_metrics import approx_frame_bytes
+from incremental_refresh import (
+    ENTRANT_KEYS, DISTANCE_CATEGORIES, build_entrant_partials, frame_to_records,
+    merge_partials, derive_entrant_sections,
+)
+
+STREAM_SECTIONS = [
+    'All_Horses_Distance_Performance',
+    'All_Horses_Surface_Performance',
+    'All_Horses_Complete_Races',
+]
+
+COMPLETE_RACE_COLUMNS = [
+    'user_id', 'user_horse_id', 'horse_name', 'event_id', 'distance', 'distance_category',
+    'surface', 'surface_name', 'final_position', 'rating', 'track_name', 'race_date', 'Zone', 'snapshot_id',
+]
+
+# Same order as the All_Horses_Complete_Races query
+RACE_ORDER = ['user_id', 'race_date', 'snapshot_id']
+
+def get_stream_chunk_size():
+    """Get the number of rows fetched per chunk in streaming mode"""
+    return max(1000, int(os.getenv('STREAM_CHUNK_SIZE', '20000')))
+
+def get_complete_races_limit():
+    """Get the per-bot row cap for All_Horses_Complete_Races (0 keeps every race)"""
+    return max(0, int(os.getenv('COMPLETE_RACES_LIMIT', str(COMPLETE_RACES_PER_BOT))))
+
+def keep_complete_races(kept, chunk, limit):
+    """Fold a chunk into the complete-races buffer, keeping each bot's latest races"""
+    races = chunk.rename(columns={'name': 'horse_name', 'created_ts': 'race_date'})
+    if kept is not None:
+        races = pd.concat([kept, races], ignore_index=True)
+    if limit:
+        races = races.sort_values(RACE_ORDER, ascending=[True, False, False]).groupby('user_id').head(limit)
+    return races
+
+def finish_complete_races(races):
+    """Add the label columns and sort like the original query"""
+    if races is None or races.empty:
+        return []
+    races = races.sort_values(RACE_ORDER, ascending=[True, False, False])
+    races['distance_category'] = races['distance'].map(DISTANCE_CATEGORIES)
+    races['surface_name'] = races['surface'].map(lambda s: 'Dirt' if s == 1 else 'Turf')
+    return frame_to_records(races[COMPLETE_RACE_COLUMNS])
+
+def stream_entrant_sections(engine, params, chunksize=None, complete_races_limit=None, metrics=None):
+    """Build the three race sections from one streamed pass over the join, within the Entrant_Stream deadline"""
+    chunksize = chunksize or get_stream_chunk_size()
+    if complete_races_limit is None:
+        complete_races_limit = get_complete_races_limit()
+
+    partials = None
+    races = None
+    rows = 0
+    query = compile_metric('Entrant_Stream', ENTRANT_STREAM)
+
+    # stream_results makes PyMySQL use an unbuffered server-side cursor; the deadline covers the whole pass
+    start = time.perf_counter()
+    first_row = None
+    approx_bytes = 0
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn, \
+            query_deadline(conn, section_timeout('Entrant_Stream')):
+        for chunk in pd.read_sql(query, conn, params=params, chunksize=chunksize):
+            if first_row is None:
+                first_row = time.perf_counter() - start
+            partials = merge_partials(
+                partials, build_entrant_partials(chunk), ENTRANT_KEYS,
+                min_columns=['best_position'], max_columns=['worst_position'],
+            )
+            races = keep_complete_races(races, chunk, complete_races_limit)
+            rows += len(chunk)
+            approx_bytes += approx_frame_bytes(chunk)
+    wall = time.perf_counter() - start
+
+    print(f"SUCCESS Entrant_Stream: {rows} rows streamed in {wall:.2f}s")
+    if metrics is not None:
+        metrics.append({
+            'section': 'Entrant_Stream',
+            'wall_seconds': round(wall, 4),
+            'first_row_seconds': round(first_row if first_row is not None else wall, 4),
+            'rows': rows,
+            'approx_bytes': approx_bytes,
+        })
+
+    data = derive_entrant_sections(partials)
+    data['All_Horses_Complete_Races'] = finish_complete_races(races)
+    return data
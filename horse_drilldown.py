@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Batch horse drill-down
+
+Profiles any number of horses (by user_horse_id) or whole bots (by user_id).
+Every snapshot x entrant x event row they raced is read with one query per
+bounded id batch, and the distance, surface and track breakdowns for all
+horses come from one named-aggregation pass each. Fetched rows are cached per
+horse and per bot in DRILLDOWN_CACHE_DIR for DRILLDOWN_CACHE_TTL seconds, so
+profiling the same horses again does not touch the database.
+
+    python horse_drilldown.py --horse 274848022531,274848022532
+    python horse_drilldown.py --bot 10111491 --mirror --output drilldown.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+import pandas as pd
+from sqlalchemy import bindparam, text
+from bot_data_output import write_atomic
+from db_routing import create_router, dispose_router, engine_for
+from incremental_refresh import DISTANCE_NAMES, SURFACE_NAMES, frame_to_records
+from metric_registry import ENTRANT_STREAM, render_sql
+from user_batches import split_user_ids
+
+# Column each kind of id filters on
+DRILLDOWN_FILTERS = {
+    'horse': 'hs.user_horse_id',
+    'bot': 'hs.user_id',
+}
+
+# Breakdown name -> grouping columns besides the horse
+BREAKDOWNS = {
+    'distance': ['distance'],
+    'surface': ['surface'],
+    'track': ['track_name'],
+}
+
+HORSE_KEYS = ['user_id', 'user_horse_id']
+AGGREGATE_COLUMNS = [
+    'races', 'avg_position', 'best_position', 'worst_position', 'wins', 'top_3_finishes', 'avg_rating',
+]
+
+def get_cache_dir():
+    """Get the drill-down cache directory from environment variables"""
+    return os.getenv('DRILLDOWN_CACHE_DIR', 'drilldown_cache')
+
+def get_cache_ttl():
+    """Get how long cached race rows stay fresh, in seconds"""
+    return float(os.getenv('DRILLDOWN_CACHE_TTL', '3600'))
+
+def build_drilldown_query(kind):
+    """Race rows for a batch of horse or bot ids (same columns as the entrant stream)"""
+    spec = dict(ENTRANT_STREAM, user_column=None, filters=[f"{DRILLDOWN_FILTERS[kind]} IN :ids"])
+    return text(render_sql(spec)).bindparams(bindparam('ids', expanding=True))
+
+def cache_path(cache_dir, kind, entity_id):
+    """Cache file for one horse or bot"""
+    return os.path.join(cache_dir, f"{kind}_{entity_id}.json.gz")
+
+def load_cached(cache_dir, kind, ids, ttl):
+    """Cached race rows for the ids still fresh, and the ids that need a query"""
+    frames = []
+    missing = []
+    now = time.time()
+    for entity_id in ids:
+        path = cache_path(cache_dir, kind, entity_id)
+        if os.path.exists(path) and now - os.path.getmtime(path) < ttl:
+            with gzip.open(path, 'rt') as f:
+                frames.append(pd.DataFrame(json.load(f)))
+        else:
+            missing.append(entity_id)
+    return frames, missing
+
+def save_cached(cache_dir, kind, ids, rows):
+    """Cache each id's race rows (an empty list for ids that have none)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    column = DRILLDOWN_FILTERS[kind].split('.', 1)[1]
+    groups = {entity_id: group for entity_id, group in rows.groupby(column)} if not rows.empty else {}
+    for entity_id in ids:
+        group = groups.get(entity_id)
+        records = frame_to_records(group) if group is not None else []
+        blob = json.dumps(records, default=str).encode('utf-8')
+        write_atomic(cache_path(cache_dir, kind, entity_id), gzip.compress(blob, mtime=0))
+
+def fetch_race_rows(engine, horse_ids=(), bot_ids=(), cache_dir=None, ttl=None, refresh=False):
+    """All race rows for the requested horses and bots, from the cache where fresh"""
+    cache_dir = cache_dir or get_cache_dir()
+    ttl = get_cache_ttl() if ttl is None else ttl
+    frames = []
+    for kind, ids in (('horse', horse_ids), ('bot', bot_ids)):
+        ids = sorted(set(ids))
+        if not ids:
+            continue
+        cached, missing = load_cached(cache_dir, kind, ids, 0 if refresh else ttl)
+        frames.extend(cached)
+        if cached:
+            print(f"Using cached rows for {len(ids) - len(missing)} of {len(ids)} {kind} ids")
+        if not missing:
+            continue
+        query = build_drilldown_query(kind)
+        for batch in split_user_ids(missing):
+            rows = pd.read_sql(query, engine, params={'ids': batch})
+            save_cached(cache_dir, kind, batch, rows)
+            frames.append(rows)
+    columns = [(column['alias'] or column['expr'].split('.')[-1]).strip('`') for column in ENTRANT_STREAM['columns']]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+
+    # A horse asked for directly and through its bot is only counted once
+    rows = pd.concat(frames, ignore_index=True).drop_duplicates(['user_horse_id', 'event_id', 'Zone'])
+    for column in ['final_position', 'rating']:
+        rows[column] = pd.to_numeric(rows[column], errors='coerce')
+    return rows
+
+def horse_aggregates(rows, dims):
+    """One named-aggregation pass over every horse's rows, grouped by dims"""
+    frame = rows.assign(
+        win=(rows['final_position'] == 1).astype(int),
+        top_3=(rows['final_position'] <= 3).astype(int),
+    )
+    return frame.groupby(HORSE_KEYS + dims, dropna=False, sort=True).agg(
+        horse_name=('name', 'last'),
+        races=('event_id', 'nunique'),
+        avg_position=('final_position', 'mean'),
+        best_position=('final_position', 'min'),
+        worst_position=('final_position', 'max'),
+        wins=('win', 'sum'),
+        top_3_finishes=('top_3', 'sum'),
+        avg_rating=('rating', 'mean'),
+    ).reset_index()[HORSE_KEYS + ['horse_name'] + dims + AGGREGATE_COLUMNS]
+
+def drilldown(rows):
+    """Summary plus distance, surface and track breakdowns for every horse in rows"""
+    results = {'summary': horse_aggregates(rows, [])}
+    for name, dims in BREAKDOWNS.items():
+        results[name] = horse_aggregates(rows, dims)
+    results['distance'].insert(4, 'distance_name', results['distance']['distance'].map(DISTANCE_NAMES).fillna('Unknown'))
+    results['surface'].insert(4, 'surface_name', results['surface']['surface'].map(SURFACE_NAMES).fillna('Unknown'))
+    results['summary'] = results['summary'].sort_values(['user_id', 'races'], ascending=[True, False])
+    return results
+
+def format_drilldown(results, summary_only=False):
+    """Console report: per-horse summary, then each breakdown as one table"""
+    sections = ['summary'] if summary_only else ['summary'] + list(BREAKDOWNS)
+    lines = []
+    for name in sections:
+        lines += ["=" * 80, f"{name.upper()} ({results['summary'].shape[0]} horses)", "=" * 80]
+        lines.append(results[name].to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+        lines.append("")
+    return "\n".join(lines)
+
+def parse_ids(values):
+    """Ids from repeated and/or comma-separated arguments"""
+    return [int(x) for value in values or [] for x in value.replace(',', ' ').split()]
+
+def main(argv=None):
+    """Profile horses or bots from the command line"""
+    parser = argparse.ArgumentParser(description="Distance/surface/track drill-down for many horses at once")
+    parser.add_argument('--horse', action='append', help="user_horse_id(s), comma separated or repeated")
+    parser.add_argument('--horse-file', default=None, help="File of user_horse_ids (one per line or comma separated)")
+    parser.add_argument('--bot', action='append', help="Bot user_id(s): profile every horse they raced")
+    parser.add_argument('--all-bots', action='store_true', help="Profile every horse of BOT_USER_IDS")
+    parser.add_argument('--mirror', action='store_true', help="Read from the local mirror instead of the live database")
+    parser.add_argument('--refresh', action='store_true', help="Ignore cached rows and query again")
+    parser.add_argument('--summary-only', action='store_true', help="Only print the per-horse summary")
+    parser.add_argument('--output', default=None, help="Write every breakdown as JSON records to this file")
+    args = parser.parse_args(argv)
+
+    # Imported here so the updater's .env handling only runs for the CLI
+    from manual_report_updater import get_bot_user_ids, get_database_config, read_id_file
+    horse_ids = parse_ids(args.horse) + (read_id_file(args.horse_file) if args.horse_file else [])
+    bot_ids = parse_ids(args.bot) + (get_bot_user_ids() if args.all_bots else [])
+    if not horse_ids and not bot_ids:
+        parser.error("pass --horse, --horse-file, --bot or --all-bots")
+
+    if args.mirror:
+        from local_mirror import create_mirror_engine
+        router = create_router(create_mirror_engine(), replica_urls=[])
+    else:
+        from sqlalchemy import create_engine
+        router = create_router(create_engine(get_database_config(), pool_pre_ping=True))
+    engine = engine_for(router, 'Horse_Drilldown')
+
+    start = time.perf_counter()
+    # Mirror and live rows are cached apart
+    cache_dir = os.path.join(get_cache_dir(), 'mirror' if args.mirror else 'live')
+    rows = fetch_race_rows(engine, horse_ids, bot_ids, cache_dir=cache_dir, refresh=args.refresh)
+    results = drilldown(rows)
+    print(format_drilldown(results, args.summary_only))
+    print(f"Profiled {results['summary'].shape[0]} horses from {len(rows):,} race rows "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({name: frame_to_records(df) for name, df in results.items()}, f, indent=2, default=str)
+        print(f"Wrote {args.output}")
+    dispose_router(router)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Shared scan of full_WC_horse_snapshot for the horse-level sections
+
+Reads the needed snapshot columns for the bot accounts once and computes
+Races_Entered, Horse_Performance, Horse_Performance_By_Grade,
+Horse_Traits_Performance, Horse_Skills_From_Races and Horse_Distance_Analysis
+locally, instead of scanning the table once per section.
+"""
+
+from metric_registry import SNAPSHOT_SCAN, compile_metric
+from query_deadlines import section_timeout
+from query_metrics import timed_read_sql
+from incremental_refresh import build_horse_partials, derive_horse_sections
+
+SNAPSHOT_SCAN_SECTIONS = [
+    'Races_Entered',
+    'Horse_Performance',
+    'Horse_Performance_By_Grade',
+    'Horse_Traits_Performance',
+    'Horse_Skills_From_Races',
+    'Horse_Distance_Analysis',
+]
+
+def fetch_snapshot_frame(engine, params):
+    """Read the bot snapshot rows once"""
+    query = compile_metric('Snapshot_Scan', SNAPSHOT_SCAN)
+    snapshots, _ = timed_read_sql(query, engine, params, section_timeout('Snapshot_Scan'))
+    print(f"SUCCESS Snapshot_Scan: {len(snapshots)} rows")
+    return snapshots
+
+def compute_snapshot_sections(snapshots, horse_inventory):
+    """Build every snapshot-based horse section from one scan"""
+    if snapshots is None or snapshots.empty:
+        return {key: [] for key in SNAPSHOT_SCAN_SECTIONS}
+    return derive_horse_sections(build_horse_partials(snapshots), horse_inventory)
@@ -0,0 +1,679 @@
+"""
+Incremental refresh for the bot performance updater
+
+Keeps high-water marks and partial aggregates (sums, counts, win/top-3 tallies)
+between runs, so the PnL and horse-level sections only read the rows added
+since the previous refresh instead of the whole history.
+
+Snapshot and event ids are only unique per Zone, so every zone has its own
+cursor. Each run re-reads a short overlap below the watermark (rows committed
+out of order, transactions written later in the same second) and skips the
+rows already folded, by natural key. Snapshot and entrant rows are counted
+(races, ratings, stats) when first read, like the full queries count them.
+Their result columns (positions, wins, top-3 finishes) are folded only once
+the race has settled (final_position is set). Until then the rows are
+remembered and read again by id.
+"""
+
+import copy
+import os
+import json
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam
+from pnl_rollup import PNL_SECTIONS, derive_pnl_sections
+from query_deadlines import section_timeout
+from query_metrics import timed_read_sql
+
+# Sections produced from the stored partial aggregates instead of full queries
+INCREMENTAL_SECTIONS = [
+    'Total_PnL',
+    'Daily_PnL',
+    'Weekly_PnL',
+    'Rolling_PnL',
+    'Races_Entered',
+    'Horse_Performance',
+    'Horse_Performance_By_Grade',
+    'Horse_Traits_Performance',
+    'Horse_Skills_From_Races',
+    'All_Horses_Distance_Performance',
+    'All_Horses_Surface_Performance',
+    'Horse_Distance_Analysis',
+]
+
+# Finest snapshot grain needed by any horse-level section
+HORSE_KEYS = ['user_id', 'user_horse_id', 'name', 'generation', 'grade', 'gender', 'age', 'trainer_id']
+
+# Snapshot columns that are averaged somewhere (kept as sum + non-null count)
+HORSE_AVG_COLUMNS = [
+    'final_position', 'rating', 'speed', 'stamina', 'acceleration',
+    'speed_trait_1_pwr', 'speed_trait_2_pwr',
+    'stamina_trait_1_pwr', 'stamina_trait_2_pwr',
+    'acceleration_trait_1_pwr', 'acceleration_trait_2_pwr',
+    'skill_first_out', 'skill_front', 'skill_rail', 'skill_closing', 'skill_dueling',
+    'skill_turning', 'skill_working', 'skill_breezing', 'skill_drafting',
+    'skill_final_kick', 'skill_overtaking',
+]
+HORSE_SUM_COLUMNS = ['career_earnings']
+HORSE_MAX_COLUMNS = [
+    'speed_trait_1', 'speed_trait_2',
+    'stamina_trait_1', 'stamina_trait_2',
+    'acceleration_trait_1', 'acceleration_trait_2',
+]
+
+# Finest entrant x event grain needed by the distance and surface sections
+ENTRANT_KEYS = ['user_id', 'user_horse_id', 'name', 'distance', 'surface', 'weather', 'condition']
+
+PNL_KEYS = ['user_id', 'date']
+
+# How each delta is read back: the zone and watermark columns (as selected and in SQL),
+# the natural key of a row, the column that stays NULL until the row has settled and the
+# partial columns that depend on it (folded only once the row has settled)
+DELTA_CURSORS = {
+    'pnl': {'zone': None, 'key': 'created_at', 'sql_key': 'created_at',
+            'ids': ['_id'], 'settled': None, 'result_columns': []},
+    'horse': {'zone': 'Zone', 'sql_zone': 'Zone', 'key': '_id', 'sql_key': '_id',
+              'ids': ['_id'], 'settled': 'final_position',
+              'result_columns': ['wins', 'top_3', 'final_position_sum', 'final_position_cnt']},
+    'entrant': {'zone': 'Zone', 'sql_zone': 'ent.Zone', 'key': 'event_id', 'sql_key': 'ent.event_id',
+                'ids': ['event_id', 'horse_snapshot_id'], 'settled': 'final_position',
+                'result_columns': ['wins', 'top_3', 'final_position_sum', 'final_position_cnt',
+                                   'best_position', 'worst_position']},
+}
+
+# Sections served from each delta's partials, marked stale when that delta fails
+DELTA_SECTIONS = {
+    'pnl': PNL_SECTIONS,
+    'horse': [
+        'Races_Entered', 'Horse_Performance', 'Horse_Performance_By_Grade',
+        'Horse_Traits_Performance', 'Horse_Skills_From_Races', 'Horse_Distance_Analysis',
+    ],
+    'entrant': ['All_Horses_Distance_Performance', 'All_Horses_Surface_Performance'],
+}
+
+# Name of each delta read in QUERY_TIMEOUTS and the query metrics
+DELTA_QUERY_NAMES = {'pnl': 'PnL_Delta', 'horse': 'Horse_Delta', 'entrant': 'Entrant_Delta'}
+
+# Bumped whenever the stored partials change shape
+STATE_VERSION = 4
+
+GRADE_NAMES = {1: 'Starter', 2: 'Regular', 3: 'Pro'}
+DISTANCE_NAMES = {
+    1: '1000m (5f)', 2: '1200m (6f)', 3: '1400m (7f)',
+    4: '1600m (8f)', 5: '1800m (9f)', 6: '2000m (10f)',
+}
+DISTANCE_CATEGORIES = {1: 'Sprint', 2: 'Sprint', 3: 'Mile', 4: 'Mile', 5: 'Mile', 6: 'Marathon'}
+SURFACE_NAMES = {1: 'Dirt', 2: 'Turf'}
+
+def get_state_file():
+    """Get the incremental state file path from environment variables"""
+    return os.getenv('UPDATER_STATE_FILE', 'updater_state.json')
+
+def get_overlap_ids():
+    """Snapshot/event ids re-read below each zone's watermark to catch rows committed out of order"""
+    return max(int(os.getenv('INCREMENTAL_OVERLAP_IDS', '1000')), 0)
+
+def get_overlap_seconds():
+    """Seconds of transactions re-read below the watermark (created_at has second resolution)"""
+    return max(int(os.getenv('INCREMENTAL_OVERLAP_SECONDS', '300')), 0)
+
+def get_pending_ids():
+    """How far (in ids) behind the watermark an unsettled row is still waited for"""
+    return max(int(os.getenv('INCREMENTAL_PENDING_IDS', '200000')), 0)
+
+def delta_overlap(key):
+    """Re-read overlap of one delta, in units of its watermark column"""
+    return get_overlap_seconds() if key == 'pnl' else get_overlap_ids()
+
+def empty_state(TARGET_USER_IDS, window_start):
+    """Create a state with no cursors and no partial aggregates"""
+    return {
+        'version': STATE_VERSION,
+        'target_user_ids': TARGET_USER_IDS,
+        'window_start': window_start,
+        'cursors': {key: {} for key in DELTA_CURSORS},
+        'pnl_partials': None,
+        'horse_partials': None,
+        'entrant_partials': None,
+    }
+
+def load_state(TARGET_USER_IDS, window_start, state_file=None):
+    """Load stored watermarks and partials, starting over if the bot set or window changed"""
+    state_file = state_file or get_state_file()
+    if not os.path.exists(state_file):
+        return empty_state(TARGET_USER_IDS, window_start)
+
+    with open(state_file) as f:
+        state = json.load(f)
+
+    if state.get('version') != STATE_VERSION:
+        print("Incremental state format changed - rebuilding incremental state")
+        return empty_state(TARGET_USER_IDS, window_start)
+
+    if state.get('target_user_ids') != TARGET_USER_IDS or state.get('window_start') != window_start:
+        print("Bot set or PnL window changed - rebuilding incremental state")
+        return empty_state(TARGET_USER_IDS, window_start)
+
+    return state
+
+def save_state(state, state_file=None):
+    """Write the state atomically so an interrupted run never leaves it half-written"""
+    state_file = state_file or get_state_file()
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, default=str)
+    os.replace(tmp_file, state_file)
+
+def frame_to_records(df):
+    """Convert a DataFrame to records with NaN turned into None"""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def frame_to_state(df):
+    """Serialize partials for the state file, keeping the columns even when empty"""
+    return {
+        'columns': list(df.columns),
+        'data': df.astype(object).where(df.notna(), None).values.tolist(),
+    }
+
+def frame_from_state(stored):
+    """Rebuild partials stored by frame_to_state"""
+    if not stored:
+        return None
+    return pd.DataFrame(stored['data'], columns=stored['columns'])
+
+def normalize_partials(df, keys, text_columns=()):
+    """Convert aggregate columns (often Decimal from MySQL) to floats"""
+    df = df.copy()
+    for col in df.columns:
+        if col not in keys and col not in text_columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+    return df
+
+def merge_partials(stored, delta, keys, min_columns=(), max_columns=()):
+    """Fold a delta of partial aggregates into the stored partials"""
+    if stored is None or stored.empty:
+        return delta.reset_index(drop=True)
+    if delta.empty:
+        return stored
+
+    combined = pd.concat([stored, delta], ignore_index=True)
+    agg = {}
+    for col in combined.columns:
+        if col in keys:
+            continue
+        if col in min_columns:
+            agg[col] = 'min'
+        elif col in max_columns:
+            agg[col] = 'max'
+        else:
+            agg[col] = 'sum'
+    return combined.groupby(keys, dropna=False, sort=False).agg(agg).reset_index()
+
+def build_horse_partials(snapshots):
+    """Reduce raw snapshot rows to the partial aggregates used by the horse sections"""
+    position = pd.to_numeric(snapshots['final_position'])
+    frame = snapshots.assign(
+        races=1,
+        wins=(position == 1).astype(int),
+        top_3=(position <= 3).astype(int),
+    )
+
+    agg = {
+        'races': ('races', 'sum'),
+        'wins': ('wins', 'sum'),
+        'top_3': ('top_3', 'sum'),
+    }
+    for col in HORSE_AVG_COLUMNS:
+        agg[f'{col}_sum'] = (col, 'sum')
+        agg[f'{col}_cnt'] = (col, 'count')
+    for col in HORSE_SUM_COLUMNS:
+        agg[f'{col}_sum'] = (col, 'sum')
+    for col in HORSE_MAX_COLUMNS:
+        agg[col] = (col, 'max')
+
+    partials = frame.groupby(HORSE_KEYS, dropna=False, sort=False).agg(**agg).reset_index()
+    return normalize_partials(partials, HORSE_KEYS, HORSE_MAX_COLUMNS)
+
+def build_entrant_partials(chunk):
+    """Reduce raw race rows to partial aggregates at the entrant grain"""
+    position = pd.to_numeric(chunk['final_position'])
+    frame = chunk.assign(
+        final_position=position,
+        rating=pd.to_numeric(chunk['rating']),
+        wins=(position == 1).astype(int),
+        top_3=(position <= 3).astype(int),
+    )
+    partials = frame.groupby(ENTRANT_KEYS, dropna=False, sort=False).agg(
+        races=('event_id', 'nunique'),
+        final_position_sum=('final_position', 'sum'),
+        final_position_cnt=('final_position', 'count'),
+        best_position=('final_position', 'min'),
+        worst_position=('final_position', 'max'),
+        wins=('wins', 'sum'),
+        top_3=('top_3', 'sum'),
+        rating_sum=('rating', 'sum'),
+        rating_cnt=('rating', 'count'),
+    ).reset_index()
+    return normalize_partials(partials, ENTRANT_KEYS)
+
+def build_pnl_partials(transactions):
+    """Reduce raw transactions to (user_id, date, amount_sum) partials"""
+    frame = transactions.assign(amount=pd.to_numeric(transactions['amount']).astype(float))
+    partials = frame.groupby(PNL_KEYS, sort=False).agg(amount_sum=('amount', 'sum')).reset_index()
+    partials['date'] = partials['date'].astype(str)
+    return normalize_partials(partials, PNL_KEYS)
+
+def empty_cursor():
+    """A zone cursor before any row was read"""
+    return {'watermark': 0, 'seen': [], 'pending': []}
+
+def cursor_filter(key, cursors):
+    """SQL condition (with its bound values) reading each known zone past its watermark minus
+    the overlap plus its pending rows, and every row of a zone not seen before"""
+    spec = DELTA_CURSORS[key]
+    overlap = delta_overlap(key)
+    if spec['zone'] is None:
+        cursor = cursors.get('', empty_cursor())
+        return f"{spec['sql_key']} > :{key}_since", {f'{key}_since': int(cursor['watermark']) - overlap}
+
+    clauses, values = [], {}
+    for i, zone in enumerate(sorted(cursors)):
+        cursor = cursors[zone]
+        clauses.append(
+            f"({spec['sql_zone']} = :{key}_zone_{i} AND "
+            f"({spec['sql_key']} > :{key}_since_{i} OR {spec['sql_key']} IN :{key}_pending_{i}))"
+        )
+        values[f'{key}_zone_{i}'] = zone
+        values[f'{key}_since_{i}'] = int(cursor['watermark']) - overlap
+        values[f'{key}_pending_{i}'] = sorted({int(item[0]) for item in cursor['pending']})
+    if not clauses:
+        return "1 = 1", values
+    clauses.append(f"{spec['sql_zone']} NOT IN :{key}_zones")
+    values[f'{key}_zones'] = sorted(cursors)
+    return "(" + " OR ".join(clauses) + ")", values
+
+def build_delta_queries(cursors):
+    """Build the row-level statements reading past each cursor, with their bound values"""
+    horse_columns = list(dict.fromkeys(HORSE_KEYS + HORSE_AVG_COLUMNS + HORSE_SUM_COLUMNS + HORSE_MAX_COLUMNS))
+    filters = {key: cursor_filter(key, cursors[key]) for key in DELTA_CURSORS}
+
+    queries = {
+        'pnl': f"""
+            SELECT
+                _id,
+                user_id,
+                DATE(FROM_UNIXTIME(created_at)) AS date,
+                amount,
+                created_at
+            FROM player_token_transaction
+            WHERE ctx_type = 1
+                AND user_id IN :user_ids
+                AND {filters['pnl'][0]}
+                AND created_at >= UNIX_TIMESTAMP(:window_start)
+        """,
+        'horse': f"""
+            SELECT
+                Zone,
+                _id,
+                {', '.join(horse_columns)}
+            FROM full_WC_horse_snapshot
+            WHERE user_id IN :user_ids
+                AND {filters['horse'][0]}
+        """,
+        'entrant': f"""
+            SELECT
+                ent.Zone,
+                ent.event_id,
+                ent.horse_snapshot_id,
+                hs.user_id,
+                hs.user_horse_id,
+                hs.name,
+                e.distance,
+                e.surface,
+                e.weather,
+                e.`condition`,
+                hs.final_position,
+                hs.rating
+            FROM full_WC_horse_snapshot hs
+            INNER JOIN full_WC_entrant ent ON hs._id = ent.horse_snapshot_id
+                AND hs.Zone = ent.Zone
+            INNER JOIN full_WC_event e ON ent.event_id = e._id
+                AND ent.Zone = e.Zone
+            WHERE hs.user_id IN :user_ids
+                AND {filters['entrant'][0]}
+        """,
+    }
+
+    statements = {}
+    for key, query in queries.items():
+        values = filters[key][1]
+        expanding = ['user_ids'] + [name for name, value in values.items() if isinstance(value, list)]
+        statement = text(query).bindparams(*[bindparam(name, expanding=True) for name in expanding])
+        statements[key] = (statement, values)
+    return statements
+
+def take_new_rows(key, cursors, rows):
+    """Split the rows read into ones read for the first time and pending ones that have now
+    settled, advancing each zone's cursor past what was read"""
+    spec = DELTA_CURSORS[key]
+    overlap = delta_overlap(key)
+    zone_rows = dict(iter(rows.groupby(spec['zone'], sort=False))) if spec['zone'] else {'': rows}
+    columns = [spec['key']] + spec['ids']
+
+    first, settled = [], []
+    for zone in set(cursors) | {str(zone) for zone in zone_rows}:
+        cursor = cursors.setdefault(zone, empty_cursor())
+        read = zone_rows.get(zone, rows.iloc[0:0])
+        since = int(cursor['watermark']) - overlap
+        seen = {tuple(item[1:]) for item in cursor['seen']}
+        pending = {tuple(item[1:]) for item in cursor['pending']}
+        idents = list(zip(*(read[col].astype('int64').tolist() for col in spec['ids'])))
+        # Below the overlap only the pending rows themselves count, not their neighbours on the same id
+        keys = read[spec['key']].astype('int64').tolist()
+        new = [ident not in seen and (key > since or ident in pending) for key, ident in zip(keys, idents)]
+        again = [ident in pending for ident in idents]
+        if spec['settled']:
+            waiting = read[spec['settled']].isna().tolist()
+        else:
+            waiting = [False] * len(read)
+
+        first.append(read[[is_new and not is_again for is_new, is_again in zip(new, again)]])
+        settled.append(read[[is_new and is_again and not is_waiting
+                             for is_new, is_again, is_waiting in zip(new, again, waiting)]])
+        done = read[[is_new and not is_waiting for is_new, is_waiting in zip(new, waiting)]]
+        unsettled = read[[is_new and is_waiting for is_new, is_waiting in zip(new, waiting)]]
+
+        if len(read):
+            cursor['watermark'] = max(int(cursor['watermark']), int(read[spec['key']].max()))
+        floor = int(cursor['watermark']) - overlap
+        cursor['seen'] = [item for item in cursor['seen'] if item[0] > floor] + [
+            list(item) for item in zip(*(done[col].astype('int64').tolist() for col in columns))
+            if item[0] > floor
+        ]
+        # Unsettled rows are already counted; their results are folded once they settle. Rows
+        # inside the overlap are never given up, or a re-read would count them again.
+        pending_floor = int(cursor['watermark']) - max(get_pending_ids(), overlap)
+        unsettled = [list(item) for item in zip(*(unsettled[col].astype('int64').tolist() for col in columns))]
+        cursor['pending'] = [item for item in unsettled if item[0] > pending_floor]
+        given_up = len(unsettled) - len(cursor['pending'])
+        if given_up:
+            cursor['given_up'] = cursor.get('given_up', 0) + given_up
+            print(f"Incremental {key} {zone}: gave up waiting for {given_up} unsettled rows "
+                  f"({cursor['given_up']} so far); a later result for them needs --rebuild")
+
+    def combine(frames):
+        return pd.concat(frames, ignore_index=True) if frames else rows.iloc[0:0]
+    return combine(first), combine(settled)
+
+def result_partials(partials, key, keys, keep=()):
+    """Only the result columns of partials built from rows that were counted before they settled"""
+    for col in partials.columns:
+        if col not in keys and col not in keep and col not in DELTA_CURSORS[key]['result_columns']:
+            partials[col] = 0.0
+    return partials
+
+def apply_pnl_delta(state, rows):
+    """Fold transactions not seen yet into the daily PnL sums"""
+    cursors = copy.deepcopy(state['cursors']['pnl'])
+    rows, _ = take_new_rows('pnl', cursors, rows)
+    if not rows.empty:
+        stored = frame_from_state(state['pnl_partials'])
+        state['pnl_partials'] = frame_to_state(merge_partials(stored, build_pnl_partials(rows), PNL_KEYS))
+    state['cursors']['pnl'] = cursors
+    return len(rows)
+
+def apply_horse_delta(state, rows):
+    """Count snapshots not seen yet and fold in the results of snapshots that have now settled"""
+    cursors = copy.deepcopy(state['cursors']['horse'])
+    first, settled = take_new_rows('horse', cursors, rows)
+    delta = [build_horse_partials(first)] if not first.empty else []
+    if not settled.empty:
+        delta.append(result_partials(build_horse_partials(settled), 'horse', HORSE_KEYS, keep=HORSE_MAX_COLUMNS))
+    if delta:
+        stored = frame_from_state(state['horse_partials'])
+        merged = merge_partials(stored, pd.concat(delta, ignore_index=True), HORSE_KEYS, max_columns=HORSE_MAX_COLUMNS)
+        state['horse_partials'] = frame_to_state(merged)
+    state['cursors']['horse'] = cursors
+    return len(first) + len(settled)
+
+def apply_entrant_delta(state, rows):
+    """Count race entries not seen yet and fold in the results of entries that have now settled"""
+    cursors = copy.deepcopy(state['cursors']['entrant'])
+    first, settled = take_new_rows('entrant', cursors, rows)
+    delta = [build_entrant_partials(first)] if not first.empty else []
+    if not settled.empty:
+        delta.append(result_partials(build_entrant_partials(settled), 'entrant', ENTRANT_KEYS))
+    if delta:
+        stored = frame_from_state(state['entrant_partials'])
+        merged = merge_partials(stored, pd.concat(delta, ignore_index=True), ENTRANT_KEYS,
+                                min_columns=['best_position'], max_columns=['worst_position'])
+        state['entrant_partials'] = frame_to_state(merged)
+    state['cursors']['entrant'] = cursors
+    return len(first) + len(settled)
+
+def rollup(df, keys):
+    """Roll partials up to a coarser grouping"""
+    agg = {}
+    for col in df.columns:
+        if col in keys:
+            continue
+        if col == 'best_position':
+            agg[col] = 'min'
+        elif col == 'worst_position' or col in HORSE_MAX_COLUMNS:
+            agg[col] = 'max'
+        else:
+            agg[col] = 'sum'
+    return df.groupby(keys, dropna=False, sort=False).agg(agg).reset_index()
+
+def mean_of(df, col):
+    """Average from stored sum and non-null count (NULL when there is nothing to average)"""
+    return df[f'{col}_sum'] / df[f'{col}_cnt'].replace(0, np.nan)
+
+def infer_specialization(df):
+    """Same stat thresholds as the Horse_Distance_Analysis CASE expression"""
+    conditions = [
+        (df['avg_stamina'] > 85) & (df['avg_speed'] > 80) & (df['avg_acceleration'] < 75),
+        (df['avg_stamina'] < 75) & (df['avg_acceleration'] > 75),
+        (df['avg_stamina'] > 80) & (df['avg_speed'] < 75),
+    ]
+    return np.select(conditions, ['Mile/Marathon', 'Sprint', 'Marathon'], default='Mile')
+
+def horse_identity_index(horse_inventory):
+    """player_horse rows keyed the way snapshots name a horse (player_horse._id = user_horse_id)"""
+    # Records or the typed frame of the result store
+    index = pd.DataFrame(horse_inventory if horse_inventory is not None else [], columns=['user_id', 'horse_id', 'horse_name', 'grade'])
+    index['user_horse_id'] = index['horse_id']
+    return index
+
+def derive_horse_sections(partials, horse_inventory):
+    """Build every snapshot-based horse section from the partial aggregates"""
+    sections = [
+        'Races_Entered', 'Horse_Performance', 'Horse_Performance_By_Grade',
+        'Horse_Traits_Performance', 'Horse_Skills_From_Races', 'Horse_Distance_Analysis',
+    ]
+    if partials is None or partials.empty:
+        return {key: [] for key in sections}
+
+    out = {}
+
+    races = partials.groupby('user_id', as_index=False)['races'].sum().sort_values('user_id')
+    races['races_entered'] = races['races'].astype(int)
+    out['Races_Entered'] = frame_to_records(races[['user_id', 'races_entered']])
+
+    # Horse_Performance uses the full grain, real horses only
+    perf = partials[partials['user_horse_id'] > 0].copy()
+    perf = perf.rename(columns={'name': 'horse_name', 'generation': 'gen'})
+    perf['total_races'] = perf['races'].astype(int)
+    perf['avg_finish_position'] = mean_of(perf, 'final_position')
+    perf['wins'] = perf['wins'].astype(int)
+    perf['top_3_finishes'] = perf['top_3'].astype(int)
+    for col in ['rating', 'speed', 'stamina', 'acceleration']:
+        perf[f'avg_{col}'] = mean_of(perf, col)
+    perf['total_career_earnings_IGGT'] = perf['career_earnings_sum'] / 1000000
+    perf = perf.sort_values(['user_id', 'total_races'], ascending=[True, False])
+    out['Horse_Performance'] = frame_to_records(perf[[
+        'user_id', 'user_horse_id', 'horse_name', 'gen', 'grade', 'gender', 'age', 'trainer_id',
+        'total_races', 'avg_finish_position', 'wins', 'top_3_finishes', 'avg_rating',
+        'avg_speed', 'avg_stamina', 'avg_acceleration', 'total_career_earnings_IGGT',
+    ]])
+
+    by_grade = rollup(partials[partials['grade'].notna()], ['user_id', 'user_horse_id', 'name', 'grade'])
+    by_grade = by_grade.rename(columns={'name': 'horse_name'})
+    by_grade['grade_name'] = by_grade['grade'].map(GRADE_NAMES).fillna('Unknown')
+    by_grade['races_at_grade'] = by_grade['races'].astype(int)
+    by_grade['avg_position'] = mean_of(by_grade, 'final_position')
+    by_grade['wins'] = by_grade['wins'].astype(int)
+    by_grade['top_3_finishes'] = by_grade['top_3'].astype(int)
+    by_grade['avg_rating'] = mean_of(by_grade, 'rating')
+    by_grade = by_grade.sort_values(['user_id', 'user_horse_id', 'grade'])
+    out['Horse_Performance_By_Grade'] = frame_to_records(by_grade[[
+        'user_id', 'user_horse_id', 'horse_name', 'grade', 'grade_name', 'races_at_grade',
+        'avg_position', 'wins', 'top_3_finishes', 'avg_rating',
+    ]])
+
+    horse = rollup(partials, ['user_id', 'user_horse_id', 'name'])
+    horse = horse.rename(columns={'name': 'horse_name'})
+    horse['total_races'] = horse['races'].astype(int)
+
+    traits = horse.copy()
+    traits['avg_position'] = mean_of(traits, 'final_position')
+    for group in ['speed', 'stamina', 'acceleration']:
+        for n in [1, 2]:
+            traits[f'{group}_trait_{n}_power'] = mean_of(traits, f'{group}_trait_{n}_pwr')
+    traits = traits.sort_values(['user_id', 'total_races'], ascending=[True, False])
+    out['Horse_Traits_Performance'] = frame_to_records(traits[[
+        'user_id', 'user_horse_id', 'horse_name', 'total_races', 'avg_position',
+        'speed_trait_1', 'speed_trait_2', 'speed_trait_1_power', 'speed_trait_2_power',
+        'stamina_trait_1', 'stamina_trait_2', 'stamina_trait_1_power', 'stamina_trait_2_power',
+        'acceleration_trait_1', 'acceleration_trait_2',
+        'acceleration_trait_1_power', 'acceleration_trait_2_power',
+    ]])
+
+    skills = horse.copy()
+    skill_columns = [col for col in HORSE_AVG_COLUMNS if col.startswith('skill_')]
+    skills['races_analyzed'] = skills['total_races']
+    for col in skill_columns:
+        skills[f'avg_{col}'] = mean_of(skills, col)
+    skills = skills.sort_values(['user_id', 'races_analyzed'], ascending=[True, False])
+    out['Horse_Skills_From_Races'] = frame_to_records(skills[
+        ['user_id', 'user_horse_id', 'horse_name', 'races_analyzed'] + [f'avg_{col}' for col in skill_columns]
+    ])
+
+    # Horse_Distance_Analysis: one row per player_horse horse, joined to its own snapshots
+    stat_columns = ['races', 'wins'] + [
+        f'{col}_{part}' for col in ['final_position', 'stamina', 'speed', 'acceleration', 'rating'] for part in ['sum', 'cnt']
+    ]
+    per_horse = rollup(partials.loc[partials['user_horse_id'] > 0, ['user_id', 'user_horse_id'] + stat_columns],
+                       ['user_id', 'user_horse_id'])
+    stats = per_horse[['user_id', 'user_horse_id']].copy()
+    stats['total_races'] = per_horse['races'].astype(int)
+    stats['wins'] = per_horse['wins'].astype(int)
+    stats['avg_finish_position'] = mean_of(per_horse, 'final_position')
+    for col in ['stamina', 'speed', 'acceleration', 'rating']:
+        stats[f'avg_{col}'] = mean_of(per_horse, col)
+    analysis = horse_identity_index(horse_inventory).merge(stats, on=['user_id', 'user_horse_id'], how='inner')
+    analysis['inferred_specialization'] = infer_specialization(analysis)
+    analysis = analysis.sort_values(['user_id', 'total_races'], ascending=[True, False])
+    out['Horse_Distance_Analysis'] = frame_to_records(analysis[[
+        'user_id', 'horse_id', 'horse_name', 'grade', 'total_races', 'wins', 'avg_finish_position',
+        'avg_stamina', 'avg_speed', 'avg_acceleration', 'inferred_specialization', 'avg_rating',
+    ]])
+
+    return out
+
+def derive_entrant_sections(partials):
+    """Build the distance and surface sections from the race partials"""
+    if partials is None or partials.empty:
+        return {'All_Horses_Distance_Performance': [], 'All_Horses_Surface_Performance': []}
+
+    def finish(df):
+        df = df.rename(columns={'name': 'horse_name'})
+        df['avg_position'] = mean_of(df, 'final_position')
+        df['wins'] = df['wins'].astype(int)
+        df['top_3_finishes'] = df['top_3'].astype(int)
+        df['avg_rating'] = mean_of(df, 'rating')
+        df['best_position'] = df['best_position'].astype('Int64')
+        df['worst_position'] = df['worst_position'].astype('Int64')
+        return df
+
+    distance = finish(rollup(partials[partials['distance'].notna()],
+                             ['user_id', 'user_horse_id', 'name', 'distance']))
+    distance['distance_name'] = distance['distance'].map(DISTANCE_NAMES).fillna('Unknown')
+    distance['distance_category'] = distance['distance'].map(DISTANCE_CATEGORIES).fillna('Unknown')
+    distance['races_at_distance'] = distance['races'].astype(int)
+    distance = distance.sort_values(['user_id', 'user_horse_id', 'distance'])
+
+    surface = finish(rollup(partials[partials['surface'].notna()],
+                            ['user_id', 'user_horse_id', 'name', 'surface', 'weather', 'condition']))
+    surface['surface_name'] = surface['surface'].map(SURFACE_NAMES).fillna('Unknown')
+    surface['races'] = surface['races'].astype(int)
+    surface = surface.sort_values(['user_id', 'user_horse_id', 'races'], ascending=[True, True, False])
+
+    return {
+        'All_Horses_Distance_Performance': frame_to_records(distance[[
+            'user_id', 'user_horse_id', 'horse_name', 'distance', 'distance_name', 'distance_category',
+            'races_at_distance', 'avg_position', 'best_position', 'worst_position',
+            'wins', 'top_3_finishes', 'avg_rating',
+        ]]),
+        'All_Horses_Surface_Performance': frame_to_records(surface[[
+            'user_id', 'user_horse_id', 'horse_name', 'surface', 'surface_name', 'weather', 'condition',
+            'races', 'avg_position', 'best_position', 'worst_position',
+            'wins', 'top_3_finishes', 'avg_rating',
+        ]]),
+    }
+
+def refresh_incremental(engine, TARGET_USER_IDS, params, horse_inventory, rebuild=False, batches=None, errors=None,
+                        metrics=None):
+    """Read rows past the cursors, merge them into the stored partials and derive the sections
+
+    batches, when given, are per-batch copies of params (see user_batches.py);
+    each delta query then runs once per batch and the results are concatenated.
+    Each delta read runs within its deadline (DELTA_QUERY_NAMES) and its timing is added to metrics.
+    A failed delta records its sections in errors ({section: error}) so they are served stale.
+    """
+    window_start = params['window_start']
+    if rebuild:
+        state = empty_state(TARGET_USER_IDS, window_start)
+    else:
+        state = load_state(TARGET_USER_IDS, window_start)
+
+    apply_delta = {
+        'pnl': apply_pnl_delta,
+        'horse': apply_horse_delta,
+        'entrant': apply_entrant_delta,
+    }
+
+    # A failed delta keeps its old partials and cursors, so the next run picks the rows up
+    for key, (query, values) in build_delta_queries(state['cursors']).items():
+        try:
+            parts = []
+            for batch in (batches or [params]):
+                part, timing = timed_read_sql(
+                    query, engine, dict(params, **values, user_ids=batch['user_ids']),
+                    section_timeout(DELTA_QUERY_NAMES[key]),
+                )
+                parts.append(part)
+                if metrics is not None:
+                    timing['section'] = DELTA_QUERY_NAMES[key]
+                    metrics.append(timing)
+            rows = pd.concat(parts, ignore_index=True)
+            folded = apply_delta[key](state, rows)
+            pending = sum(len(cursor['pending']) for cursor in state['cursors'][key].values())
+            print(f"SUCCESS incremental {key}: {len(rows)} rows read, {folded} folded, {pending} waiting for a result")
+        except Exception as e:
+            print(f"ERROR incremental {key}: Error - {e}")
+            if errors is not None:
+                errors.update({section: str(e) for section in DELTA_SECTIONS[key]})
+
+    save_state(state)
+    watermarks = {
+        key: {zone: cursor['watermark'] for zone, cursor in cursors.items()}
+        for key, cursors in state['cursors'].items()
+    }
+    print(f"Watermarks: {watermarks}")
+
+    data = {}
+    data.update(derive_pnl_sections(frame_from_state(state['pnl_partials'])))
+    data.update(derive_horse_sections(frame_from_state(state['horse_partials']), horse_inventory))
+    data.update(derive_entrant_sections(frame_from_state(state['entrant_partials'])))
+    return data
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Local SQLite mirror of the bot-relevant slices of the MySQL tables
+
+Keeps the bot rows of player_token_transaction, full_WC_horse_snapshot,
+full_WC_entrant, full_WC_event, full_WC_result and the small player_* tables
+in a local file, partitioned by day (mirror_day column). Each sync re-reads
+only the most recent day partitions. Rows are picked by query_date, which a
+later settlement does not change, so each sync also re-reads the older rows of
+races that had no result at the previous sync (snapshots without a
+final_position, and the entrants, events and results of events without a
+result row), back to MIRROR_SETTLE_DAYS. The dashboard queries can then run
+offline against the mirror with:
+
+    python local_mirror.py                        # sync
+    python manual_report_updater.py --mirror      # refresh from the mirror
+
+MySQL's FROM_UNIXTIME/UNIX_TIMESTAMP use the session time zone, so each sync
+records the live server's UTC offset and the SQLite stand-ins apply it. Daily
+and weekly PnL buckets then split on the same day boundaries as live.
+"""
+
+import os
+import argparse
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import pandas as pd
+from sqlalchemy import Column, MetaData, Table, create_engine, event, inspect, text, bindparam, types
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How each table is mirrored:
+#   day  - rows are partitioned by mirror_day; partitions from the resync start are replaced
+#   keys - rows since the resync start are upserted on the key columns
+#   full - small tables, replaced on every sync
+MIRROR_TABLES = {
+    'player_token_transaction': {
+        'strategy': 'day',
+        'alias': 't',
+        'source': 'player_token_transaction t',
+        'where': 't.user_id IN :user_ids',
+        'day': 'DATE(FROM_UNIXTIME(t.created_at))',
+        'since': 't.created_at >= UNIX_TIMESTAMP(:from_day)',
+        'exclude': ['ctx'],
+        'real_columns': ['amount'],
+        'indexes': [['user_id', 'created_at'], ['source_trx_id']],
+    },
+    'full_WC_horse_snapshot': {
+        'strategy': 'day',
+        'alias': 'hs',
+        'source': 'full_WC_horse_snapshot hs',
+        'where': 'hs.user_id IN :user_ids',
+        'day': 'DATE(hs.query_date)',
+        'since': 'hs.query_date >= :from_day',
+        'exclude': ['tactic'],
+        'real_columns': ['career_earnings'],
+        # final_position is filled in when the race settles
+        'unsettled': """
+            SELECT _id AS id, Zone FROM full_WC_horse_snapshot
+            WHERE final_position IS NULL AND mirror_day >= :settle_day
+        """,
+        'unsettled_column': '_id',
+        # The created_ts/_id indexes serve the keyset pages of race_history.py
+        'indexes': [['user_id', 'user_horse_id', 'created_ts', '_id'], ['user_id', 'created_ts', '_id'], ['_id', 'Zone']],
+    },
+    'full_WC_entrant': {
+        'strategy': 'day',
+        'alias': 'ent',
+        'source': """full_WC_entrant ent
+            INNER JOIN full_WC_horse_snapshot hs ON hs._id = ent.horse_snapshot_id
+                AND hs.Zone = ent.Zone""",
+        'where': 'hs.user_id IN :user_ids',
+        'day': 'DATE(ent.query_date)',
+        'since': 'ent.query_date >= :from_day',
+        'unsettled': """
+            SELECT ent._id AS id, ent.Zone FROM full_WC_entrant ent
+            WHERE ent.mirror_day >= :settle_day AND NOT EXISTS (
+                SELECT 1 FROM full_WC_result r WHERE r.event_id = ent.event_id AND r.Zone = ent.Zone
+            )
+        """,
+        'unsettled_column': '_id',
+        'indexes': [['horse_snapshot_id', 'Zone'], ['event_id', 'Zone']],
+    },
+    'full_WC_event': {
+        'strategy': 'keys',
+        'keys': ['_id', 'Zone'],
+        'alias': 'e',
+        'distinct': True,
+        'source': """full_WC_event e
+            INNER JOIN full_WC_entrant ent ON ent.event_id = e._id
+                AND ent.Zone = e.Zone
+            INNER JOIN full_WC_horse_snapshot hs ON hs._id = ent.horse_snapshot_id
+                AND hs.Zone = ent.Zone""",
+        'where': 'hs.user_id IN :user_ids',
+        'day': 'DATE(e.query_date)',
+        'since': 'ent.query_date >= :from_day',
+        'exclude': ['rng'],
+        # status and result_id change when the race settles
+        'unsettled': """
+            SELECT e._id AS id, e.Zone FROM full_WC_event e
+            WHERE e.mirror_day >= :settle_day AND NOT EXISTS (
+                SELECT 1 FROM full_WC_result r WHERE r.event_id = e._id AND r.Zone = e.Zone
+            )
+        """,
+        'unsettled_column': '_id',
+        'indexes': [['_id', 'Zone']],
+    },
+    'full_WC_result': {
+        'strategy': 'keys',
+        # Result ids are only unique per Zone, like event ids
+        'keys': ['_id', 'Zone'],
+        'alias': 'r',
+        'source': 'full_WC_result r',
+        'where': """r.event_id IN (
+                SELECT t.source_trx_id FROM player_token_transaction t
+                WHERE t.user_id IN :user_ids AND t.ctx_type = 1
+            )""",
+        'day': 'DATE(r.query_date)',
+        'since': 'r.query_date >= :from_day',
+        # Results written later for events mirrored without one
+        'unsettled': """
+            SELECT e._id AS id, e.Zone FROM full_WC_event e
+            WHERE e.mirror_day >= :settle_day AND NOT EXISTS (
+                SELECT 1 FROM full_WC_result r WHERE r.event_id = e._id AND r.Zone = e.Zone
+            )
+        """,
+        'unsettled_column': 'event_id',
+        # (Zone, _id) serves the per-zone result watermarks of race_rollup.py
+        'indexes': [['event_id', 'Zone'], ['_id', 'Zone'], ['Zone', '_id']],
+    },
+    'player_token_account': {
+        'strategy': 'full',
+        'alias': 'a',
+        'source': 'player_token_account a',
+        'where': 'a.user_id IN :user_ids',
+        'day': 'DATE(a.updated_at)',
+        'real_columns': ['amount'],
+        'indexes': [['user_id']],
+    },
+    'player_horse': {
+        'strategy': 'full',
+        'alias': 'ph',
+        'source': 'player_horse ph',
+        'where': 'ph.user_id IN :user_ids',
+        'day': 'DATE(ph.modified_utc)',
+        'indexes': [['user_id']],
+    },
+    'player_daily_fact_distance': {
+        'strategy': 'day',
+        'alias': 'f',
+        'source': 'player_daily_fact_distance f',
+        'where': 'f.user_id IN :user_ids',
+        'day': 'f.gaming_date',
+        'since': 'f.gaming_date >= :from_day',
+        'indexes': [['user_id']],
+    },
+    'player_daily_fact_grade': {
+        'strategy': 'day',
+        'alias': 'f',
+        'source': 'player_daily_fact_grade f',
+        'where': 'f.user_id IN :user_ids',
+        'day': 'f.gaming_date',
+        'since': 'f.gaming_date >= :from_day',
+        'indexes': [['user_id']],
+    },
+    'player_daily_fact_track': {
+        'strategy': 'day',
+        'alias': 'f',
+        'source': 'player_daily_fact_track f',
+        'where': 'f.user_id IN :user_ids',
+        'day': 'f.gaming_date',
+        'since': 'f.gaming_date >= :from_day',
+        'indexes': [['user_id']],
+    },
+}
+
+EPOCH_DAY = '1970-01-01'
+
+def get_mirror_path():
+    """Get the local mirror file path from environment variables"""
+    return os.getenv('LOCAL_MIRROR_PATH', 'local_mirror.sqlite')
+
+def get_resync_days():
+    """Get how many trailing day partitions are re-read on every sync"""
+    return max(0, int(os.getenv('MIRROR_RESYNC_DAYS', '2')))
+
+def get_settle_days():
+    """Get how many days back rows still waiting for a race result are re-read"""
+    return max(0, int(os.getenv('MIRROR_SETTLE_DAYS', '30')))
+
+def _from_unixtime(ts, offset=0):
+    """SQLite stand-in for MySQL FROM_UNIXTIME in a session offset seconds ahead of UTC"""
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(int(ts) + offset, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _unix_timestamp(*args, offset=0):
+    """SQLite stand-in for MySQL UNIX_TIMESTAMP in a session offset seconds ahead of UTC"""
+    if not args:
+        return int(datetime.now(timezone.utc).timestamp())
+    if args[0] is None:
+        return None
+    value = datetime.fromisoformat(str(args[0]))
+    return int(value.replace(tzinfo=timezone.utc).timestamp()) - offset
+
+def server_utc_offset(remote):
+    """Seconds the live server's session time zone is ahead of UTC"""
+    with remote.connect() as conn:
+        return int(conn.execute(text("SELECT TIMESTAMPDIFF(SECOND, UTC_TIMESTAMP(), NOW())")).scalar())
+
+def save_utc_offset(local, offset):
+    """Remember the live server's UTC offset in the mirror"""
+    with local.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS mirror_settings (name TEXT PRIMARY KEY, value TEXT)"))
+        conn.execute(
+            text("INSERT OR REPLACE INTO mirror_settings VALUES ('utc_offset_seconds', :offset)"),
+            {'offset': str(offset)},
+        )
+
+def mirror_utc_offset(dbapi_connection):
+    """UTC offset recorded by the last sync (0 for mirrors synced before it was recorded)"""
+    try:
+        row = dbapi_connection.execute(
+            "SELECT value FROM mirror_settings WHERE name = 'utc_offset_seconds'"
+        ).fetchone()
+    except sqlite3.Error:
+        return 0
+    return int(row[0]) if row else 0
+
+def register_mysql_functions(dbapi_connection, connection_record):
+    """Make the MySQL functions used by the dashboard queries available in SQLite"""
+    offset = mirror_utc_offset(dbapi_connection)
+    dbapi_connection.create_function(
+        'FROM_UNIXTIME', 1, lambda ts: _from_unixtime(ts, offset), deterministic=True)
+    dbapi_connection.create_function(
+        'UNIX_TIMESTAMP', -1, lambda *args: _unix_timestamp(*args, offset=offset))
+
+def create_mirror_engine(max_workers=1, mirror_path=None):
+    """Create a pooled engine on the local mirror"""
+    mirror_path = mirror_path or get_mirror_path()
+    engine = create_engine(
+        f"sqlite:///{mirror_path}",
+        pool_size=max_workers,
+        max_overflow=0,
+        connect_args={'check_same_thread': False},
+    )
+    event.listen(engine, 'connect', register_mysql_functions)
+    return engine
+
+def mirror_columns(remote, table, spec):
+    """The live table's columns that are mirrored, as reflected (name, type, ...)"""
+    return [c for c in inspect(remote).get_columns(table) if c['name'] not in spec.get('exclude', [])]
+
+def mirror_column_type(column, spec):
+    """SQLite column type for a reflected live column"""
+    kind = column['type']
+    if column['name'] in spec.get('real_columns', []) or isinstance(kind, types.Numeric):
+        # Decimal values are stored as floats (see prepare_chunk)
+        return types.Float()
+    if isinstance(kind, (types.Integer, types.Boolean)):
+        return types.BigInteger()
+    if isinstance(kind, types.DateTime):
+        return types.DateTime()
+    if isinstance(kind, types.Date):
+        return types.Date()
+    if isinstance(kind, types.LargeBinary):
+        return types.LargeBinary()
+    return types.Text()
+
+def create_mirror_table(conn, table, spec, columns):
+    """Create a mirrored table from the live table's columns, so types never follow a chunk's dtypes"""
+    metadata = MetaData()
+    Table(
+        table, metadata,
+        *[Column(c['name'], mirror_column_type(c, spec)) for c in columns],
+        Column('mirror_day', types.Text()),
+    )
+    metadata.create_all(conn)
+
+def build_mirror_query(table, spec, columns, incremental, condition=None):
+    """Select the bot rows of a table plus its day partition"""
+    select = ", ".join(f"{spec['alias']}.`{c['name']}`" for c in columns)
+    distinct = "DISTINCT " if spec.get('distinct') else ""
+    sql = f"""
+        SELECT {distinct}{select}, {spec['day']} AS mirror_day
+        FROM {spec['source']}
+        WHERE {spec['where']}
+    """
+    if incremental and spec.get('since'):
+        sql += f"    AND {spec['since']}\n"
+    if condition:
+        sql += f"    AND {condition}\n"
+    expanding = ['user_ids'] + (['unsettled_ids'] if condition else [])
+    return text(sql).bindparams(*[bindparam(name, expanding=True) for name in expanding])
+
+def resync_start(local, table, resync_days):
+    """First day partition to re-read, or None for a full load"""
+    if not inspect(local).has_table(table):
+        return None
+    with local.connect() as conn:
+        last_day = conn.execute(text(f"SELECT MAX(mirror_day) FROM {table}")).scalar()
+    if not last_day:
+        return None
+    start = datetime.strptime(str(last_day)[:10], '%Y-%m-%d') - timedelta(days=resync_days)
+    return start.strftime('%Y-%m-%d')
+
+def prepare_chunk(chunk, spec):
+    """Make a chunk storable in SQLite (no Decimal, dates as text)"""
+    for col in chunk.columns:
+        if chunk[col].dtype == object:
+            sample = chunk[col].dropna()
+            if not sample.empty and isinstance(sample.iloc[0], Decimal):
+                chunk[col] = pd.to_numeric(chunk[col]).astype(float)
+    for col in spec.get('real_columns', []):
+        if col in chunk.columns:
+            chunk[col] = pd.to_numeric(chunk[col]).astype(float)
+    days = chunk['mirror_day']
+    chunk['mirror_day'] = days.astype(str).str[:10].where(days.notna(), None)
+    return chunk
+
+def sync_table(remote, local, table, spec, user_ids, resync_days, chunksize=50000):
+    """Refresh one mirrored table; returns the number of rows written"""
+    strategy = spec['strategy']
+    from_day = None if strategy == 'full' else resync_start(local, table, resync_days)
+    incremental = from_day is not None
+    columns = mirror_columns(remote, table, spec)
+    query = build_mirror_query(table, spec, columns, incremental)
+    params = {'user_ids': list(user_ids), 'from_day': from_day or EPOCH_DAY}
+
+    rows = 0
+    exists = inspect(local).has_table(table)
+    with local.begin() as conn:
+        if not exists:
+            create_mirror_table(conn, table, spec, columns)
+        elif strategy == 'full':
+            conn.execute(text(f"DELETE FROM {table}"))
+        elif strategy == 'day' and incremental:
+            conn.execute(text(f"DELETE FROM {table} WHERE mirror_day >= :from_day"), {'from_day': from_day})
+
+        for chunk in pd.read_sql(query, remote, params=params, chunksize=chunksize):
+            chunk = prepare_chunk(chunk, spec)
+            if exists and strategy == 'keys':
+                condition = " AND ".join(f"{k} = :{k}" for k in spec['keys'])
+                conn.execute(
+                    text(f"DELETE FROM {table} WHERE {condition}"),
+                    chunk[spec['keys']].to_dict('records'),
+                )
+            chunk.to_sql(table, conn, if_exists='append', index=False)
+            rows += len(chunk)
+
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_mirror_day ON {table} (mirror_day)"))
+        for index in spec.get('indexes', []):
+            name = f"ix_{table}_{'_'.join(index)}"
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(index)})"))
+
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS mirror_sync (
+                table_name TEXT PRIMARY KEY,
+                synced_at TEXT,
+                from_day TEXT,
+                rows INTEGER
+            )
+        """))
+        conn.execute(
+            text("INSERT OR REPLACE INTO mirror_sync VALUES (:table_name, :synced_at, :from_day, :rows)"),
+            {
+                'table_name': table,
+                'synced_at': datetime.now().isoformat(),
+                'from_day': from_day,
+                'rows': rows,
+            },
+        )
+
+    return rows
+
+def unsettled_keys(local, table, spec, settle_days):
+    """{Zone: ids} of the mirrored rows still waiting for a race result"""
+    if not spec.get('unsettled') or not inspect(local).has_table(table):
+        return {}
+    settle_day = (datetime.now() - timedelta(days=settle_days)).strftime('%Y-%m-%d')
+    try:
+        with local.connect() as conn:
+            found = conn.execute(text(spec['unsettled']), {'settle_day': settle_day}).fetchall()
+    except Exception:
+        # A table the check joins to is not mirrored yet
+        return {}
+    keys = {}
+    for row in found:
+        keys.setdefault(row.Zone, set()).add(int(row.id))
+    return {zone: sorted(ids) for zone, ids in keys.items()}
+
+def resync_unsettled(remote, local, table, spec, user_ids, keys, batch_size=1000):
+    """Re-read the rows of races that had no result at the last sync; returns the rows written"""
+    if not keys:
+        return 0
+    column = spec['unsettled_column']
+    columns = mirror_columns(remote, table, spec)
+    query = build_mirror_query(
+        table, spec, columns, False,
+        f"{spec['alias']}.{column} IN :unsettled_ids AND {spec['alias']}.Zone = :unsettled_zone",
+    )
+    rows = 0
+    with local.begin() as conn:
+        for zone, ids in keys.items():
+            for i in range(0, len(ids), batch_size):
+                batch = ids[i:i + batch_size]
+                params = {'user_ids': list(user_ids), 'unsettled_ids': batch, 'unsettled_zone': zone}
+                fresh = pd.read_sql(query, remote, params=params)
+                # Rows are replaced whole; a row that is gone from the live table goes here too
+                conn.execute(
+                    text(f"DELETE FROM {table} WHERE {column} IN :ids AND Zone = :zone")
+                    .bindparams(bindparam('ids', expanding=True)),
+                    {'ids': batch, 'zone': zone},
+                )
+                if not fresh.empty:
+                    prepare_chunk(fresh, spec).to_sql(table, conn, if_exists='append', index=False)
+                rows += len(fresh)
+    return rows
+
+def sync_mirror(tables=None, resync_days=None, full=False, mirror_path=None):
+    """Sync the local mirror from the live database"""
+    from manual_report_updater import get_database_config, get_bot_user_ids
+
+    mirror_path = mirror_path or get_mirror_path()
+    if full and os.path.exists(mirror_path):
+        os.remove(mirror_path)
+
+    remote = create_engine(get_database_config(), pool_pre_ping=True)
+    local = create_mirror_engine(mirror_path=mirror_path)
+
+    user_ids = get_bot_user_ids()
+    if resync_days is None:
+        resync_days = get_resync_days()
+
+    try:
+        offset = server_utc_offset(remote)
+        save_utc_offset(local, offset)
+        print(f"Server time zone: UTC{offset / 3600:+g}h")
+    except Exception as e:
+        print(f"ERROR Server time zone: Error - {e} (mirror days stay in the last recorded offset)")
+
+    # Taken before any table syncs, so a result arriving now still re-reads its event and entrants
+    settle_days = get_settle_days()
+    unsettled = {
+        table: unsettled_keys(local, table, MIRROR_TABLES[table], settle_days)
+        for table in tables or MIRROR_TABLES
+    }
+
+    for table in tables or MIRROR_TABLES:
+        started = datetime.now()
+        try:
+            rows = sync_table(remote, local, table, MIRROR_TABLES[table], user_ids, resync_days)
+            settled = resync_unsettled(remote, local, table, MIRROR_TABLES[table], user_ids, unsettled[table])
+            elapsed = (datetime.now() - started).total_seconds()
+            waiting = sum(len(ids) for ids in unsettled[table].values())
+            print(f"SUCCESS {table}: {rows} rows synced, {settled} re-read for {waiting} unsettled keys "
+                  f"in {elapsed:.1f}s")
+        except Exception as e:
+            print(f"ERROR {table}: Error - {e}")
+
+    remote.dispose()
+    local.dispose()
+
+def main(argv=None):
+    """Sync the local mirror"""
+    parser = argparse.ArgumentParser(description="Sync the local mirror of the bot data")
+    parser.add_argument('--tables', nargs='+', choices=list(MIRROR_TABLES),
+                        help="Only sync these tables")
+    parser.add_argument('--resync-days', type=int, default=None,
+                        help="Trailing day partitions to re-read (default: MIRROR_RESYNC_DAYS or 2)")
+    parser.add_argument('--full', action='store_true',
+                        help="Drop the mirror and load everything again")
+    args = parser.parse_args(argv)
+
+    print("Local Mirror Sync")
+    print("=" * 50)
+    sync_mirror(tables=args.tables, resync_days=args.resync_days, full=args.full)
+    print(f"Mirror ready: {get_mirror_path()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,36 @@
 import pandas as pd
-from sqlalchemy import create_engine
+import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 import json
+import argparse
+from metric_registry import METRICS, compile_metrics, metric_params
+from incremental_refresh import INCREMENTAL_SECTIONS, refresh_incremental
+from pnl_rollup import PNL_SECTIONS, fetch_pnl_rollup, derive_pnl_sections
+from local_mirror import create_mirror_engine
+from entrant_stream import STREAM_SECTIONS, stream_entrant_sections
+from race_rollup import ROLLUP_SECTIONS, refresh_race_rollup
+from open_positions import POSITIONS_SECTION, refresh_open_positions
+from horse_snapshot_scan import SNAPSHOT_SCAN_SECTIONS, fetch_snapshot_frame, compute_snapshot_sections
+from bot_data_output import OUTPUT_FORMATS, serialize_bot_data, write_atomic, write_compressed_siblings, write_section_files
+from delta_feed import update_delta_feed
+from backup_store import save_backup, prune_backups
+from query_metrics import explain_query, get_explain_enabled, record_run_metrics, timed_read_sql
+from query_deadlines import section_timeout
+from db_routing import create_pooled_engine, create_router, dispose_router, engine_for
+from section_freshness import carry_last_good, freshness_markers, load_freshness, load_published_sections, record_freshness
+from refresh_daemon import REFRESH_GROUPS, run_daemon
+from user_batches import batch_params, merge_frame_batches, merge_record_batches, split_user_ids
+from result_store import compact_frame, merge_result_batches, section_frame, section_records
 
 # Load environment variables
 load_dotenv()
 
+# Default start of the PnL reporting window
+DEFAULT_PNL_WINDOW_START = '2025-09-18'
+
 def get_database_config():
     """Get database configuration from environment variables"""
     DB_USER = os.getenv('DB_USER')
@@ -22,513 +45,274 @@ def get_database_config():
     DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     return DATABASE_URL
 
+def get_pnl_window_start():
+    """Get the start date (YYYY-MM-DD) of the PnL reporting window"""
+    return os.getenv('PNL_WINDOW_START', DEFAULT_PNL_WINDOW_START)
+
+DEFAULT_BOT_NAMES = {
+    10111491: "Alba",
+    10211493: "Eirean", 
+    10411491: "Kernow",
+    10711491: "Cymru",
+    11011491: "Albion"
+}
+
+def read_id_file(path):
+    """Read user ids from a file: one per line or comma separated, '#' starts a comment"""
+    user_ids = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0]
+            user_ids.extend(int(x) for x in line.replace(',', ' ').split())
+    return user_ids
+
+def get_bot_user_ids():
+    """Get the list of bot user IDs from environment variables (or BOT_USER_IDS_FILE for large cohorts)"""
+    BOT_USER_IDS_FILE = os.getenv('BOT_USER_IDS_FILE')
+    if BOT_USER_IDS_FILE:
+        return read_id_file(BOT_USER_IDS_FILE)
+    BOT_USER_IDS_STR = os.getenv('BOT_USER_IDS', '10111491,10211493,10411491,10711491,11011491')
+    return [int(x.strip()) for x in BOT_USER_IDS_STR.split(',')]
+
+def load_bot_names(path=None):
+    """Load the user_id -> display name mapping from BOT_NAMES_FILE (JSON object or user_id,name CSV)"""
+    path = path or os.getenv('BOT_NAMES_FILE', 'bot_names.json')
+    if not os.path.exists(path):
+        return dict(DEFAULT_BOT_NAMES)
+    try:
+        if path.endswith('.csv'):
+            names = pd.read_csv(path, dtype={'name': str})
+            return dict(zip(names['user_id'].astype(int), names['name']))
+        with open(path) as f:
+            return {int(user_id): name for user_id, name in json.load(f).items()}
+    except Exception as e:
+        print(f"ERROR Bot names: Error - {e}")
+        return dict(DEFAULT_BOT_NAMES)
+
 def get_bot_config():
     """Get bot configuration from environment variables"""
-    BOT_USER_IDS_STR = os.getenv('BOT_USER_IDS', '10111491,10211493,10411491,10711491,11011491')
-    BOT_USER_IDS_LIST = [int(x.strip()) for x in BOT_USER_IDS_STR.split(',')]
+    BOT_USER_IDS_LIST = get_bot_user_ids()
     TARGET_USER_IDS = ", ".join(map(str, BOT_USER_IDS_LIST))
     
-    BOT_NAMES = {
-        10111491: "Alba",
-        10211493: "Eirean", 
-        10411491: "Kernow",
-        10711491: "Cymru",
-        11011491: "Albion"
-    }
+    BOT_NAMES = load_bot_names()
     
     return BOT_NAMES, TARGET_USER_IDS
 
-def fetch_bot_data():
-    """Fetch all bot performance data from database"""
+def build_queries():
+    """Build the dashboard SQL statements keyed by output section"""
+    return compile_metrics()
+
+def get_fetch_workers():
+    """Get the maximum number of queries to run in parallel"""
+    return max(1, int(os.getenv('FETCH_MAX_WORKERS', '6')))
+
+def run_query(key, query, engine, params=None, metrics=None, explain=False, errors=None):
+    """Run a single section query within its deadline; errors are isolated to that section"""
+    try:
+        df, timing = timed_read_sql(query, engine, params, section_timeout(key))
+        # Kept typed and columnar; records are only built when the output is written
+        df = compact_frame(df)
+        print(f"SUCCESS {key}: {len(df)} records in {timing['wall_seconds']:.2f}s")
+        
+        # Timings (and the plan, once per section) for the run's metrics file
+        if metrics is not None:
+            timing['section'] = key
+            if explain:
+                timing['explain'] = explain_query(engine, query, params)
+            metrics.append(timing)
+        
+        # Debug: Show sample data for key queries
+        if key in ['Total_PnL', 'Reserve_Balance', 'In_Play_Balance'] and len(df) > 0:
+            print(f"   Sample data: {section_records(df.head(1))[0]}")
+        
+        return df
+        
+    except Exception as e:
+        print(f"ERROR {key}: Error - {e}")
+        if errors is not None:
+            errors[key] = str(e)
+        return pd.DataFrame()
+
+def fetch_bot_data(max_workers=None, incremental=False, rebuild=False, shared_scan=False,
+                   window_start=None, mirror=False, stream=False, race_rollup=False,
+                   open_positions=False):
+    """Fetch all bot performance data from database (or the local mirror)"""
     try:
-        DATABASE_URL = get_database_config()
         _, TARGET_USER_IDS = get_bot_config()
         
-        engine = create_engine(DATABASE_URL)
+        if max_workers is None:
+            max_workers = get_fetch_workers()
+        if window_start is None:
+            window_start = get_pnl_window_start()
         
-        queries = {
-            # ============================================
-            # BOT-LEVEL QUERIES (Original)
-            # ============================================
-            'Total_PnL': f"""
-                SELECT
-                    user_id,
-                    SUM(amount) / 1000000 AS total_pnl_IGGT
-                FROM player_token_transaction
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND ctx_type = 1
-                    AND FROM_UNIXTIME(created_at) >= '2025-09-18'
-                GROUP BY user_id
-            """,
-            'Reserve_Balance': f"""
-                SELECT
-                    user_id,
-                    amount / 1000000 AS reserve_balance_IGGT
-                FROM player_token_account
-                WHERE user_id IN ({TARGET_USER_IDS})
-            """,
-            'In_Play_Balance': f"""
-                SELECT
-                    t.user_id,
-                    SUM(ABS(t.amount)) / 1000000 AS in_play_balance_IGGT
-                FROM player_token_transaction t
-                LEFT JOIN full_WC_result r ON t.source_trx_id = r.event_id
-                WHERE t.user_id IN ({TARGET_USER_IDS})
-                    AND t.amount < 0
-                    AND t.ctx_type = 1
-                    AND r.event_id IS NULL
-                    AND FROM_UNIXTIME(t.created_at) >= DATE_SUB(NOW(), INTERVAL 1 DAY)
-                GROUP BY t.user_id
-            """,
-            'Races_Entered': f"""
-                SELECT
-                    user_id,
-                    COUNT(*) AS races_entered
-                FROM full_WC_horse_snapshot
-                WHERE user_id IN ({TARGET_USER_IDS})
-                GROUP BY user_id
-            """,
-            'Daily_PnL': f"""
-                SELECT
-                    user_id,
-                    DATE(FROM_UNIXTIME(created_at)) AS date,
-                    SUM(amount) / 1000000 AS daily_pnl_IGGT
-                FROM player_token_transaction
-                WHERE ctx_type = 1
-                    AND user_id IN ({TARGET_USER_IDS})
-                    AND FROM_UNIXTIME(created_at) >= '2025-09-18'
-                GROUP BY user_id, date
-                ORDER BY user_id, date
-            """,
-            'Weekly_PnL': f"""
-                SELECT
-                    user_id,
-                    YEARWEEK(FROM_UNIXTIME(created_at), 1) AS week,
-                    SUM(amount) / 1000000 AS weekly_pnl_IGGT
-                FROM player_token_transaction
-                WHERE ctx_type = 1
-                    AND user_id IN ({TARGET_USER_IDS})
-                    AND FROM_UNIXTIME(created_at) >= '2025-09-18'
-                GROUP BY user_id, week
-                ORDER BY user_id, week
-            """,
-            
-            # ============================================
-            # HORSE-LEVEL QUERIES
-            # ============================================
-            
-            # 1. Individual Horse Performance Summary
-            'Horse_Performance': f"""
-                SELECT 
-                    hs.user_id,
-                    hs.user_horse_id,
-                    hs.name as horse_name,
-                    hs.generation as gen,
-                    hs.grade,
-                    hs.gender,
-                    hs.age,
-                    hs.trainer_id,
-                    COUNT(DISTINCT hs._id) as total_races,
-                    AVG(hs.final_position) as avg_finish_position,
-                    SUM(CASE WHEN hs.final_position = 1 THEN 1 ELSE 0 END) as wins,
-                    SUM(CASE WHEN hs.final_position <= 3 THEN 1 ELSE 0 END) as top_3_finishes,
-                    AVG(hs.rating) as avg_rating,
-                    AVG(hs.speed) as avg_speed,
-                    AVG(hs.stamina) as avg_stamina,
-                    AVG(hs.acceleration) as avg_acceleration,
-                    SUM(hs.career_earnings) / 1000000 as total_career_earnings_IGGT
-                FROM full_WC_horse_snapshot hs
-                WHERE hs.user_id IN ({TARGET_USER_IDS})
-                    AND hs.user_horse_id > 0
-                GROUP BY hs.user_id, hs.user_horse_id, hs.name, hs.generation, hs.grade, 
-                         hs.gender, hs.age, hs.trainer_id
-                ORDER BY hs.user_id, total_races DESC
-            """,
-            
-            # 2. Recent Race Performance (Last 100 races with details)
-            'Recent_Race_Performance': f"""
-                SELECT 
-                    user_id,
-                    user_horse_id,
-                    name as horse_name,
-                    _id as snapshot_id,
-                    created_ts as race_date,
-                    final_position,
-                    grade,
-                    rating,
-                    speed,
-                    stamina,
-                    acceleration,
-                    wins,
-                    shows,
-                    place,
-                    career_earnings / 1000000 as career_earnings_IGGT,
-                    trend
-                FROM full_WC_horse_snapshot
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND final_position IS NOT NULL
-                ORDER BY user_id, created_ts DESC
-                LIMIT 500
-            """,
-            
-            # 3. Horse Performance by Grade
-            'Horse_Performance_By_Grade': f"""
-                SELECT 
-                    user_id,
-                    user_horse_id,
-                    name as horse_name,
-                    grade,
-                    CASE 
-                        WHEN grade = 1 THEN 'Starter'
-                        WHEN grade = 2 THEN 'Regular'
-                        WHEN grade = 3 THEN 'Pro'
-                        ELSE 'Unknown'
-                    END as grade_name,
-                    COUNT(DISTINCT _id) as races_at_grade,
-                    AVG(final_position) as avg_position,
-                    SUM(CASE WHEN final_position = 1 THEN 1 ELSE 0 END) as wins,
-                    SUM(CASE WHEN final_position <= 3 THEN 1 ELSE 0 END) as top_3_finishes,
-                    AVG(rating) as avg_rating
-                FROM full_WC_horse_snapshot
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND grade IS NOT NULL
-                GROUP BY user_id, user_horse_id, name, grade
-                ORDER BY user_id, user_horse_id, grade
-            """,
-            
-            # 4. Horse Traits Analysis (from snapshot data)
-            'Horse_Traits_Performance': f"""
-                SELECT 
-                    user_id,
-                    user_horse_id,
-                    name as horse_name,
-                    COUNT(DISTINCT _id) as total_races,
-                    AVG(final_position) as avg_position,
-                    -- Speed traits
-                    MAX(speed_trait_1) as speed_trait_1,
-                    MAX(speed_trait_2) as speed_trait_2,
-                    AVG(speed_trait_1_pwr) as speed_trait_1_power,
-                    AVG(speed_trait_2_pwr) as speed_trait_2_power,
-                    -- Stamina traits
-                    MAX(stamina_trait_1) as stamina_trait_1,
-                    MAX(stamina_trait_2) as stamina_trait_2,
-                    AVG(stamina_trait_1_pwr) as stamina_trait_1_power,
-                    AVG(stamina_trait_2_pwr) as stamina_trait_2_power,
-                    -- Acceleration traits
-                    MAX(acceleration_trait_1) as acceleration_trait_1,
-                    MAX(acceleration_trait_2) as acceleration_trait_2,
-                    AVG(acceleration_trait_1_pwr) as acceleration_trait_1_power,
-                    AVG(acceleration_trait_2_pwr) as acceleration_trait_2_power
-                FROM full_WC_horse_snapshot
-                WHERE user_id IN ({TARGET_USER_IDS})
-                GROUP BY user_id, user_horse_id, name
-                ORDER BY user_id, total_races DESC
-            """,
-            
-            # 5. Horse Skills from Snapshot
-            'Horse_Skills_From_Races': f"""
-                SELECT 
-                    user_id,
-                    user_horse_id,
-                    name as horse_name,
-                    COUNT(*) as races_analyzed,
-                    AVG(skill_first_out) as avg_skill_first_out,
-                    AVG(skill_front) as avg_skill_front,
-                    AVG(skill_rail) as avg_skill_rail,
-                    AVG(skill_closing) as avg_skill_closing,
-                    AVG(skill_dueling) as avg_skill_dueling,
-                    AVG(skill_turning) as avg_skill_turning,
-                    AVG(skill_working) as avg_skill_working,
-                    AVG(skill_breezing) as avg_skill_breezing,
-                    AVG(skill_drafting) as avg_skill_drafting,
-                    AVG(skill_final_kick) as avg_skill_final_kick,
-                    AVG(skill_overtaking) as avg_skill_overtaking
-                FROM full_WC_horse_snapshot
-                WHERE user_id IN ({TARGET_USER_IDS})
-                GROUP BY user_id, user_horse_id, name
-                ORDER BY user_id, races_analyzed DESC
-            """,
-            
-            # 10. Stable Composition (Horses per bot) - Using player_horse
-            'Stable_Composition': f"""
-                SELECT 
-                    user_id,
-                    COUNT(*) as total_horses,
-                    SUM(CASE WHEN grade = 1 THEN 1 ELSE 0 END) as grade_1_horses,
-                    SUM(CASE WHEN grade = 2 THEN 1 ELSE 0 END) as grade_2_horses,
-                    SUM(CASE WHEN grade = 3 THEN 1 ELSE 0 END) as grade_3_horses,
-                    SUM(CASE WHEN bloodline = 1 THEN 1 ELSE 0 END) as bloodline_1_horses,
-                    SUM(CASE WHEN bloodline = 2 THEN 1 ELSE 0 END) as bloodline_2_horses,
-                    SUM(CASE WHEN status = 0 THEN 1 ELSE 0 END) as active_horses,
-                    AVG(gen) as avg_generation
-                FROM player_horse
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND oc_shard > 0
-                GROUP BY user_id
-                ORDER BY user_id
-            """,
-            
-            # 11. Horse Inventory (List of all bot horses)
-            'Horse_Inventory': f"""
-                SELECT 
-                    user_id,
-                    _id as horse_id,
-                    name as horse_name,
-                    grade,
-                    bloodline,
-                    gen as generation,
-                    gender,
-                    age,
-                    trainer_id,
-                    status,
-                    horse_type_id,
-                    modified_utc as last_updated
-                FROM player_horse
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND oc_shard > 0
-                ORDER BY user_id, grade DESC, name
-            """,
-            
-            # 12. ALL HORSES - Complete Distance Performance
-            'All_Horses_Distance_Performance': f"""
-                SELECT 
-                    hs.user_id,
-                    hs.user_horse_id,
-                    hs.name as horse_name,
-                    e.distance,
-                    CASE 
-                        WHEN e.distance = 1 THEN '1000m (5f)'
-                        WHEN e.distance = 2 THEN '1200m (6f)'
-                        WHEN e.distance = 3 THEN '1400m (7f)'
-                        WHEN e.distance = 4 THEN '1600m (8f)'
-                        WHEN e.distance = 5 THEN '1800m (9f)'
-                        WHEN e.distance = 6 THEN '2000m (10f)'
-                        ELSE 'Unknown'
-                    END as distance_name,
-                    CASE 
-                        WHEN e.distance IN (1, 2) THEN 'Sprint'
-                        WHEN e.distance IN (3, 4, 5) THEN 'Mile'
-                        WHEN e.distance = 6 THEN 'Marathon'
-                        ELSE 'Unknown'
-                    END as distance_category,
-                    COUNT(DISTINCT ent.event_id) as races_at_distance,
-                    AVG(hs.final_position) as avg_position,
-                    MIN(hs.final_position) as best_position,
-                    MAX(hs.final_position) as worst_position,
-                    SUM(CASE WHEN hs.final_position = 1 THEN 1 ELSE 0 END) as wins,
-                    SUM(CASE WHEN hs.final_position <= 3 THEN 1 ELSE 0 END) as top_3_finishes,
-                    AVG(hs.rating) as avg_rating
-                FROM full_WC_horse_snapshot hs
-                INNER JOIN full_WC_entrant ent ON hs._id = ent.horse_snapshot_id 
-                    AND hs.Zone = ent.Zone
-                INNER JOIN full_WC_event e ON ent.event_id = e._id 
-                    AND ent.Zone = e.Zone
-                WHERE hs.user_id IN ({TARGET_USER_IDS})
-                    AND e.distance IS NOT NULL
-                GROUP BY hs.user_id, hs.user_horse_id, hs.name, e.distance
-                ORDER BY hs.user_id, hs.user_horse_id, e.distance
-            """,
-            
-            # 13. ALL HORSES - Surface Performance (Dirt vs Turf)
-            'All_Horses_Surface_Performance': f"""
-                SELECT 
-                    hs.user_id,
-                    hs.user_horse_id,
-                    hs.name as horse_name,
-                    e.surface,
-                    CASE 
-                        WHEN e.surface = 1 THEN 'Dirt'
-                        WHEN e.surface = 2 THEN 'Turf'
-                        ELSE 'Unknown'
-                    END as surface_name,
-                    e.weather,
-                    e.`condition`,
-                    COUNT(DISTINCT ent.event_id) as races,
-                    AVG(hs.final_position) as avg_position,
-                    MIN(hs.final_position) as best_position,
-                    MAX(hs.final_position) as worst_position,
-                    SUM(CASE WHEN hs.final_position = 1 THEN 1 ELSE 0 END) as wins,
-                    SUM(CASE WHEN hs.final_position <= 3 THEN 1 ELSE 0 END) as top_3_finishes,
-                    AVG(hs.rating) as avg_rating
-                FROM full_WC_horse_snapshot hs
-                INNER JOIN full_WC_entrant ent ON hs._id = ent.horse_snapshot_id 
-                    AND hs.Zone = ent.Zone
-                INNER JOIN full_WC_event e ON ent.event_id = e._id 
-                    AND ent.Zone = e.Zone
-                WHERE hs.user_id IN ({TARGET_USER_IDS})
-                    AND e.surface IS NOT NULL
-                GROUP BY hs.user_id, hs.user_horse_id, hs.name, e.surface, e.weather, e.`condition`
-                ORDER BY hs.user_id, hs.user_horse_id, races DESC
-            """,
-            
-            # 14. ALL HORSES - Complete Race Details (with distance & surface)
-            'All_Horses_Complete_Races': f"""
-                SELECT 
-                    hs.user_id,
-                    hs.user_horse_id,
-                    hs.name as horse_name,
-                    ent.event_id,
-                    e.distance,
-                    CASE 
-                        WHEN e.distance IN (1, 2) THEN 'Sprint'
-                        WHEN e.distance IN (3, 4, 5) THEN 'Mile'
-                        WHEN e.distance = 6 THEN 'Marathon'
-                    END as distance_category,
-                    e.surface,
-                    CASE WHEN e.surface = 1 THEN 'Dirt' ELSE 'Turf' END as surface_name,
-                    hs.final_position,
-                    hs.rating,
-                    e.track_name,
-                    hs.created_ts as race_date,
-                    hs.Zone
-                FROM full_WC_horse_snapshot hs
-                INNER JOIN full_WC_entrant ent ON hs._id = ent.horse_snapshot_id 
-                    AND hs.Zone = ent.Zone
-                INNER JOIN full_WC_event e ON ent.event_id = e._id 
-                    AND ent.Zone = e.Zone
-                WHERE hs.user_id IN ({TARGET_USER_IDS})
-                ORDER BY hs.user_id, hs.created_ts DESC
-                LIMIT 2000
-            """
-            ,
-            
-            # 14. Distance Breakdown by Bot (which races they enter)
-            'Bot_Distance_Breakdown': f"""
-                SELECT 
-                    user_id,
-                    distance,
-                    CASE 
-                        WHEN distance = 1 THEN '1000m'
-                        WHEN distance = 2 THEN '1200m'
-                        WHEN distance = 3 THEN '1400m'
-                        WHEN distance = 4 THEN '1600m'
-                        WHEN distance = 5 THEN '1800m'
-                        WHEN distance = 6 THEN '2000m'
-                        ELSE 'Unknown'
-                    END as distance_name,
-                    CASE 
-                        WHEN distance IN (1, 2) THEN 'Sprint'
-                        WHEN distance IN (3, 4, 5) THEN 'Mile'
-                        WHEN distance = 6 THEN 'Marathon'
-                    END as distance_category,
-                    SUM(count) as total_races,
-                    ROUND(SUM(count) * 100.0 / SUM(SUM(count)) OVER (PARTITION BY user_id), 2) as pct_of_total
-                FROM player_daily_fact_distance
-                WHERE user_id IN ({TARGET_USER_IDS})
-                GROUP BY user_id, distance
-                ORDER BY user_id, distance
-            """,
-            
-            # 13. Grade Distribution by Bot
-            'Bot_Grade_Distribution': f"""
-                SELECT 
-                    user_id,
-                    grade,
-                    CASE 
-                        WHEN grade = 1 THEN 'Starter'
-                        WHEN grade = 2 THEN 'Regular'
-                        WHEN grade = 3 THEN 'Pro'
-                        ELSE 'Unknown'
-                    END as grade_name,
-                    SUM(count) as total_races,
-                    ROUND(SUM(count) * 100.0 / SUM(SUM(count)) OVER (PARTITION BY user_id), 2) as pct_of_total
-                FROM player_daily_fact_grade
-                WHERE user_id IN ({TARGET_USER_IDS})
-                    AND grade > 0
-                GROUP BY user_id, grade
-                ORDER BY user_id, grade
-            """,
-            
-            # 14. Track Preferences by Bot
-            'Bot_Track_Preferences': f"""
-                SELECT 
-                    user_id,
-                    track_id,
-                    SUM(count) as total_races,
-                    ROUND(SUM(count) * 100.0 / SUM(SUM(count)) OVER (PARTITION BY user_id), 2) as pct_of_total
-                FROM player_daily_fact_track
-                WHERE user_id IN ({TARGET_USER_IDS})
-                GROUP BY user_id, track_id
-                ORDER BY user_id, total_races DESC
-            """,
+        if mirror:
+            engine = create_mirror_engine(max_workers)
+        else:
+            engine = create_pooled_engine(get_database_config(), max_workers)
+        # Heavy read-only sections may go to a replica; the mirror is a single local file
+        router = create_router(engine, max_workers, [] if mirror else None)
+        queries = build_queries()
+        params = metric_params(get_bot_user_ids(), window_start)
+        section_order = PNL_SECTIONS + list(queries)
+        
+        # Large cohorts run as several bounded IN-lists instead of one giant one
+        batches = batch_params(params, split_user_ids(params['user_ids']))
+        if len(batches) > 1:
+            print(f"Splitting {len(params['user_ids'])} user ids into {len(batches)} batches")
+        
+        # Incremental sections are derived from stored partials instead of full queries
+        if incremental:
+            for key in INCREMENTAL_SECTIONS:
+                queries.pop(key, None)
+        
+        # One snapshot scan replaces the per-section snapshot queries
+        shared_scan = shared_scan and not incremental
+        if shared_scan:
+            for key in SNAPSHOT_SCAN_SECTIONS:
+                queries.pop(key, None)
+        
+        # The race sections are folded from one streamed pass over the entrant join
+        if stream:
+            for key in STREAM_SECTIONS:
+                queries.pop(key, None)
+        
+        # Distance/surface sections are served from the per-day settled-race rollup
+        race_rollup = race_rollup and not incremental
+        if race_rollup:
+            for key in ROLLUP_SECTIONS:
+                queries.pop(key, None)
+        
+        # In-play exposure comes from the persistent set of open stakes
+        if open_positions:
+            queries.pop(POSITIONS_SECTION, None)
+        
+        # Run the queries concurrently; each worker checks out its own pooled connection
+        metrics = []
+        errors = {}
+        explain = get_explain_enabled()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            query_futures = {
+                key: [
+                    executor.submit(run_query, key, query, engine_for(router, key), batch, metrics, explain and i == 0, errors)
+                    for i, batch in enumerate(batches)
+                ]
+                for key, query in queries.items()
+            }
+            if not incremental:
+                rollup_futures = [executor.submit(fetch_pnl_rollup, engine_for(router, 'PnL_Daily_Rollup'), batch) for batch in batches]
+            if shared_scan:
+                scan_futures = [executor.submit(fetch_snapshot_frame, engine_for(router, 'Snapshot_Scan'), batch) for batch in batches]
+            if stream:
+                stream_futures = [
+                    executor.submit(stream_entrant_sections, engine_for(router, 'Entrant_Stream'), batch, metrics=metrics)
+                    for batch in batches
+                ]
             
-            # 15. Horse Distance Analysis (Inferred from bot pattern + horse performance)
-            'Horse_Distance_Analysis': f"""
-                SELECT 
-                    ph.user_id,
-                    ph.name as horse_name,
-                    ph.grade,
-                    hp.total_races,
-                    hp.wins,
-                    hp.avg_finish_position,
-                    hp.avg_stamina,
-                    hp.avg_speed,
-                    hp.avg_acceleration,
-                    -- Calculate likely distance specialization from stats
-                    CASE 
-                        WHEN hp.avg_stamina > 85 AND hp.avg_speed > 80 AND hp.avg_acceleration < 75 THEN 'Mile/Marathon'
-                        WHEN hp.avg_stamina < 75 AND hp.avg_acceleration > 75 THEN 'Sprint'
-                        WHEN hp.avg_stamina > 80 AND hp.avg_speed < 75 THEN 'Marathon'
-                        ELSE 'Mile'
-                    END as inferred_specialization,
-                    hp.avg_rating
-                FROM player_horse ph
-                INNER JOIN (
-                    SELECT 
-                        user_id,
-                        user_horse_id,
-                        name,
-                        COUNT(*) as total_races,
-                        SUM(CASE WHEN final_position = 1 THEN 1 ELSE 0 END) as wins,
-                        AVG(final_position) as avg_finish_position,
-                        AVG(stamina) as avg_stamina,
-                        AVG(speed) as avg_speed,
-                        AVG(acceleration) as avg_acceleration,
-                        AVG(rating) as avg_rating
-                    FROM full_WC_horse_snapshot
-                    WHERE user_id IN ({TARGET_USER_IDS})
-                    GROUP BY user_id, user_horse_id, name
-                ) hp ON ph.user_id = hp.user_id
-                WHERE ph.user_id IN ({TARGET_USER_IDS})
-                    AND ph.oc_shard > 0
-                ORDER BY ph.user_id, hp.total_races DESC
-            """
-        }
+            results = {
+                key: merge_result_batches([future.result() for future in futures], METRICS[key].get('limit'))
+                for key, futures in query_futures.items()
+            }
+        
+        # All PnL sections come from the one daily rollup
+        if not incremental:
+            try:
+                daily = merge_frame_batches([future.result() for future in rollup_futures])
+            except Exception as e:
+                print(f"ERROR PnL_Daily_Rollup: Error - {e}")
+                errors.update({key: str(e) for key in PNL_SECTIONS})
+                daily = None
+            results.update(derive_pnl_sections(daily))
         
-        data = {}
-        for key, query in queries.items():
+        if shared_scan:
             try:
-                df = pd.read_sql(query, engine)
-                data[key] = df.to_dict('records')
-                print(f"SUCCESS {key}: {len(df)} records")
-                
-                # Debug: Show sample data for key queries
-                if key in ['Total_PnL', 'Reserve_Balance', 'In_Play_Balance'] and len(data[key]) > 0:
-                    print(f"   Sample data: {data[key][0]}")
-                    
+                snapshots = merge_frame_batches([future.result() for future in scan_futures])
             except Exception as e:
-                print(f"ERROR {key}: Error - {e}")
-                data[key] = []
+                print(f"ERROR Snapshot_Scan: Error - {e}")
+                errors.update({key: str(e) for key in SNAPSHOT_SCAN_SECTIONS})
+                snapshots = None
+            results.update(compute_snapshot_sections(snapshots, results.get('Horse_Inventory', [])))
         
+        if stream:
+            try:
+                # Complete races are capped per bot, and a bot never spans two batches
+                parts = [future.result() for future in stream_futures]
+                results.update({
+                    key: merge_record_batches([part[key] for part in parts])
+                    for key in STREAM_SECTIONS
+                })
+            except Exception as e:
+                print(f"ERROR Entrant_Stream: Error - {e}")
+                errors.update({key: str(e) for key in STREAM_SECTIONS})
+                results.update({key: [] for key in STREAM_SECTIONS})
+        
+        if race_rollup:
+            results.update(refresh_race_rollup(engine, TARGET_USER_IDS, batches, rebuild=rebuild, errors=errors, metrics=metrics))
+        
+        if open_positions:
+            results.update(refresh_open_positions(engine, TARGET_USER_IDS, batches, rebuild=rebuild, errors=errors, metrics=metrics))
+        
+        if incremental:
+            results.update(refresh_incremental(
+                engine, TARGET_USER_IDS, params,
+                results.get('Horse_Inventory', []), rebuild=rebuild, batches=batches, errors=errors,
+                metrics=metrics,
+            ))
+        
+        try:
+            record_run_metrics(metrics)
+        except Exception as e:
+            print(f"ERROR Query metrics: Error - {e}")
+        
+        dispose_router(router)
+        
+        # Keep a stable section order
+        data = {key: results[key] for key in section_order}
+        
+        # Sections that failed or missed their deadline keep their last published rows
+        if errors:
+            carry_last_good(data, errors)
+        record_freshness([key for key in section_order if key not in errors], errors)
         return data
         
     except Exception as e:
         print(f"Database connection failed: {e}")
-        return None
+        # Republish the last snapshot with every section marked stale
+        data = load_published_sections()
+        if not data:
+            return None
+        record_freshness([], {key: f"database unavailable - {e}" for key in data})
+        print(f"STALE: republishing the last {len(data)} published sections")
+        return data
 
-def save_data_to_files(data):
+def save_data_to_files(data, output_format=None):
     """Save data to JSON files for the dashboard"""
     if data is None:
         print("No data to save")
         return
     
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # Serialize once and reuse the bytes for the data file and its compressed copies
+    blob = serialize_bot_data(data, output_format)
     
     # Save main data file
     data_file = 'bot_data.json'
-    with open(data_file, 'w') as f:
-        json.dump(data, f, indent=2, default=str)
-    print(f"Data saved to {data_file}")
+    write_atomic(data_file, blob)
+    print(f"Data saved to {data_file} ({len(blob):,} bytes)")
+    
+    for compressed_file in write_compressed_siblings(data_file, blob):
+        print(f"Compressed copy saved to {compressed_file} ({os.path.getsize(compressed_file):,} bytes)")
+    
+    # Save one file per section plus the manifest the dashboard polls
+    changed = None
+    try:
+        markers = freshness_markers(load_freshness(), data)
+        manifest, changed, replaced = write_section_files(data, output_format, markers=markers)
+        print(f"Section files saved ({len(changed)} of {len(manifest['sections'])} changed)")
+        
+        # Append the row-level patch from the previous snapshot to the delta feed
+        delta_log = update_delta_feed(manifest, changed, replaced, data)
+        print(f"Delta feed at snapshot {delta_log['snapshot']} ({len(delta_log['patches'])} patches kept)")
+    except Exception as e:
+        print(f"ERROR Section files: Error - {e}")
     
     # Save timestamp file
     timestamp_file = 'last_updated.txt'
@@ -536,45 +320,76 @@ def save_data_to_files(data):
         f.write(datetime.now().isoformat())
     print(f"Timestamp saved to {timestamp_file}")
     
-    # Create backup
-    backup_file = f'backup_bot_data_{timestamp}.json'
-    with open(backup_file, 'w') as f:
-        json.dump(data, f, indent=2, default=str)
-    print(f"Backup saved to {backup_file}")
+    # Create backup (deduplicated; only new chunks are stored) and apply retention.
+    # When no section changed the previous backup already holds this data.
+    if changed == []:
+        print("Backup skipped (no section changed)")
+        return
+    try:
+        snapshot_id, new_objects, stored_bytes = save_backup(data)
+        print(f"Backup saved as snapshot {snapshot_id} ({new_objects} new chunks, {stored_bytes:,} bytes)")
+        removed_snapshots, removed_objects = prune_backups()
+        if removed_snapshots:
+            print(f"Pruned {removed_snapshots} old backups ({removed_objects} chunks)")
+    except Exception as e:
+        print(f"ERROR Backup: Error - {e}")
+
+# Per-bot figures joined onto Total_PnL for the summary report: (section, column)
+SUMMARY_COLUMNS = [
+    ('Reserve_Balance', 'reserve_balance_IGGT'),
+    ('In_Play_Balance', 'in_play_balance_IGGT'),
+    ('Races_Entered', 'races_entered'),
+]
+
+def build_summary_frame(data):
+    """One row per bot with PnL, balances and races joined on user_id"""
+    BOT_NAMES, _ = get_bot_config()
+    
+    summary = pd.DataFrame(section_frame(data.get('Total_PnL')), columns=['user_id', 'total_pnl_IGGT'])
+    for section, column in SUMMARY_COLUMNS:
+        frame = pd.DataFrame(section_frame(data.get(section)), columns=['user_id', column])
+        summary = summary.merge(frame.drop_duplicates('user_id'), on='user_id', how='left')
+    
+    numeric = ['total_pnl_IGGT'] + [column for _, column in SUMMARY_COLUMNS]
+    summary[numeric] = summary[numeric].apply(pd.to_numeric, errors='coerce').fillna(0)
+    summary['races_entered'] = summary['races_entered'].astype(int)
+    summary['bot_name'] = summary['user_id'].map(BOT_NAMES).fillna('Bot ' + summary['user_id'].astype(str))
+    summary['rating'] = np.select(
+        [summary['total_pnl_IGGT'] > 3000, summary['total_pnl_IGGT'] > 2000],
+        ['Excellent', 'Good'],
+        default='Needs Attention',
+    )
+    return summary
 
 def generate_summary_report(data):
     """Generate a summary report"""
-    if not data or not data.get('total_pnl'):
+    if not data or not len(section_frame(data.get('Total_PnL'))):
         return "No data available"
     
-    BOT_NAMES, _ = get_bot_config()
+    summary = build_summary_frame(data)
+    report_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    # Create summary
-    summary_data = []
-    for record in data['total_pnl']:
-        user_id = record['user_id']
-        bot_name = BOT_NAMES.get(user_id, f"Bot {user_id}")
-        total_pnl = record['total_pnl_IGGT']
-        
-        # Get other metrics
-        reserve = next((r['reserve_balance_IGGT'] for r in data['reserve_balance'] if r['user_id'] == user_id), 0)
-        in_play = next((r['in_play_balance_IGGT'] for r in data['in_play_balance'] if r['user_id'] == user_id), 0)
-        races = next((r['races_entered'] for r in data['races_entered'] if r['user_id'] == user_id), 0)
-        
-        summary_data.append({
-            'Bot Name': bot_name,
-            'User ID': user_id,
-            'Total P&L (IGGT)': f"{total_pnl:,.2f}",
-            'Reserve Balance (IGGT)': f"{reserve:,.2f}",
-            'In-Play Balance (IGGT)': f"{in_play:,.2f}",
-            'Total Races': races,
-            'Performance Rating': 'Excellent' if total_pnl > 3000 else 'Good' if total_pnl > 2000 else 'Needs Attention'
-        })
+    # Format only when rendering; totals and ranking stay numeric
+    pnl = summary['total_pnl_IGGT'].map('{:,.2f}'.format)
+    reserve = summary['reserve_balance_IGGT'].map('{:,.2f}'.format)
+    in_play = summary['in_play_balance_IGGT'].map('{:,.2f}'.format)
+    label = summary['bot_name'] + ' (' + summary['user_id'].astype(str) + ')'
+    ranked = summary['total_pnl_IGGT'].sort_values(ascending=False, kind='stable').index
     
-    # Generate report
-    report_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    top_performers = (
+        pd.Series(range(1, len(ranked) + 1), index=ranked).astype(str) + '. '
+        + label[ranked] + ': ' + pnl[ranked] + ' IGGT | ' + summary.loc[ranked, 'rating']
+    )
+    breakdown = (
+        '\nBot: ' + label
+        + '\n  Total P&L: ' + pnl + ' IGGT'
+        + '\n  Reserve Balance: ' + reserve + ' IGGT'
+        + '\n  In-Play Balance: ' + in_play + ' IGGT'
+        + '\n  Total Races: ' + summary['races_entered'].astype(str)
+        + '\n  Performance: ' + summary['rating']
+    )
     
-    report = f"""
+    return f"""
 BOT PERFORMANCE REPORT - {report_date}
 {'='*80}
 
@@ -582,58 +397,87 @@ EXECUTIVE SUMMARY
 {'-'*50}
 
 OVERALL PERFORMANCE
-• Total Bots Active: {len(summary_data)}
-• Total Races Entered: {sum(int(s['Total Races']) for s in summary_data)}
-• Total P&L (All Bots): {sum(float(s['Total P&L (IGGT)'].replace(',', '')) for s in summary_data):,.2f} IGGT
-• Total Reserve Balance: {sum(float(s['Reserve Balance (IGGT)'].replace(',', '')) for s in summary_data):,.2f} IGGT
-• Total In-Play Exposure: {sum(float(s['In-Play Balance (IGGT)'].replace(',', '')) for s in summary_data):,.2f} IGGT
+• Total Bots Active: {len(summary)}
+• Total Races Entered: {summary['races_entered'].sum()}
+• Total P&L (All Bots): {summary['total_pnl_IGGT'].sum():,.2f} IGGT
+• Total Reserve Balance: {summary['reserve_balance_IGGT'].sum():,.2f} IGGT
+• Total In-Play Exposure: {summary['in_play_balance_IGGT'].sum():,.2f} IGGT
 
 TOP PERFORMERS
 {'-'*50}
-"""
-    
-    # Sort by performance
-    sorted_data = sorted(summary_data, key=lambda x: float(x['Total P&L (IGGT)'].replace(',', '')), reverse=True)
-    
-    for i, bot in enumerate(sorted_data, 1):
-        report += f"{i}. {bot['Bot Name']} ({bot['User ID']}): {bot['Total P&L (IGGT)']} IGGT | {bot['Performance Rating']}\n"
-    
-    report += f"""
+""" + "\n".join(top_performers) + f"""
+
 DETAILED BREAKDOWN
 {'-'*50}
-"""
-    
-    # Add detailed table
-    for bot in summary_data:
-        report += f"""
-Bot: {bot['Bot Name']} ({bot['User ID']})
-  Total P&L: {bot['Total P&L (IGGT)']} IGGT
-  Reserve Balance: {bot['Reserve Balance (IGGT)']} IGGT
-  In-Play Balance: {bot['In-Play Balance (IGGT)']} IGGT
-  Total Races: {bot['Total Races']}
-  Performance: {bot['Performance Rating']}
-"""
-    
-    report += f"""
+""" + "\n".join(breakdown) + f"""
+
 
 Report Generated: {report_date}
 Internal Use Only - Bot Performance Tracking
 """
-    
-    return report
 
-def main():
+def run_refresh_daemon(args):
+    """Run the updater as a long-lived daemon with a warm engine (see refresh_daemon.py)"""
+    # Every refresh group may hold a connection at the same time
+    max_workers = max(args.workers or get_fetch_workers(), len(REFRESH_GROUPS))
+    if args.mirror:
+        engine = create_mirror_engine(max_workers)
+    else:
+        engine = create_pooled_engine(get_database_config(), max_workers)
+    router = create_router(engine, max_workers, [] if args.mirror else None)
+    params = metric_params(get_bot_user_ids(), args.since or get_pnl_window_start())
+    run_daemon(router, params, lambda data: save_data_to_files(data, args.format), len(REFRESH_GROUPS),
+               open_positions=args.open_positions)
+
+def parse_args(argv=None):
+    """Parse command line options for the updater"""
+    parser = argparse.ArgumentParser(description="Fetch bot performance data for the dashboard")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Max queries to run in parallel (default: FETCH_MAX_WORKERS or 6)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only read rows added since the last run and merge them into stored aggregates")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="With --incremental, --race-rollup or --open-positions, discard the stored state and rebuild it from scratch")
+    parser.add_argument('--since', default=None,
+                        help="Start date (YYYY-MM-DD) of the PnL window (default: PNL_WINDOW_START or 2025-09-18)")
+    parser.add_argument('--mirror', action='store_true',
+                        help="Read from the local mirror (see local_mirror.py) instead of the live database")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream the entrant/event join in chunks with bounded memory")
+    parser.add_argument('--race-rollup', action='store_true',
+                        help="Serve the distance/surface sections from the per-day rollup of settled races")
+    parser.add_argument('--open-positions', action='store_true',
+                        help="Compute In_Play_Balance from the persistent set of open stakes")
+    parser.add_argument('--shared-scan', action='store_true',
+                        help="Read full_WC_horse_snapshot once and compute the horse sections locally")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                        help="Layout of bot_data.json (default: OUTPUT_FORMAT or records)")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running and refresh each group of sections on its own interval")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to update bot data"""
+    args = parse_args(argv)
+    
     print("Bot Performance Data Updater")
     print("=" * 50)
     
+    if args.daemon:
+        run_refresh_daemon(args)
+        return
+    
     try:
         print("Fetching data from database...")
-        data = fetch_bot_data()
+        data = fetch_bot_data(max_workers=args.workers, incremental=args.incremental,
+                              rebuild=args.rebuild, shared_scan=args.shared_scan,
+                              window_start=args.since, mirror=args.mirror,
+                              stream=args.stream, race_rollup=args.race_rollup,
+                              open_positions=args.open_positions)
         
         if data:
             print("Saving data to files...")
-            save_data_to_files(data)
+            save_data_to_files(data, args.format)
             
             print("Generating summary report...")
             report = generate_summary_report(data)
@@ -0,0 +1,570 @@
+"""
+Declarative metric registry for the bot performance updater
+
+Each dashboard section is described by a spec (source table, joins, grouping
+keys, aggregates, filters and time window) and compiled into a parameter-bound
+SQL statement. Bot user IDs are bound as an expanding parameter and time windows
+compare the raw indexed column, so MySQL can range-scan instead of evaluating
+FROM_UNIXTIME() on every row.
+"""
+
+from sqlalchemy import text, bindparam
+
+def key(expr, alias=None):
+    """Grouping key: selected and repeated in GROUP BY"""
+    return {'expr': expr, 'alias': alias, 'group': True}
+
+def col(expr, alias=None):
+    """Selected column or aggregate that is not part of GROUP BY"""
+    return {'expr': expr, 'alias': alias, 'group': False}
+
+# Shared label expressions
+GRADE_NAME = """CASE
+        WHEN {c} = 1 THEN 'Starter'
+        WHEN {c} = 2 THEN 'Regular'
+        WHEN {c} = 3 THEN 'Pro'
+        ELSE 'Unknown'
+    END"""
+
+DISTANCE_CATEGORY = """CASE
+        WHEN {c} IN (1, 2) THEN 'Sprint'
+        WHEN {c} IN (3, 4, 5) THEN 'Mile'
+        WHEN {c} = 6 THEN 'Marathon'{other}
+    END"""
+
+WINS = "SUM(CASE WHEN {c} = 1 THEN 1 ELSE 0 END)"
+TOP_3 = "SUM(CASE WHEN {c} <= 3 THEN 1 ELSE 0 END)"
+PCT_OF_TOTAL = "ROUND(SUM(count) * 100.0 / SUM(SUM(count)) OVER (PARTITION BY user_id), 2)"
+
+# Rows kept per group by the race history sections
+RECENT_RACES_PER_HORSE = 20
+COMPLETE_RACES_PER_BOT = 400
+
+SNAPSHOT_JOINS = [
+    """INNER JOIN full_WC_entrant ent ON hs._id = ent.horse_snapshot_id
+    AND hs.Zone = ent.Zone""",
+    """INNER JOIN full_WC_event e ON ent.event_id = e._id
+    AND ent.Zone = e.Zone""",
+]
+
+# Per-horse stats feeding Horse_Distance_Analysis, one row per user_horse_id
+HORSE_STATS = {
+    'source': 'full_WC_horse_snapshot',
+    'user_column': 'user_id',
+    'filters': ['user_horse_id > 0'],
+    'columns': [
+        key('user_id'),
+        key('user_horse_id'),
+        col('COUNT(*)', 'total_races'),
+        col(WINS.format(c='final_position'), 'wins'),
+        col('AVG(final_position)', 'avg_finish_position'),
+        col('AVG(stamina)', 'avg_stamina'),
+        col('AVG(speed)', 'avg_speed'),
+        col('AVG(acceleration)', 'avg_acceleration'),
+        col('AVG(rating)', 'avg_rating'),
+    ],
+}
+
+# Raw snapshot x entrant x event rows for the streaming race sections (see entrant_stream.py)
+ENTRANT_STREAM = {
+    'source': 'full_WC_horse_snapshot hs',
+    'joins': SNAPSHOT_JOINS,
+    'user_column': 'hs.user_id',
+    'columns': [
+        col('hs.user_id'),
+        col('hs.user_horse_id'),
+        col('hs.name'),
+        col('ent.event_id'),
+        col('e.distance'),
+        col('e.surface'),
+        col('e.weather'),
+        col('e.`condition`', '`condition`'),
+        col('hs.final_position'),
+        col('hs.rating'),
+        col('e.track_name'),
+        col('hs.created_ts'),
+        col('hs.Zone'),
+        col('hs._id', 'snapshot_id'),
+    ],
+}
+
+# Raw snapshot columns for the shared horse scan (see horse_snapshot_scan.py)
+SNAPSHOT_SCAN = {
+    'source': 'full_WC_horse_snapshot',
+    'user_column': 'user_id',
+    'columns': [
+        col(name) for name in [
+            'user_id', 'user_horse_id', 'name', 'generation', 'grade', 'gender', 'age', 'trainer_id',
+            'final_position', 'rating', 'speed', 'stamina', 'acceleration', 'career_earnings',
+            'speed_trait_1', 'speed_trait_2', 'speed_trait_1_pwr', 'speed_trait_2_pwr',
+            'stamina_trait_1', 'stamina_trait_2', 'stamina_trait_1_pwr', 'stamina_trait_2_pwr',
+            'acceleration_trait_1', 'acceleration_trait_2',
+            'acceleration_trait_1_pwr', 'acceleration_trait_2_pwr',
+            'skill_first_out', 'skill_front', 'skill_rail', 'skill_closing', 'skill_dueling',
+            'skill_turning', 'skill_working', 'skill_breezing', 'skill_drafting',
+            'skill_final_kick', 'skill_overtaking',
+        ]
+    ],
+}
+
+# Per-user daily PnL rollup; Total, Daily, Weekly and Rolling PnL are derived from it
+PNL_DAILY_ROLLUP = {
+    'source': 'player_token_transaction',
+    'user_column': 'user_id',
+    'filters': ['ctx_type = 1'],
+    'window': {'column': 'created_at', 'since': ':window_start'},
+    'columns': [
+        key('user_id'),
+        key('DATE(FROM_UNIXTIME(created_at))', 'date'),
+        col('SUM(amount)', 'amount_sum'),
+    ],
+    'order_by': ['user_id', 'date'],
+}
+
+METRICS = {
+    # ============================================
+    # BOT-LEVEL QUERIES (Original)
+    # ============================================
+    'Reserve_Balance': {
+        'source': 'player_token_account',
+        'user_column': 'user_id',
+        'columns': [
+            col('user_id'),
+            col('amount / 1000000', 'reserve_balance_IGGT'),
+        ],
+    },
+    'In_Play_Balance': {
+        'source': 'player_token_transaction t',
+        'joins': ['LEFT JOIN full_WC_result r ON t.source_trx_id = r.event_id'],
+        'user_column': 't.user_id',
+        'filters': ['t.amount < 0', 't.ctx_type = 1', 'r.event_id IS NULL'],
+        'window': {'column': 't.created_at', 'last_seconds': 24 * 3600},
+        'columns': [
+            key('t.user_id'),
+            col('SUM(ABS(t.amount)) / 1000000', 'in_play_balance_IGGT'),
+        ],
+    },
+    'Races_Entered': {
+        'source': 'full_WC_horse_snapshot',
+        'user_column': 'user_id',
+        'columns': [
+            key('user_id'),
+            col('COUNT(*)', 'races_entered'),
+        ],
+    },
+    # ============================================
+    # HORSE-LEVEL QUERIES
+    # ============================================
+
+    # 1. Individual Horse Performance Summary
+    'Horse_Performance': {
+        'source': 'full_WC_horse_snapshot hs',
+        'user_column': 'hs.user_id',
+        'filters': ['hs.user_horse_id > 0'],
+        'columns': [
+            key('hs.user_id'),
+            key('hs.user_horse_id'),
+            key('hs.name', 'horse_name'),
+            key('hs.generation', 'gen'),
+            key('hs.grade'),
+            key('hs.gender'),
+            key('hs.age'),
+            key('hs.trainer_id'),
+            col('COUNT(DISTINCT hs._id)', 'total_races'),
+            col('AVG(hs.final_position)', 'avg_finish_position'),
+            col(WINS.format(c='hs.final_position'), 'wins'),
+            col(TOP_3.format(c='hs.final_position'), 'top_3_finishes'),
+            col('AVG(hs.rating)', 'avg_rating'),
+            col('AVG(hs.speed)', 'avg_speed'),
+            col('AVG(hs.stamina)', 'avg_stamina'),
+            col('AVG(hs.acceleration)', 'avg_acceleration'),
+            col('SUM(hs.career_earnings) / 1000000', 'total_career_earnings_IGGT'),
+        ],
+        'order_by': ['hs.user_id', 'total_races DESC'],
+    },
+
+    # 2. Recent Race Performance (latest races with details)
+    'Recent_Race_Performance': {
+        'source': 'full_WC_horse_snapshot',
+        'user_column': 'user_id',
+        'filters': ['final_position IS NOT NULL'],
+        'columns': [
+            col('user_id'),
+            col('user_horse_id'),
+            col('name', 'horse_name'),
+            col('_id', 'snapshot_id'),
+            col('created_ts', 'race_date'),
+            col('final_position'),
+            col('grade'),
+            col('rating'),
+            col('speed'),
+            col('stamina'),
+            col('acceleration'),
+            col('wins'),
+            col('shows'),
+            col('place'),
+            col('career_earnings / 1000000', 'career_earnings_IGGT'),
+            col('trend'),
+        ],
+        # Newest races of every horse; older ones are paged with race_history.py
+        'per_group_limit': {
+            'partition': ['user_id', 'user_horse_id'],
+            'order': ['created_ts DESC', '_id DESC'],
+            'rows': RECENT_RACES_PER_HORSE,
+        },
+        'order_by': ['user_id', 'race_date DESC', 'snapshot_id DESC'],
+    },
+
+    # 3. Horse Performance by Grade
+    'Horse_Performance_By_Grade': {
+        'source': 'full_WC_horse_snapshot',
+        'user_column': 'user_id',
+        'filters': ['grade IS NOT NULL'],
+        'columns': [
+            key('user_id'),
+            key('user_horse_id'),
+            key('name', 'horse_name'),
+            key('grade'),
+            col(GRADE_NAME.format(c='grade'), 'grade_name'),
+            col('COUNT(DISTINCT _id)', 'races_at_grade'),
+            col('AVG(final_position)', 'avg_position'),
+            col(WINS.format(c='final_position'), 'wins'),
+            col(TOP_3.format(c='final_position'), 'top_3_finishes'),
+            col('AVG(rating)', 'avg_rating'),
+        ],
+        'order_by': ['user_id', 'user_horse_id', 'grade'],
+    },
+
+    # 4. Horse Traits Analysis (from snapshot data)
+    'Horse_Traits_Performance': {
+        'source': 'full_WC_horse_snapshot',
+        'user_column': 'user_id',
+        'columns': [
+            key('user_id'),
+            key('user_horse_id'),
+            key('name', 'horse_name'),
+            col('COUNT(DISTINCT _id)', 'total_races'),
+            col('AVG(final_position)', 'avg_position'),
+        ] + [
+            column
+            for trait in ['speed', 'stamina', 'acceleration']
+            for column in [
+                col(f'MAX({trait}_trait_1)', f'{trait}_trait_1'),
+                col(f'MAX({trait}_trait_2)', f'{trait}_trait_2'),
+                col(f'AVG({trait}_trait_1_pwr)', f'{trait}_trait_1_power'),
+                col(f'AVG({trait}_trait_2_pwr)', f'{trait}_trait_2_power'),
+            ]
+        ],
+        'order_by': ['user_id', 'total_races DESC'],
+    },
+
+    # 5. Horse Skills from Snapshot
+    'Horse_Skills_From_Races': {
+        'source': 'full_WC_horse_snapshot',
+        'user_column': 'user_id',
+        'columns': [
+            key('user_id'),
+            key('user_horse_id'),
+            key('name', 'horse_name'),
+            col('COUNT(*)', 'races_analyzed'),
+        ] + [
+            col(f'AVG(skill_{skill})', f'avg_skill_{skill}')
+            for skill in [
+                'first_out', 'front', 'rail', 'closing', 'dueling', 'turning',
+                'working', 'breezing', 'drafting', 'final_kick', 'overtaking',
+            ]
+        ],
+        'order_by': ['user_id', 'races_analyzed DESC'],
+    },
+
+    # 10. Stable Composition (Horses per bot) - Using player_horse
+    'Stable_Composition': {
+        'source': 'player_horse',
+        'user_column': 'user_id',
+        'filters': ['oc_shard > 0'],
+        'columns': [
+            key('user_id'),
+            col('COUNT(*)', 'total_horses'),
+            col('SUM(CASE WHEN grade = 1 THEN 1 ELSE 0 END)', 'grade_1_horses'),
+            col('SUM(CASE WHEN grade = 2 THEN 1 ELSE 0 END)', 'grade_2_horses'),
+            col('SUM(CASE WHEN grade = 3 THEN 1 ELSE 0 END)', 'grade_3_horses'),
+            col('SUM(CASE WHEN bloodline = 1 THEN 1 ELSE 0 END)', 'bloodline_1_horses'),
+            col('SUM(CASE WHEN bloodline = 2 THEN 1 ELSE 0 END)', 'bloodline_2_horses'),
+            col('SUM(CASE WHEN status = 0 THEN 1 ELSE 0 END)', 'active_horses'),
+            col('AVG(gen)', 'avg_generation'),
+        ],
+        'order_by': ['user_id'],
+    },
+
+    # 11. Horse Inventory (List of all bot horses)
+    'Horse_Inventory': {
+        'source': 'player_horse',
+        'user_column': 'user_id',
+        'filters': ['oc_shard > 0'],
+        'columns': [
+            col('user_id'),
+            col('_id', 'horse_id'),
+            col('name', 'horse_name'),
+            col('grade'),
+            col('bloodline'),
+            col('gen', 'generation'),
+            col('gender'),
+            col('age'),
+            col('trainer_id'),
+            col('status'),
+            col('horse_type_id'),
+            col('modified_utc', 'last_updated'),
+        ],
+        'order_by': ['user_id', 'grade DESC', 'name'],
+    },
+
+    # 12. ALL HORSES - Complete Distance Performance
+    'All_Horses_Distance_Performance': {
+        'source': 'full_WC_horse_snapshot hs',
+        'joins': SNAPSHOT_JOINS,
+        'user_column': 'hs.user_id',
+        'filters': ['e.distance IS NOT NULL'],
+        'columns': [
+            key('hs.user_id'),
+            key('hs.user_horse_id'),
+            key('hs.name', 'horse_name'),
+            key('e.distance'),
+            col("""CASE
+        WHEN e.distance = 1 THEN '1000m (5f)'
+        WHEN e.distance = 2 THEN '1200m (6f)'
+        WHEN e.distance = 3 THEN '1400m (7f)'
+        WHEN e.distance = 4 THEN '1600m (8f)'
+        WHEN e.distance = 5 THEN '1800m (9f)'
+        WHEN e.distance = 6 THEN '2000m (10f)'
+        ELSE 'Unknown'
+    END""", 'distance_name'),
+            col(DISTANCE_CATEGORY.format(c='e.distance', other="\n        ELSE 'Unknown'"), 'distance_category'),
+            col('COUNT(DISTINCT ent.event_id)', 'races_at_distance'),
+            col('AVG(hs.final_position)', 'avg_position'),
+            col('MIN(hs.final_position)', 'best_position'),
+            col('MAX(hs.final_position)', 'worst_position'),
+            col(WINS.format(c='hs.final_position'), 'wins'),
+            col(TOP_3.format(c='hs.final_position'), 'top_3_finishes'),
+            col('AVG(hs.rating)', 'avg_rating'),
+        ],
+        'order_by': ['hs.user_id', 'hs.user_horse_id', 'e.distance'],
+    },
+
+    # 13. ALL HORSES - Surface Performance (Dirt vs Turf)
+    'All_Horses_Surface_Performance': {
+        'source': 'full_WC_horse_snapshot hs',
+        'joins': SNAPSHOT_JOINS,
+        'user_column': 'hs.user_id',
+        'filters': ['e.surface IS NOT NULL'],
+        'columns': [
+            key('hs.user_id'),
+            key('hs.user_horse_id'),
+            key('hs.name', 'horse_name'),
+            key('e.surface'),
+            col("""CASE
+        WHEN e.surface = 1 THEN 'Dirt'
+        WHEN e.surface = 2 THEN 'Turf'
+        ELSE 'Unknown'
+    END""", 'surface_name'),
+            key('e.weather'),
+            key('e.`condition`'),
+            col('COUNT(DISTINCT ent.event_id)', 'races'),
+            col('AVG(hs.final_position)', 'avg_position'),
+            col('MIN(hs.final_position)', 'best_position'),
+            col('MAX(hs.final_position)', 'worst_position'),
+            col(WINS.format(c='hs.final_position'), 'wins'),
+            col(TOP_3.format(c='hs.final_position'), 'top_3_finishes'),
+            col('AVG(hs.rating)', 'avg_rating'),
+        ],
+        'order_by': ['hs.user_id', 'hs.user_horse_id', 'races DESC'],
+    },
+
+    # 14. ALL HORSES - Complete Race Details (with distance & surface)
+    'All_Horses_Complete_Races': {
+        'source': 'full_WC_horse_snapshot hs',
+        'joins': SNAPSHOT_JOINS,
+        'user_column': 'hs.user_id',
+        'columns': [
+            col('hs.user_id'),
+            col('hs.user_horse_id'),
+            col('hs.name', 'horse_name'),
+            col('ent.event_id'),
+            col('e.distance'),
+            col(DISTANCE_CATEGORY.format(c='e.distance', other=''), 'distance_category'),
+            col('e.surface'),
+            col("CASE WHEN e.surface = 1 THEN 'Dirt' ELSE 'Turf' END", 'surface_name'),
+            col('hs.final_position'),
+            col('hs.rating'),
+            col('e.track_name'),
+            col('hs.created_ts', 'race_date'),
+            col('hs.Zone'),
+            col('hs._id', 'snapshot_id'),
+        ],
+        # Newest races of every bot; older ones are paged with race_history.py
+        'per_group_limit': {
+            'partition': ['hs.user_id'],
+            'order': ['hs.created_ts DESC', 'hs._id DESC'],
+            'rows': COMPLETE_RACES_PER_BOT,
+        },
+        'order_by': ['user_id', 'race_date DESC', 'snapshot_id DESC'],
+    },
+
+    # 14. Distance Breakdown by Bot (which races they enter)
+    'Bot_Distance_Breakdown': {
+        'source': 'player_daily_fact_distance',
+        'user_column': 'user_id',
+        'columns': [
+            key('user_id'),
+            key('distance'),
+            col("""CASE
+        WHEN distance = 1 THEN '1000m'
+        WHEN distance = 2 THEN '1200m'
+        WHEN distance = 3 THEN '1400m'
+        WHEN distance = 4 THEN '1600m'
+        WHEN distance = 5 THEN '1800m'
+        WHEN distance = 6 THEN '2000m'
+        ELSE 'Unknown'
+    END""", 'distance_name'),
+            col(DISTANCE_CATEGORY.format(c='distance', other=''), 'distance_category'),
+            col('SUM(count)', 'total_races'),
+            col(PCT_OF_TOTAL, 'pct_of_total'),
+        ],
+        'order_by': ['user_id', 'distance'],
+    },
+
+    # 13. Grade Distribution by Bot
+    'Bot_Grade_Distribution': {
+        'source': 'player_daily_fact_grade',
+        'user_column': 'user_id',
+        'filters': ['grade > 0'],
+        'columns': [
+            key('user_id'),
+            key('grade'),
+            col(GRADE_NAME.format(c='grade'), 'grade_name'),
+            col('SUM(count)', 'total_races'),
+            col(PCT_OF_TOTAL, 'pct_of_total'),
+        ],
+        'order_by': ['user_id', 'grade'],
+    },
+
+    # 14. Track Preferences by Bot
+    'Bot_Track_Preferences': {
+        'source': 'player_daily_fact_track',
+        'user_column': 'user_id',
+        'columns': [
+            key('user_id'),
+            key('track_id'),
+            col('SUM(count)', 'total_races'),
+            col(PCT_OF_TOTAL, 'pct_of_total'),
+        ],
+        'order_by': ['user_id', 'total_races DESC'],
+    },
+
+    # 15. Horse Distance Analysis (Inferred from bot pattern + horse performance)
+    'Horse_Distance_Analysis': {
+        'source': 'player_horse ph',
+        # player_horse._id is the user_horse_id every snapshot of the horse carries
+        'joins': [('INNER JOIN', HORSE_STATS, 'hp', 'ph.user_id = hp.user_id AND ph._id = hp.user_horse_id')],
+        'user_column': 'ph.user_id',
+        'filters': ['ph.oc_shard > 0'],
+        'columns': [
+            col('ph.user_id'),
+            col('ph._id', 'horse_id'),
+            col('ph.name', 'horse_name'),
+            col('ph.grade'),
+            col('hp.total_races'),
+            col('hp.wins'),
+            col('hp.avg_finish_position'),
+            col('hp.avg_stamina'),
+            col('hp.avg_speed'),
+            col('hp.avg_acceleration'),
+            # Likely distance specialization from stats
+            col("""CASE
+        WHEN hp.avg_stamina > 85 AND hp.avg_speed > 80 AND hp.avg_acceleration < 75 THEN 'Mile/Marathon'
+        WHEN hp.avg_stamina < 75 AND hp.avg_acceleration > 75 THEN 'Sprint'
+        WHEN hp.avg_stamina > 80 AND hp.avg_speed < 75 THEN 'Marathon'
+        ELSE 'Mile'
+    END""", 'inferred_specialization'),
+            col('hp.avg_rating'),
+        ],
+        'order_by': ['ph.user_id', 'hp.total_races DESC'],
+    },
+}
+
+def render_column(column):
+    """Render one SELECT item"""
+    if column['alias']:
+        return f"{column['expr']} AS {column['alias']}"
+    return column['expr']
+
+def output_name(column):
+    """Name a column has in the result set"""
+    return column['alias'] or column['expr'].split('.')[-1]
+
+def render_sql(spec, indent='    '):
+    """Render a metric spec into parameterized SQL text"""
+    lines = ["SELECT"]
+    lines.append(",\n".join(f"{indent}{render_column(c)}" for c in spec['columns']))
+    lines.append(f"FROM {spec['source']}")
+
+    for join in spec.get('joins', []):
+        if isinstance(join, tuple):
+            # (join type, sub-spec, alias, condition)
+            join_type, subspec, alias, condition = join
+            subquery = render_sql(subspec, indent + '    ').replace('\n', '\n' + indent)
+            lines.append(f"{join_type} (\n{indent}{subquery}\n) {alias} ON {condition}")
+        else:
+            lines.append(join)
+
+    conditions = []
+    if spec.get('user_column'):
+        conditions.append(f"{spec['user_column']} IN :user_ids")
+    conditions.extend(spec.get('filters', []))
+    window = spec.get('window')
+    if window:
+        # Compare the bare column so an index on it can be range-scanned
+        if 'last_seconds' in window:
+            conditions.append(f"{window['column']} >= UNIX_TIMESTAMP() - {int(window['last_seconds'])}")
+        else:
+            conditions.append(f"{window['column']} >= UNIX_TIMESTAMP({window['since']})")
+    if conditions:
+        lines.append("WHERE " + f"\n{indent}AND ".join(conditions))
+
+    group_by = [c['expr'] for c in spec['columns'] if c['group']]
+    if group_by:
+        lines.append("GROUP BY " + ", ".join(group_by))
+
+    per_group = spec.get('per_group_limit')
+    if per_group:
+        # Keep the newest rows of every group instead of one global LIMIT, so busy
+        # bots/horses cannot crowd out quiet ones; ORDER BY uses output names here
+        rank = (f"ROW_NUMBER() OVER (PARTITION BY {', '.join(per_group['partition'])} "
+                f"ORDER BY {', '.join(per_group['order'])}) AS group_rank")
+        lines[1] = lines[1] + f",\n{indent}{rank}"
+        inner = "\n".join(lines).replace('\n', '\n' + indent)
+        names = ", ".join(output_name(c) for c in spec['columns'])
+        lines = [f"SELECT {names}", f"FROM (\n{indent}{inner}\n) ranked", f"WHERE group_rank <= {int(per_group['rows'])}"]
+
+    if spec.get('order_by'):
+        lines.append("ORDER BY " + ", ".join(spec['order_by']))
+    if spec.get('limit'):
+        lines.append(f"LIMIT {int(spec['limit'])}")
+
+    return "\n".join(lines)
+
+_compiled = {}
+
+def compile_metric(name, spec=None):
+    """Compile a metric into a bound statement, reusing the same statement object across runs"""
+    if name not in _compiled:
+        spec = spec or METRICS[name]
+        _compiled[name] = text(render_sql(spec)).bindparams(bindparam('user_ids', expanding=True))
+    return _compiled[name]
+
+def compile_metrics(names=None):
+    """Compile the requested metrics (all by default), keyed by section name"""
+    return {name: compile_metric(name) for name in (names or METRICS)}
+
+def metric_params(user_ids, window_start):
+    """Bind values shared by every metric statement"""
+    return {'user_ids': list(user_ids), 'window_start': window_start}
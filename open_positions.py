@@ -0,0 +1,159 @@
+"""
+Incrementally tracked open positions for In_Play_Balance
+
+Keeps the bots' unsettled race stakes in a persistent set keyed by
+source_trx_id (the event the stake was placed on). Each refresh adds the
+stakes created since the last one, then drops every position whose event now
+has a full_WC_result row. created_at only has second resolution, so each
+refresh re-reads INCREMENTAL_OVERLAP_SECONDS below the watermark and skips the
+transactions (by _id) it has already added. In_Play_Balance is summed from what is left, so a
+refresh costs one small read of new transactions plus one indexed lookup over
+the open events, and stakes older than 24 hours stay counted until they settle.
+"""
+
+import json
+import os
+import pandas as pd
+from sqlalchemy import bindparam, text
+from incremental_refresh import get_overlap_seconds, save_state
+from query_deadlines import query_deadline, section_timeout
+from query_metrics import timed_read_sql
+
+POSITIONS_VERSION = 2
+POSITIONS_SECTION = 'In_Play_Balance'
+
+NEW_STAKES_QUERY = """
+    SELECT
+        t._id,
+        t.user_id,
+        t.source_trx_id,
+        ABS(t.amount) AS amount,
+        t.created_at,
+        CASE WHEN EXISTS (
+            SELECT 1 FROM full_WC_result r WHERE r.event_id = t.source_trx_id
+        ) THEN 1 ELSE 0 END AS settled
+    FROM player_token_transaction t
+    WHERE t.amount < 0
+        AND t.ctx_type = 1
+        AND t.user_id IN :user_ids
+        AND t.created_at > :since_created_at
+"""
+
+SETTLED_EVENTS_QUERY = """
+    SELECT DISTINCT event_id
+    FROM full_WC_result
+    WHERE event_id IN :event_ids
+"""
+
+def get_positions_file():
+    """Get the open positions file from environment variables"""
+    return os.getenv('OPEN_POSITIONS_FILE', 'open_positions.json')
+
+def get_settle_batch_size():
+    """Get the maximum number of open events checked per settlement query"""
+    return max(int(os.getenv('SETTLE_BATCH_SIZE', '1000')), 1)
+
+def empty_positions(TARGET_USER_IDS):
+    """A position set with no stakes read yet"""
+    return {
+        'version': POSITIONS_VERSION,
+        'target_user_ids': TARGET_USER_IDS,
+        'created_at': 0,
+        # [created_at, _id] of the stakes read within the overlap below the watermark
+        'seen': [],
+        'positions': {},
+    }
+
+def load_positions(TARGET_USER_IDS, positions_file=None):
+    """Load the stored open positions, starting over if the format or bot set changed"""
+    positions_file = positions_file or get_positions_file()
+    if not os.path.exists(positions_file):
+        return empty_positions(TARGET_USER_IDS)
+    with open(positions_file) as f:
+        state = json.load(f)
+    if state.get('version') != POSITIONS_VERSION or state.get('target_user_ids') != TARGET_USER_IDS:
+        print("Open positions format or bot set changed - rebuilding open positions")
+        return empty_positions(TARGET_USER_IDS)
+    return state
+
+def add_new_stakes(state, stakes):
+    """Add unsettled stakes not read before to the set and advance the transaction watermark; returns how many"""
+    seen = {int(transaction_id) for _, transaction_id in state['seen']}
+    new = stakes[~stakes['_id'].astype('int64').isin(seen)] if not stakes.empty else stakes
+    open_stakes = new[pd.to_numeric(new['settled']) == 0] if not new.empty else new
+    for row in open_stakes.itertuples(index=False):
+        by_user = state['positions'].setdefault(str(int(row.source_trx_id)), {})
+        by_user[str(int(row.user_id))] = by_user.get(str(int(row.user_id)), 0) + float(row.amount)
+
+    if not stakes.empty:
+        state['created_at'] = max(int(pd.to_numeric(stakes['created_at']).max()), int(state['created_at']))
+    floor = int(state['created_at']) - get_overlap_seconds()
+    state['seen'] = [item for item in state['seen'] if item[0] > floor] + [
+        [int(created_at), int(transaction_id)]
+        for created_at, transaction_id in zip(new.get('created_at', []), new.get('_id', []))
+        if int(created_at) > floor
+    ]
+    return len(new)
+
+def settle_positions(state, engine):
+    """Drop the positions whose event has a result; returns how many were settled"""
+    event_ids = sorted(int(event_id) for event_id in state['positions'])
+    if not event_ids:
+        return 0
+    query = text(SETTLED_EVENTS_QUERY).bindparams(bindparam('event_ids', expanding=True))
+    size = get_settle_batch_size()
+    settled = []
+    with engine.connect() as conn, query_deadline(conn, section_timeout(POSITIONS_SECTION)):
+        for i in range(0, len(event_ids), size):
+            rows = conn.execute(query, {'event_ids': event_ids[i:i + size]}).fetchall()
+            settled.extend(int(row[0]) for row in rows)
+    for event_id in settled:
+        state['positions'].pop(str(event_id), None)
+    return len(settled)
+
+def in_play_records(state):
+    """In_Play_Balance records (user_id, in_play_balance_IGGT) from the open positions"""
+    totals = {}
+    for by_user in state['positions'].values():
+        for user_id, amount in by_user.items():
+            totals[int(user_id)] = totals.get(int(user_id), 0) + amount
+    return [
+        {'user_id': user_id, 'in_play_balance_IGGT': totals[user_id] / 1000000}
+        for user_id in sorted(totals)
+    ]
+
+def refresh_open_positions(engine, TARGET_USER_IDS, batches, rebuild=False, positions_file=None, errors=None,
+                           metrics=None):
+    """Add new stakes, settle finished events and return {'In_Play_Balance': records}
+
+    Reads run within the In_Play_Balance deadline and the stake reads' timings are added to metrics.
+    A failure is recorded in errors ({section: error}) so the section is served stale.
+    """
+    positions_file = positions_file or get_positions_file()
+    state = empty_positions(TARGET_USER_IDS) if rebuild else load_positions(TARGET_USER_IDS, positions_file)
+    query = text(NEW_STAKES_QUERY).bindparams(bindparam('user_ids', expanding=True))
+
+    # A failed refresh leaves the stored set and watermark alone for the next run
+    try:
+        parts = []
+        for batch in batches:
+            part, timing = timed_read_sql(query, engine, {
+                'user_ids': batch['user_ids'],
+                'since_created_at': int(state['created_at']) - get_overlap_seconds(),
+            }, section_timeout(POSITIONS_SECTION))
+            parts.append(part)
+            if metrics is not None:
+                timing['section'] = POSITIONS_SECTION
+                metrics.append(timing)
+        stakes = pd.concat(parts, ignore_index=True)
+        added = add_new_stakes(state, stakes)
+        settled = settle_positions(state, engine)
+        save_state(state, positions_file)
+        print(f"SUCCESS {POSITIONS_SECTION}: {added} new stakes, {settled} settled, "
+              f"{len(state['positions'])} open events")
+    except Exception as e:
+        print(f"ERROR {POSITIONS_SECTION}: Error - {e}")
+        if errors is not None:
+            errors[POSITIONS_SECTION] = str(e)
+
+    return {POSITIONS_SECTION: in_play_records(state)}
@@ -0,0 +1,79 @@
+"""
+PnL sections derived from a single per-user daily rollup
+
+Total_PnL, Daily_PnL, Weekly_PnL and the rolling-window figures in Rolling_PnL
+are all computed from one (user_id, date, amount_sum) rollup, so adding another
+window costs no extra database time.
+"""
+
+from datetime import date
+import numpy as np
+import pandas as pd
+from metric_registry import PNL_DAILY_ROLLUP, compile_metric
+from query_deadlines import section_timeout
+from query_metrics import timed_read_sql
+
+# Trailing windows (in calendar days, ending on the as-of date) reported in Rolling_PnL
+ROLLING_WINDOWS = {'1d': 1, '7d': 7, '30d': 30}
+
+PNL_SECTIONS = ['Total_PnL', 'Daily_PnL', 'Weekly_PnL', 'Rolling_PnL']
+
+def fetch_pnl_rollup(engine, params):
+    """Read the per-user daily PnL rollup for the reporting window"""
+    query = compile_metric('PnL_Daily_Rollup', PNL_DAILY_ROLLUP)
+    daily, _ = timed_read_sql(query, engine, params, section_timeout('PnL_Daily_Rollup'))
+    print(f"SUCCESS PnL_Daily_Rollup: {len(daily)} records")
+    return daily
+
+def iso_yearweek(dates):
+    """Year and ISO week as YYYYWW, matching MySQL YEARWEEK(date, 1)"""
+    iso = dates.dt.isocalendar()
+    return (iso['year'] * 100 + iso['week']).astype(int)
+
+def rolling_pnl(daily, as_of=None):
+    """Trailing-window PnL per user from prefix sums over a dense day grid"""
+    dates = pd.to_datetime(daily['date'])
+    end = max(pd.Timestamp(as_of or date.today()), dates.max()).normalize()
+    days = pd.date_range(dates.min(), end, freq='D')
+
+    matrix = (
+        daily.assign(date=dates)
+        .pivot_table(index='user_id', columns='date', values='amount_sum', aggfunc='sum', fill_value=0)
+        .reindex(columns=days, fill_value=0)
+    )
+    prefix = np.zeros((len(matrix), len(days) + 1))
+    prefix[:, 1:] = np.cumsum(matrix.to_numpy(dtype=float), axis=1)
+
+    rolling = pd.DataFrame({'user_id': matrix.index})
+    for label, length in ROLLING_WINDOWS.items():
+        rolling[f'pnl_{label}_IGGT'] = (prefix[:, -1] - prefix[:, max(len(days) - length, 0)]) / 1000000
+    rolling['pnl_all_time_IGGT'] = prefix[:, -1] / 1000000
+    rolling['as_of'] = end.date().isoformat()
+    return rolling
+
+def derive_pnl_sections(daily, as_of=None):
+    """Build every PnL section from a (user_id, date, amount_sum) daily rollup"""
+    if daily is None or daily.empty:
+        return {key: [] for key in PNL_SECTIONS}
+
+    daily = daily[['user_id', 'date', 'amount_sum']].copy()
+    daily['amount_sum'] = pd.to_numeric(daily['amount_sum']).astype(float)
+    dates = pd.to_datetime(daily['date'])
+    daily['date'] = dates.dt.strftime('%Y-%m-%d')
+    daily['week'] = iso_yearweek(dates)
+
+    total = daily.groupby('user_id', as_index=False)['amount_sum'].sum()
+    total['total_pnl_IGGT'] = total['amount_sum'] / 1000000
+
+    by_day = daily.groupby(['user_id', 'date'], as_index=False)['amount_sum'].sum()
+    by_day['daily_pnl_IGGT'] = by_day['amount_sum'] / 1000000
+
+    weekly = daily.groupby(['user_id', 'week'], as_index=False)['amount_sum'].sum()
+    weekly['weekly_pnl_IGGT'] = weekly['amount_sum'] / 1000000
+
+    return {
+        'Total_PnL': total[['user_id', 'total_pnl_IGGT']].to_dict('records'),
+        'Daily_PnL': by_day[['user_id', 'date', 'daily_pnl_IGGT']].to_dict('records'),
+        'Weekly_PnL': weekly[['user_id', 'week', 'weekly_pnl_IGGT']].to_dict('records'),
+        'Rolling_PnL': rolling_pnl(daily, as_of).to_dict('records'),
+    }
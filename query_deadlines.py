@@ -0,0 +1,92 @@
+"""
+Per-query deadlines
+
+Every section query runs under a time budget: QUERY_TIMEOUT_SECONDS by default,
+or the section's entry in QUERY_TIMEOUTS. MySQL enforces the budget on the
+server through the session's max_execution_time. A watchdog also cancels the
+statement from the client once the budget plus QUERY_CANCEL_GRACE_SECONDS has
+passed (KILL QUERY on MySQL, interrupt() on the SQLite mirror), which covers
+lock waits the server-side limit does not see. A section that misses its
+deadline fails on its own instead of stalling the whole refresh.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+def get_query_timeout():
+    """Get the default per-query time budget in seconds (0 disables deadlines)"""
+    return max(float(os.getenv('QUERY_TIMEOUT_SECONDS', '120')), 0)
+
+def get_query_timeouts():
+    """Per-section budgets, overridable with QUERY_TIMEOUTS=Horse_Performance=300,..."""
+    timeouts = {}
+    for item in os.getenv('QUERY_TIMEOUTS', '').split(','):
+        if '=' in item:
+            section, seconds = item.split('=', 1)
+            timeouts[section.strip()] = max(float(seconds), 0)
+    return timeouts
+
+def get_cancel_grace():
+    """Seconds past the budget before the client cancels a statement itself"""
+    return max(float(os.getenv('QUERY_CANCEL_GRACE_SECONDS', '5')), 0)
+
+def section_timeout(key):
+    """Time budget of one section's query"""
+    return get_query_timeouts().get(key, get_query_timeout())
+
+def kill_query(engine, thread_id):
+    """KILL QUERY from a connection outside the pool (the pool may be fully checked out)"""
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    raw = engine.dialect.connect(*cargs, **cparams)
+    try:
+        cursor = raw.cursor()
+        cursor.execute(f"KILL QUERY {int(thread_id)}")
+        cursor.close()
+    finally:
+        raw.close()
+
+@contextmanager
+def query_deadline(conn, seconds):
+    """Bound the statements run on conn inside the block to `seconds`"""
+    if not seconds:
+        yield
+        return
+
+    dialect = conn.dialect.name
+    if dialect == 'mysql':
+        # Server side: applies to every read-only SELECT on this session
+        conn.exec_driver_sql(f"SET SESSION max_execution_time = {int(seconds * 1000)}")
+        thread_id = conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+        cancel = lambda: kill_query(conn.engine, thread_id)
+    elif dialect == 'sqlite':
+        cancel = conn.connection.dbapi_connection.interrupt
+    else:
+        cancel = None
+
+    fired = threading.Event()
+    def on_deadline():
+        fired.set()
+        try:
+            cancel()
+        except Exception as e:
+            print(f"ERROR Query deadline: Error - {e}")
+    timer = threading.Timer(seconds + get_cancel_grace(), on_deadline) if cancel else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        yield
+    except Exception as e:
+        if fired.is_set():
+            raise TimeoutError(f"missed its {seconds:g}s deadline") from e
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+        if dialect == 'mysql' and not conn.invalidated:
+            # Pooled connections go back without the budget
+            try:
+                conn.exec_driver_sql("SET SESSION max_execution_time = 0")
+            except Exception:
+                pass
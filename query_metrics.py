@@ -0,0 +1,195 @@
+"""
+Per-query instrumentation for the dashboard refresh
+
+Every section query records wall time, time to first row, rows and approximate
+bytes transferred (estimated from a sample of rows). EXPLAIN plans are only
+recorded on a sampled share of runs (QUERY_EXPLAIN). Each run is appended as
+one JSON line to QUERY_METRICS_FILE, and a ranked slow-query summary is printed
+with a flag on any section that got markedly slower than its recent median.
+"""
+
+import json
+import os
+import random
+import time
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import bindparam, text
+from query_deadlines import query_deadline
+
+# Rows sampled to estimate the bytes a result set transferred
+BYTES_SAMPLE_ROWS = 200
+
+def get_metrics_file():
+    """Get the per-run query metrics file from environment variables"""
+    return os.getenv('QUERY_METRICS_FILE', 'query_metrics.jsonl')
+
+def get_explain_rate():
+    """Share of runs that record EXPLAIN plans (QUERY_EXPLAIN=0 never, 1 every run)"""
+    value = os.getenv('QUERY_EXPLAIN', '0.1').strip().lower()
+    if value in ('false', 'no', 'off'):
+        return 0.0
+    if value in ('true', 'yes', 'on'):
+        return 1.0
+    return min(max(float(value), 0.0), 1.0)
+
+def get_explain_enabled():
+    """Whether this run records EXPLAIN plans (drawn once per run at QUERY_EXPLAIN's rate)"""
+    rate = get_explain_rate()
+    return rate >= 1 or random.random() < rate
+
+def get_regression_settings():
+    """Get (slowdown factor, minimum seconds, runs in baseline) for regression flags"""
+    return (
+        float(os.getenv('QUERY_REGRESSION_FACTOR', '2.0')),
+        float(os.getenv('QUERY_REGRESSION_MIN_SECONDS', '0.5')),
+        int(os.getenv('QUERY_REGRESSION_HISTORY', '10')),
+    )
+
+def timed_read_sql(query, engine, params=None, timeout=None):
+    """pd.read_sql with wall time, time to first row, rows and approximate bytes, within an optional deadline"""
+    start = time.perf_counter()
+    with engine.connect() as conn, query_deadline(conn, timeout):
+        result = conn.execution_options(stream_results=True).execute(query, params or {})
+        rows = result.fetchmany(1)
+        first_row = time.perf_counter() - start
+        rows += result.fetchall()
+        columns = list(result.keys())
+    wall = time.perf_counter() - start
+
+    # Same conversion read_sql applies (Decimal -> float)
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    return df, {
+        'wall_seconds': round(wall, 4),
+        'first_row_seconds': round(first_row, 4),
+        'rows': len(rows),
+        'approx_bytes': approx_result_bytes(rows),
+    }
+
+def approx_result_bytes(rows):
+    """Bytes transferred, scaled up from the text width of an evenly spaced sample of rows"""
+    if not rows:
+        return 0
+    sample = rows[::max(len(rows) // BYTES_SAMPLE_ROWS, 1)]
+    width = sum(len(str(value)) for row in sample for value in row if value is not None)
+    return round(width * len(rows) / len(sample))
+
+def approx_frame_bytes(df):
+    """approx_result_bytes for rows already read into a DataFrame (streamed chunks)"""
+    if df.empty:
+        return 0
+    sample = df.iloc[::max(len(df) // BYTES_SAMPLE_ROWS, 1)]
+    width = approx_result_bytes(list(sample.itertuples(index=False, name=None)))
+    return round(width * len(df) / len(sample))
+
+def sqlite_index_name(detail):
+    """Index named in an EXPLAIN QUERY PLAN line ('automatic' for indexes SQLite builds on the fly)"""
+    name = detail.split(' INDEX ', 1)[1].split(' ')[0]
+    return 'automatic' if name.startswith('(') else name
+
+def explain_query(engine, query, params=None):
+    """EXPLAIN plan summary: estimated rows examined, indexes used and full scans"""
+    try:
+        dialect = engine.dialect.name
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+        statement = text(prefix + query.text)
+        if ':user_ids' in query.text:
+            statement = statement.bindparams(bindparam('user_ids', expanding=True))
+        with engine.connect() as conn:
+            plan = pd.DataFrame(conn.execute(statement, params or {}).mappings().all())
+
+        if dialect == 'sqlite':
+            details = plan['detail'].tolist() if 'detail' in plan else []
+            return {
+                'rows_examined': None,
+                'indexes': sorted({sqlite_index_name(d) for d in details if ' INDEX ' in d}),
+                'full_scans': [d.split(' ', 1)[1].split(' ')[0] for d in details if d.startswith('SCAN ') and ' INDEX ' not in d],
+                'plan': details,
+            }
+
+        rows = pd.to_numeric(plan.get('rows'), errors='coerce').fillna(0) if 'rows' in plan else pd.Series(dtype=float)
+        return {
+            'rows_examined': int(rows.sum()),
+            'indexes': sorted(set(plan['key'].dropna().astype(str))) if 'key' in plan else [],
+            'full_scans': plan.loc[plan.get('type') == 'ALL', 'table'].astype(str).tolist() if 'type' in plan else [],
+            'plan': json.loads(plan.to_json(orient='records')),
+        }
+    except Exception as e:
+        return {'error': str(e)}
+
+def summarize_sections(entries):
+    """Totals per section across its batches"""
+    summary = {}
+    for entry in entries:
+        section = summary.setdefault(entry['section'], {
+            'wall_seconds': 0.0, 'first_row_seconds': 0.0, 'rows': 0, 'approx_bytes': 0, 'batches': 0,
+        })
+        section['wall_seconds'] = round(section['wall_seconds'] + entry['wall_seconds'], 4)
+        section['first_row_seconds'] = max(section['first_row_seconds'], entry['first_row_seconds'])
+        section['rows'] += entry['rows']
+        section['approx_bytes'] += entry['approx_bytes']
+        section['batches'] += 1
+        if 'explain' in entry and 'explain' not in section:
+            section['explain'] = entry['explain']
+    return summary
+
+def load_recent_runs(path, limit):
+    """Last `limit` runs from the metrics file"""
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    runs = []
+    for line in lines[-limit:]:
+        try:
+            runs.append(json.loads(line))
+        except ValueError:
+            continue
+    return runs
+
+def find_regressions(summary, history, factor, min_seconds):
+    """Sections whose wall time exceeds factor x their median over previous runs"""
+    regressions = {}
+    for key, section in summary.items():
+        previous = [run['sections'][key]['wall_seconds'] for run in history if key in run.get('sections', {})]
+        if not previous:
+            continue
+        baseline = float(pd.Series(previous).median())
+        if section['wall_seconds'] >= min_seconds and section['wall_seconds'] > baseline * factor:
+            regressions[key] = {'wall_seconds': section['wall_seconds'], 'baseline_seconds': round(baseline, 4)}
+    return regressions
+
+def format_slow_query_report(summary, regressions, top=10):
+    """Ranked slow-query summary for the console"""
+    ranked = sorted(summary.items(), key=lambda item: item[1]['wall_seconds'], reverse=True)[:top]
+    lines = ["SLOW QUERIES", '-' * 50]
+    for i, (key, section) in enumerate(ranked, 1):
+        explain = section.get('explain', {})
+        scans = f" | full scan: {', '.join(explain['full_scans'])}" if explain.get('full_scans') else ''
+        flag = ' | REGRESSION' if key in regressions else ''
+        lines.append(
+            f"{i}. {key}: {section['wall_seconds']:.2f}s (first row {section['first_row_seconds']:.2f}s), "
+            f"{section['rows']:,} rows, ~{section['approx_bytes']:,} bytes{scans}{flag}"
+        )
+    for key, regression in regressions.items():
+        lines.append(f"REGRESSION {key}: {regression['wall_seconds']:.2f}s vs median {regression['baseline_seconds']:.2f}s")
+    return "\n".join(lines)
+
+def record_run_metrics(entries, path=None):
+    """Append this run's metrics to the metrics file and print the slow-query summary"""
+    path = path or get_metrics_file()
+    factor, min_seconds, history_runs = get_regression_settings()
+    summary = summarize_sections(entries)
+    regressions = find_regressions(summary, load_recent_runs(path, history_runs), factor, min_seconds)
+
+    run = {
+        'run_at': datetime.now().isoformat(),
+        'total_wall_seconds': round(sum(entry['wall_seconds'] for entry in entries), 4),
+        'sections': summary,
+        'regressions': regressions,
+    }
+    with open(path, 'a') as f:
+        f.write(json.dumps(run, default=str) + "\n")
+    print(format_slow_query_report(summary, regressions))
+    return run
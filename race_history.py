@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Keyset-paginated race history
+
+The dashboard sections only keep the newest races of each horse
+(Recent_Race_Performance) or bot (All_Horses_Complete_Races). Older history is
+read here one page at a time, for one bot or one horse, walking back along
+(user_id, created_ts, _id). Each page seeks straight to its cursor on the
+(user_id[, user_horse_id], created_ts, _id) index, so page 500 costs the same
+as page 1. Rows without a created_ts sort after every dated row (as NULLs do
+in a DESC order on MySQL and SQLite) and are paged by _id alone.
+
+    python race_history.py --user-id 10111491 --horse 274848022531
+    python race_history.py --user-id 10111491 --section All_Horses_Complete_Races --cursor <next_cursor>
+"""
+
+import argparse
+import base64
+import json
+import os
+import pandas as pd
+from sqlalchemy import text
+from metric_registry import METRICS, render_sql
+from incremental_refresh import frame_to_records
+from db_routing import create_router, dispose_router, engine_for
+from query_deadlines import query_deadline, section_timeout
+
+HISTORY_SECTIONS = ['Recent_Race_Performance', 'All_Horses_Complete_Races']
+
+def get_history_page_size():
+    """Get the default number of races per page from environment variables"""
+    return max(int(os.getenv('RACE_HISTORY_PAGE_SIZE', '100')), 1)
+
+def encode_cursor(row):
+    """Opaque cursor pointing just past a row (a NULL created_ts is kept as null)"""
+    race_date = None if pd.isna(row['race_date']) else str(row['race_date'])
+    position = json.dumps([race_date, int(row['snapshot_id'])])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """(created_ts, _id) from a cursor; created_ts is None past the last dated row"""
+    created_ts, snapshot_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return created_ts, int(snapshot_id)
+
+_compiled = {}
+
+def build_history_query(section, by_horse, after_cursor, null_cursor=False):
+    """One page of a section's rows for one bot (or one horse), newest first"""
+    key = (section, by_horse, after_cursor, null_cursor)
+    if key not in _compiled:
+        spec = dict(METRICS[section])
+        spec.pop('per_group_limit', None)
+        spec.pop('limit', None)
+        # 'hs.' for the joined section, '' for the plain snapshot one
+        prefix = spec['user_column'][:-len('user_id')]
+        filters = list(spec.get('filters', [])) + [f"{prefix}user_id = :user_id"]
+        if by_horse:
+            filters.append(f"{prefix}user_horse_id = :user_horse_id")
+        if after_cursor and null_cursor:
+            # Already in the undated tail, which is ordered by _id only
+            filters.append(f"({prefix}created_ts IS NULL AND {prefix}_id < :cursor_id)")
+        elif after_cursor:
+            filters.append(
+                f"({prefix}created_ts < :cursor_ts OR {prefix}created_ts IS NULL"
+                f" OR ({prefix}created_ts = :cursor_ts AND {prefix}_id < :cursor_id))"
+            )
+        spec.update(
+            user_column=None,
+            filters=filters,
+            order_by=[f"{prefix}created_ts DESC", f"{prefix}_id DESC"],
+        )
+        _compiled[key] = text(render_sql(spec) + "\nLIMIT :page_size")
+    return _compiled[key]
+
+def fetch_race_history(engine, user_id, user_horse_id=None, cursor=None, page_size=None,
+                       section='Recent_Race_Performance'):
+    """One page of race history plus the cursor of the next (None on the last page), within the Race_History deadline"""
+    if section not in HISTORY_SECTIONS:
+        raise ValueError(f"{section} is not a race history section")
+    page_size = page_size or get_history_page_size()
+    params = {'user_id': int(user_id), 'page_size': page_size + 1}
+    if user_horse_id is not None:
+        params['user_horse_id'] = int(user_horse_id)
+    if cursor:
+        params['cursor_ts'], params['cursor_id'] = decode_cursor(cursor)
+
+    query = build_history_query(section, user_horse_id is not None, bool(cursor),
+                                null_cursor=bool(cursor) and params['cursor_ts'] is None)
+    with engine.connect() as conn, query_deadline(conn, section_timeout('Race_History')):
+        result = conn.execute(query, params)
+        rows = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()), coerce_float=True)
+
+    # One extra row tells whether another page exists
+    has_more = len(rows) > page_size
+    rows = rows.head(page_size)
+    return {
+        'section': section,
+        'rows': frame_to_records(rows),
+        'next_cursor': encode_cursor(rows.iloc[-1]) if has_more else None,
+    }
+
+def main(argv=None):
+    """Print one page of race history from the command line"""
+    parser = argparse.ArgumentParser(description="Page through a bot's or horse's full race history")
+    parser.add_argument('--user-id', type=int, required=True, help="Bot user_id")
+    parser.add_argument('--horse', type=int, default=None, help="Only this user_horse_id")
+    parser.add_argument('--section', choices=HISTORY_SECTIONS, default='Recent_Race_Performance')
+    parser.add_argument('--cursor', default=None, help="next_cursor from the previous page")
+    parser.add_argument('--page-size', type=int, default=None, help="Races per page (default: RACE_HISTORY_PAGE_SIZE or 100)")
+    parser.add_argument('--mirror', action='store_true', help="Read from the local mirror instead of the live database")
+    args = parser.parse_args(argv)
+
+    if args.mirror:
+        from local_mirror import create_mirror_engine
+        router = create_router(create_mirror_engine(), replica_urls=[])
+    else:
+        from sqlalchemy import create_engine
+        from manual_report_updater import get_database_config
+        router = create_router(create_engine(get_database_config(), pool_pre_ping=True))
+    engine = engine_for(router, 'Race_History')
+
+    page = fetch_race_history(engine, args.user_id, args.horse, args.cursor, args.page_size, args.section)
+    print(json.dumps(page, indent=2, default=str))
+    dispose_router(router)
+
+if __name__ == "__main__":
+    main()
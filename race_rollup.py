@@ -0,0 +1,175 @@
+"""
+Per-horse, per-day race rollup for the distance and surface sections
+
+Keeps a compact rollup keyed by (user_id, user_horse_id, name, day, distance,
+surface, weather, condition) with race counts, position sums/counts, best and
+worst positions, wins, top-3 finishes and rating sums. Each run only reads the
+races settled since the last run (events whose first full_WC_result row has a
+higher _id than the stored watermark), so All_Horses_Distance_Performance and
+All_Horses_Surface_Performance no longer re-aggregate the whole
+snapshot x entrant x event join. Result and event ids are only unique per
+Zone, so the watermark is kept per zone and results join events on
+(event_id, Zone). An event that gets another result row later is not counted
+again.
+
+Counts cover settled races only, the same definition In_Play_Balance uses for
+races that are no longer in play.
+"""
+
+import json
+import os
+import pandas as pd
+from sqlalchemy import bindparam, text
+from incremental_refresh import (
+    derive_entrant_sections, frame_from_state, frame_to_state,
+    merge_partials, normalize_partials, save_state,
+)
+from query_deadlines import query_deadline, section_timeout
+from query_metrics import timed_read_sql
+
+ROLLUP_VERSION = 2
+ROLLUP_KEYS = ['user_id', 'user_horse_id', 'name', 'day', 'distance', 'surface', 'weather', 'condition']
+ROLLUP_SECTIONS = ['All_Horses_Distance_Performance', 'All_Horses_Surface_Performance']
+
+# Highest result id per zone, read before the delta so results arriving meanwhile wait for the next run
+RESULT_WATERMARKS_QUERY = """
+    SELECT Zone, MAX(_id) AS result_id
+    FROM full_WC_result
+    GROUP BY Zone
+"""
+
+ROLLUP_DELTA_QUERY = """
+    SELECT
+        hs.user_id,
+        hs.user_horse_id,
+        hs.name,
+        DATE(hs.created_ts) AS day,
+        e.distance,
+        e.surface,
+        e.weather,
+        e.`condition`,
+        COUNT(DISTINCT ent.event_id) AS races,
+        SUM(hs.final_position) AS final_position_sum,
+        COUNT(hs.final_position) AS final_position_cnt,
+        MIN(hs.final_position) AS best_position,
+        MAX(hs.final_position) AS worst_position,
+        SUM(CASE WHEN hs.final_position = 1 THEN 1 ELSE 0 END) AS wins,
+        SUM(CASE WHEN hs.final_position <= 3 THEN 1 ELSE 0 END) AS top_3,
+        SUM(hs.rating) AS rating_sum,
+        COUNT(hs.rating) AS rating_cnt
+    FROM (
+        SELECT DISTINCT event_id, Zone
+        FROM full_WC_result
+        WHERE {new_results}
+    ) r
+    INNER JOIN full_WC_event e ON e._id = r.event_id
+        AND e.Zone = r.Zone
+    INNER JOIN full_WC_entrant ent ON ent.event_id = e._id
+        AND ent.Zone = e.Zone
+    INNER JOIN full_WC_horse_snapshot hs ON hs._id = ent.horse_snapshot_id
+        AND hs.Zone = ent.Zone
+    WHERE hs.user_id IN :user_ids
+        -- Settled in an earlier run: the event already has a result at or below the zone watermark
+        AND NOT EXISTS (
+            SELECT 1 FROM full_WC_result old
+            WHERE old.event_id = r.event_id
+                AND old.Zone = r.Zone
+                AND old._id <= {old_watermark}
+        )
+    GROUP BY hs.user_id, hs.user_horse_id, hs.name, DATE(hs.created_ts),
+        e.distance, e.surface, e.weather, e.`condition`
+"""
+
+def get_rollup_file():
+    """Get the race rollup file from environment variables"""
+    return os.getenv('RACE_ROLLUP_FILE', 'race_rollup.json')
+
+def empty_rollup(TARGET_USER_IDS):
+    """A rollup with no settled races yet"""
+    return {
+        'version': ROLLUP_VERSION,
+        'target_user_ids': TARGET_USER_IDS,
+        'result_ids': {},
+        'partials': None,
+    }
+
+def load_rollup(TARGET_USER_IDS, rollup_file=None):
+    """Load the stored rollup, starting over if the format or bot set changed"""
+    rollup_file = rollup_file or get_rollup_file()
+    if not os.path.exists(rollup_file):
+        return empty_rollup(TARGET_USER_IDS)
+    with open(rollup_file) as f:
+        state = json.load(f)
+    if state.get('version') != ROLLUP_VERSION or state.get('target_user_ids') != TARGET_USER_IDS:
+        print("Race rollup format or bot set changed - rebuilding race rollup")
+        return empty_rollup(TARGET_USER_IDS)
+    return state
+
+def build_delta_query(since, until):
+    """The rollup delta for results in (since, until] per zone ({zone: result_id} each)"""
+    zones = sorted(until)
+    values = {}
+    ranges = []
+    cases = []
+    for i, zone in enumerate(zones):
+        values.update({f'zone_{i}': zone, f'since_{i}': int(since.get(zone, 0)), f'until_{i}': int(until[zone])})
+        ranges.append(f"(Zone = :zone_{i} AND _id > :since_{i} AND _id <= :until_{i})")
+        cases.append(f"WHEN :zone_{i} THEN :since_{i}")
+    new_results = " OR ".join(ranges) or "1 = 0"
+    old_watermark = f"CASE r.Zone {' '.join(cases)} ELSE 0 END" if cases else "0"
+    query = ROLLUP_DELTA_QUERY.format(new_results=new_results, old_watermark=old_watermark)
+    return text(query).bindparams(bindparam('user_ids', expanding=True)), values
+
+def apply_rollup_delta(state, delta, until):
+    """Fold newly settled races into the rollup and advance every zone's result watermark"""
+    if not delta.empty:
+        delta['day'] = delta['day'].astype(str)
+        delta = normalize_partials(delta, ROLLUP_KEYS)
+
+        stored = frame_from_state(state['partials'])
+        merged = merge_partials(stored, delta, ROLLUP_KEYS,
+                                min_columns=['best_position'], max_columns=['worst_position'])
+        state['partials'] = frame_to_state(merged)
+    for zone, result_id in until.items():
+        state['result_ids'][zone] = max(int(result_id), int(state['result_ids'].get(zone, 0)))
+
+def refresh_race_rollup(engine, TARGET_USER_IDS, batches, rebuild=False, rollup_file=None, errors=None,
+                        metrics=None):
+    """Read races settled since the watermarks, update the rollup and serve the distance/surface sections
+
+    Reads run within the Race_Rollup deadline and their timings are added to metrics.
+    A failure is recorded in errors ({section: error}) so the sections are served stale.
+    """
+    rollup_file = rollup_file or get_rollup_file()
+    state = empty_rollup(TARGET_USER_IDS) if rebuild else load_rollup(TARGET_USER_IDS, rollup_file)
+
+    # A failed delta leaves the watermarks alone, so the next run picks the races up
+    try:
+        timeout = section_timeout('Race_Rollup')
+        with engine.connect() as conn, query_deadline(conn, timeout):
+            until = {
+                str(row.Zone): int(row.result_id)
+                for row in conn.execute(text(RESULT_WATERMARKS_QUERY))
+                if int(row.result_id) > int(state['result_ids'].get(str(row.Zone), 0))
+            }
+        query, values = build_delta_query(state['result_ids'], until)
+        parts = []
+        for batch in (batches if until else []):
+            part, timing = timed_read_sql(query, engine, dict(values, user_ids=batch['user_ids']), timeout)
+            parts.append(part)
+            if metrics is not None:
+                timing['section'] = 'Race_Rollup'
+                metrics.append(timing)
+        delta = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        apply_rollup_delta(state, delta, until)
+        save_state(state, rollup_file)
+        print(f"SUCCESS Race_Rollup: {len(delta)} new groups, result watermarks {state['result_ids']}")
+    except Exception as e:
+        print(f"ERROR Race_Rollup: Error - {e}")
+        if errors is not None:
+            errors.update({section: str(e) for section in ROLLUP_SECTIONS})
+
+    partials = frame_from_state(state['partials'])
+    if partials is not None and not partials.empty:
+        partials = partials.drop(columns=['day'])
+    return derive_entrant_sections(partials)
@@ -0,0 +1,187 @@
+"""
+Long-running refresh daemon
+
+Keeps its engines (one connection pool per DSN) warm and refreshes each group of
+sections on its own cadence instead of rebuilding everything per invocation.
+Groups never overlap with themselves, run in parallel with each other (so a
+slow hourly group does not hold up the one-minute balances), get a little
+jitter so they do not line up, and back off exponentially while they fail.
+A failed section keeps its last good data and is marked stale in the manifest.
+
+    python manual_report_updater.py --daemon
+"""
+
+import os
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from metric_registry import METRICS, compile_metrics
+from open_positions import POSITIONS_SECTION, refresh_open_positions
+from pnl_rollup import PNL_SECTIONS, fetch_pnl_rollup, derive_pnl_sections
+from db_routing import dispose_router, engine_for
+from query_deadlines import section_timeout
+from query_metrics import timed_read_sql
+from section_freshness import load_published_sections, record_freshness
+from result_store import compact_frame, merge_result_batches
+from user_batches import batch_params, merge_frame_batches, split_user_ids
+
+# Refresh groups and their default interval in seconds. Registry sections not
+# listed here are refreshed with the 'races' group.
+REFRESH_GROUPS = {
+    'balances': (60, ['Reserve_Balance', 'In_Play_Balance']),
+    'pnl': (300, PNL_SECTIONS),
+    'races': (900, []),
+    'traits': (3600, ['Horse_Traits_Performance', 'Horse_Skills_From_Races']),
+    'stable': (86400, ['Stable_Composition', 'Horse_Inventory']),
+}
+
+def get_refresh_intervals():
+    """Group intervals, overridable with REFRESH_INTERVALS=balances=30,pnl=120,..."""
+    intervals = {group: interval for group, (interval, _) in REFRESH_GROUPS.items()}
+    for item in os.getenv('REFRESH_INTERVALS', '').split(','):
+        if '=' in item:
+            group, seconds = item.split('=', 1)
+            if group.strip() in intervals:
+                intervals[group.strip()] = max(float(seconds), 1)
+    return intervals
+
+def get_refresh_jitter():
+    """Fraction of the interval used as random jitter"""
+    return min(max(float(os.getenv('REFRESH_JITTER', '0.1')), 0), 0.5)
+
+def get_max_backoff():
+    """Longest wait between retries of a failing group"""
+    return float(os.getenv('REFRESH_MAX_BACKOFF', '3600'))
+
+def build_refresh_groups(queries):
+    """{group: sections}, with unlisted registry sections added to 'races'"""
+    groups = {group: list(sections) for group, (_, sections) in REFRESH_GROUPS.items()}
+    assigned = {section for sections in groups.values() for section in sections}
+    groups['races'].extend(key for key in queries if key not in assigned)
+    return groups
+
+def refresh_group(sections, queries, router, batches, positions_user_ids=None):
+    """Fetch one group's sections; returns the results and {section: error} for the ones that failed"""
+    results = {}
+    failed = {}
+    # In_Play_Balance comes from the open-position set (one group only, so one writer of its file)
+    if positions_user_ids and POSITIONS_SECTION in sections:
+        results.update(refresh_open_positions(router['primary'], positions_user_ids, batches, errors=failed))
+    if any(section in PNL_SECTIONS for section in sections):
+        try:
+            engine = engine_for(router, 'PnL_Daily_Rollup')
+            daily = merge_frame_batches([fetch_pnl_rollup(engine, batch) for batch in batches])
+            results.update(derive_pnl_sections(daily))
+        except Exception as e:
+            print(f"ERROR PnL_Daily_Rollup: Error - {e}")
+            failed.update({section: str(e) for section in sections if section in PNL_SECTIONS})
+    for key in sections:
+        if key not in queries or key in results:
+            continue
+        try:
+            engine = engine_for(router, key)
+            parts = [compact_frame(timed_read_sql(queries[key], engine, batch, section_timeout(key))[0]) for batch in batches]
+            results[key] = merge_result_batches(parts, METRICS[key].get('limit'))
+        except Exception as e:
+            print(f"ERROR {key}: Error - {e}")
+            failed[key] = str(e)
+    return results, failed
+
+def next_run(interval, jitter, failures, max_backoff):
+    """Seconds until the next run: jittered interval, or exponential backoff after failures"""
+    if failures:
+        delay = min(interval * 2 ** failures, max_backoff)
+    else:
+        delay = interval
+    return delay * (1 + random.uniform(-jitter, jitter))
+
+def run_daemon(router, params, publish, max_workers=None, open_positions=False):
+    """Refresh every group on its cadence until SIGINT/SIGTERM, publishing after each refresh"""
+    queries = compile_metrics()
+    section_order = PNL_SECTIONS + list(queries)
+    groups = build_refresh_groups(queries)
+    intervals = get_refresh_intervals()
+    jitter = get_refresh_jitter()
+    max_backoff = get_max_backoff()
+    batches = batch_params(params, split_user_ids(params['user_ids']))
+    # Same bot-set string the one-shot updater stores with the open positions
+    positions_user_ids = ", ".join(map(str, params['user_ids'])) if open_positions else None
+
+    # Start from the last published snapshot so a section that fails first time is not published empty
+    published = load_published_sections()
+    data = {key: published.get(key, []) for key in section_order}
+    attempted = set()
+    running = {}
+    failures = {group: 0 for group in groups}
+    due = {group: time.monotonic() for group in groups}
+    lock = threading.Lock()
+    publish_lock = threading.Lock()
+    stop = threading.Event()
+
+    def on_signal(signum, frame):
+        print("Stopping after the running refreshes finish...")
+        stop.set()
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    def job(group):
+        start = time.perf_counter()
+        results, failed = {}, {}
+        ready = False
+        try:
+            results, failed = refresh_group(groups[group], queries, router, batches, positions_user_ids)
+            with lock:
+                # Sections that failed keep their previous data and are marked stale
+                data.update(results)
+                record_freshness(results, failed)
+        except Exception as e:
+            print(f"ERROR {group}: Error - {e}")
+            failed = failed or {section: str(e) for section in groups[group]}
+        finally:
+            # Always schedule the next run, backing off while the group keeps failing
+            failures[group] = failures[group] + 1 if failed else 0
+            delay = next_run(intervals[group], jitter, failures[group], max_backoff)
+            with lock:
+                attempted.add(group)
+                ready = len(attempted) == len(groups)
+                due[group] = time.monotonic() + delay
+            status = 'ERROR' if failed else 'SUCCESS'
+            print(f"{status} {group}: {len(results)} sections in {time.perf_counter() - start:.2f}s, "
+                  f"next in {delay:.0f}s{' (backing off)' if failures[group] else ''}")
+
+        # Publish once every group has had its first go, then after every refresh
+        if ready:
+            with publish_lock:
+                with lock:
+                    snapshot = {key: data[key] for key in section_order}
+                try:
+                    publish(snapshot)
+                except Exception as e:
+                    print(f"ERROR publish: Error - {e}")
+
+    print(f"Refresh daemon started at {datetime.now().isoformat()} with groups: "
+          + ", ".join(f"{group} every {intervals[group]:.0f}s" for group in groups))
+    with ThreadPoolExecutor(max_workers=max_workers or len(groups)) as executor:
+        while not stop.is_set():
+            now = time.monotonic()
+            with lock:
+                for group in groups:
+                    future = running.get(group)
+                    if future is not None and future.done():
+                        del running[group]
+                        error = future.exception()
+                        if error is not None:
+                            print(f"ERROR {group}: refresh crashed - {error!r}")
+                            # job() reschedules itself; only a crash in that bookkeeping gets here
+                            if due[group] == float('inf'):
+                                due[group] = now + min(intervals[group], max_backoff)
+                    # Never overlap a group with itself
+                    if due[group] <= now and group not in running:
+                        running[group] = executor.submit(job, group)
+                        due[group] = float('inf')
+                wait = min(due.values()) - now
+            stop.wait(min(max(wait, 0.1), 1.0))
+    dispose_router(router)
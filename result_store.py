@@ -0,0 +1,63 @@
+"""
+Typed columnar result store
+
+Section query results are kept as compact DataFrames instead of lists of
+dicts. Integer columns are downcast to the smallest width that holds their
+values, so grade, gender, distance and surface fit in int8. Low-cardinality
+text such as horse names, track names and labels becomes categorical. Amounts
+stay float64. Records (or column arrays) are only built at the output
+boundary, one section at a time.
+"""
+
+import pandas as pd
+
+# Text columns become categorical when at most this share of their values is distinct
+CATEGORY_MAX_RATIO = 0.5
+
+def compact_frame(df):
+    """Downcast a query result: small ints, categorical labels, float64 amounts"""
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_integer_dtype(values):
+            values = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            kind = pd.api.types.infer_dtype(values, skipna=True)
+            if kind == 'decimal':
+                values = values.astype('float64')
+            elif kind == 'string' and values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+                values = values.astype('category')
+        columns[col] = values
+    return pd.DataFrame(columns, index=df.index)
+
+def merge_result_batches(frames, limit=None):
+    """Concatenate per-batch results in batch order and re-apply the section LIMIT"""
+    frames = [frame for frame in frames if frame is not None and len(frame.columns)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].head(limit) if limit else frames[0]
+    # Categories differ between batches, so the concatenation is compacted again
+    merged = pd.concat(frames, ignore_index=True)
+    return compact_frame(merged.head(limit) if limit else merged)
+
+def section_records(section):
+    """Records for one section however it is held (None stays None)"""
+    if not isinstance(section, pd.DataFrame):
+        return section
+    # Zipping whole columns is much cheaper than converting the frame row by row
+    columns = list(section.columns)
+    arrays = [column_values(section[col]) for col in columns]
+    return [dict(zip(columns, row)) for row in zip(*arrays)]
+
+def section_frame(section):
+    """A DataFrame for one section however it is held"""
+    if isinstance(section, pd.DataFrame):
+        return section
+    return pd.DataFrame(section or [])
+
+def column_values(values):
+    """One column as plain Python values with None for missing ones"""
+    if not values.hasnans:
+        return values.tolist()
+    return values.astype(object).where(values.notna(), None).tolist()
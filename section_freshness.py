@@ -0,0 +1,83 @@
+"""
+Last good sections and staleness markers
+
+A refresh publishes even when some sections fail or miss their query deadline.
+Those sections keep the rows of the last published snapshot (read back from the
+section files), and SECTION_FRESHNESS_FILE records when each section was last
+fetched successfully. The manifest carries fetched_at/stale/age_seconds for
+every section, so the dashboard can show how old a carried section is. How
+fresh the dashboard is then depends on the fast sections, not the slowest one.
+"""
+
+import json
+import os
+from datetime import datetime
+from bot_data_output import get_section_dir, load_manifest, read_section_file
+from incremental_refresh import save_state
+
+def get_freshness_file():
+    """Get the per-section freshness file from environment variables"""
+    return os.getenv('SECTION_FRESHNESS_FILE', 'section_freshness.json')
+
+def load_freshness(freshness_file=None):
+    """{section: {'fetched_at', 'stale', 'error'}} from the last refreshes"""
+    freshness_file = freshness_file or get_freshness_file()
+    try:
+        with open(freshness_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def record_freshness(fetched, errors=None, freshness_file=None):
+    """Stamp the sections fetched now and mark the failed ones ({section: error}) stale"""
+    freshness_file = freshness_file or get_freshness_file()
+    freshness = load_freshness(freshness_file)
+    now = datetime.now().isoformat()
+    for name in fetched:
+        freshness[name] = {'fetched_at': now, 'stale': False}
+    # A stale section keeps the time it was last fetched
+    for name, error in (errors or {}).items():
+        freshness[name] = {
+            'fetched_at': freshness.get(name, {}).get('fetched_at'),
+            'stale': True,
+            'error': error,
+        }
+    save_state(freshness, freshness_file)
+    return freshness
+
+def load_published_sections(names=None, directory=None):
+    """Records of the last published section files (all of them, or just names)"""
+    directory = directory or get_section_dir()
+    sections = load_manifest(directory).get('sections', {})
+    published = {}
+    for name, entry in sections.items():
+        if names is not None and name not in names:
+            continue
+        try:
+            published[name] = read_section_file(os.path.join(directory, entry['file']))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"ERROR {name}: no last good data - {e}")
+    return published
+
+def carry_last_good(data, failed, directory=None):
+    """Replace failed sections with their last published rows; returns the ones carried"""
+    published = load_published_sections(set(failed), directory)
+    data.update(published)
+    for name in published:
+        print(f"STALE {name}: serving the last published {len(published[name])} records")
+    return list(published)
+
+def freshness_markers(freshness, names, now=None):
+    """Manifest fields (fetched_at, stale, age_seconds) for each section"""
+    now = now or datetime.now()
+    markers = {}
+    for name in names:
+        entry = freshness.get(name, {})
+        fetched_at = entry.get('fetched_at')
+        age = (now - datetime.fromisoformat(fetched_at)).total_seconds() if fetched_at else None
+        markers[name] = {
+            'fetched_at': fetched_at,
+            'stale': bool(entry.get('stale')),
+            'age_seconds': round(age) if age is not None else None,
+        }
+    return markers
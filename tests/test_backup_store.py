@@ -0,0 +1,81 @@
+"""
+Tests for the deduplicated backup store
+"""
+
+import json
+from datetime import datetime, timedelta
+from backup_store import (
+    MAX_CHUNK_FACTOR, content_chunks, list_snapshots, prune_backups, restore_snapshot,
+    save_backup, snapshots_to_keep,
+)
+
+def race_rows(ids):
+    return [json.dumps({'event_id': i, 'final_position': i % 12}) for i in ids]
+
+def test_chunks_keep_every_row_in_order():
+    rows = race_rows(range(5000))
+    chunks = list(content_chunks(rows, 50))
+    assert [row for chunk in chunks for row in chunk] == rows
+    assert len(chunks) > 1
+    assert max(len(chunk) for chunk in chunks) <= MAX_CHUNK_FACTOR * 50
+
+def test_empty_section_is_one_empty_chunk():
+    assert list(content_chunks([], 50)) == [[]]
+
+def test_rows_added_at_the_top_only_change_the_first_chunks():
+    rows = race_rows(range(5000))
+    before = [tuple(chunk) for chunk in content_chunks(rows, 50)]
+    after = [tuple(chunk) for chunk in content_chunks(race_rows(range(9000, 9037)) + rows, 50)]
+    # Every chunk but the one the new rows run into is stored again unchanged
+    assert set(before[1:]) <= set(after)
+    assert before[0] not in after
+
+def test_backup_round_trip_and_deduplication(tmp_path):
+    store = str(tmp_path)
+    data = {
+        'Daily_PnL': [{'user_id': 1, 'date': f'2024-01-{day:02d}', 'daily_pnl_IGGT': day * 1.5} for day in range(1, 29)],
+        'In_Play_Balance': [{'user_id': 1, 'in_play_balance_IGGT': None}],
+    }
+    now = datetime(2024, 1, 28, 12, 0, 0)
+    first_id, first_new, _ = save_backup(data, store_dir=store, chunk_rows=4, now=now)
+    second_id, second_new, second_bytes = save_backup(data, store_dir=store, chunk_rows=4, now=now)
+
+    assert first_new > 0
+    assert (second_new, second_bytes) == (0, 0)
+    # Two backups in the same second keep separate snapshots
+    assert (first_id, second_id) == ('20240128_120000', '20240128_120000_01')
+    assert list_snapshots(store) == [first_id, second_id]
+    assert restore_snapshot(second_id, store) == data
+
+def test_retention_keeps_newest_per_hour_then_per_day():
+    now = datetime(2024, 3, 10, 12, 30, 0)
+    taken = [
+        now - timedelta(minutes=5),
+        now - timedelta(minutes=20),
+        now - timedelta(hours=2, minutes=10),
+        now - timedelta(days=5, hours=1),
+        now - timedelta(days=5, hours=3),
+        now - timedelta(days=200),
+    ]
+    ids = sorted(t.strftime('%Y%m%d_%H%M%S') for t in taken)
+    keep = snapshots_to_keep(ids, now=now, keep_hours=48, keep_days=90)
+    assert keep == {
+        taken[0].strftime('%Y%m%d_%H%M%S'),
+        taken[2].strftime('%Y%m%d_%H%M%S'),
+        taken[3].strftime('%Y%m%d_%H%M%S'),
+    }
+
+def test_retention_always_keeps_the_latest_snapshot():
+    now = datetime(2024, 3, 10)
+    ids = ['20200101_000000', '20200101_000000_01']
+    assert snapshots_to_keep(ids, now=now, keep_hours=1, keep_days=1) == {'20200101_000000_01'}
+
+def test_prune_removes_objects_only_old_snapshots_used(tmp_path):
+    store = str(tmp_path)
+    now = datetime(2024, 3, 10, 12, 0, 0)
+    save_backup({'Total_PnL': [{'user_id': 1, 'total_pnl_IGGT': 1.0}]}, store_dir=store, now=now - timedelta(days=400))
+    latest, _, _ = save_backup({'Total_PnL': [{'user_id': 1, 'total_pnl_IGGT': 2.0}]}, store_dir=store, now=now)
+
+    assert prune_backups(store, now=now, keep_hours=48, keep_days=90) == (1, 1)
+    assert list_snapshots(store) == [latest]
+    assert restore_snapshot(latest, store) == {'Total_PnL': [{'user_id': 1, 'total_pnl_IGGT': 2.0}]}
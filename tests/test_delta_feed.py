@@ -0,0 +1,86 @@
+"""
+Tests for the row-level delta feed
+"""
+
+import json
+import os
+from delta_feed import DELTA_FILE, section_delta, update_delta_feed
+
+def balances(*rows):
+    return [{'user_id': user_id, 'reserve_balance_IGGT': amount} for user_id, amount in rows]
+
+def apply_patch(name, old_records, patch):
+    """What a client holding old_records does with one section patch"""
+    if 'replace' in patch:
+        return patch['replace']
+    keys = patch['keys']
+    rows = {tuple(r[k] for k in keys): r for r in old_records}
+    for key in patch['remove']:
+        rows.pop(tuple(key), None)
+    for row in patch['upsert']:
+        rows[tuple(row[k] for k in keys)] = row
+    return list(rows.values())
+
+def test_patch_upserts_changed_rows_and_removes_missing_ones():
+    old = balances(*[(user_id, 100.0) for user_id in range(10)])
+    new = balances(*[(user_id, 5.0 if user_id == 3 else 100.0) for user_id in range(1, 10)], (11, 7.0))
+    patch = section_delta('Reserve_Balance', old, new)
+    assert patch['keys'] == ['user_id']
+    assert sorted(row['user_id'] for row in patch['upsert']) == [3, 11]
+    assert patch['remove'] == [[0]]
+    assert sorted(apply_patch('Reserve_Balance', old, patch), key=lambda r: r['user_id']) == \
+        sorted(new, key=lambda r: r['user_id'])
+
+def test_unchanged_section_gives_an_empty_patch():
+    rows = balances(*[(user_id, 1.5) for user_id in range(5)])
+    patch = section_delta('Reserve_Balance', rows, list(rows))
+    assert patch['upsert'] == [] and patch['remove'] == []
+
+def test_section_without_keys_is_replaced():
+    new = [{'anything': 1}]
+    assert section_delta('Not_A_Section', [{'anything': 0}], new) == {'replace': new}
+
+def test_first_snapshot_of_a_section_is_replaced():
+    new = balances((1, 2.0))
+    assert section_delta('Reserve_Balance', None, new) == {'replace': new}
+
+def test_removed_section_is_dropped():
+    assert section_delta('Reserve_Balance', balances((1, 2.0)), None) == {'drop': True}
+
+def test_duplicate_keys_fall_back_to_replace():
+    new = balances((1, 2.0), (1, 3.0))
+    assert section_delta('Reserve_Balance', balances((1, 2.0)), new) == {'replace': new}
+
+def test_patch_larger_than_the_section_is_replaced():
+    old = balances(*[(user_id, 1.0) for user_id in range(5)])
+    new = balances(*[(user_id, 2.0) for user_id in range(5)])
+    assert section_delta('Reserve_Balance', old, new) == {'replace': new}
+
+def test_missing_values_compare_as_null():
+    old = balances((1, None), *[(user_id, 1.0) for user_id in range(2, 10)])
+    new = balances((1, float('nan')), *[(user_id, 1.0) for user_id in range(2, 10)])
+    patch = section_delta('Reserve_Balance', old, new)
+    assert patch['upsert'] == [] and patch['remove'] == []
+
+def test_feed_keeps_only_the_latest_patches(tmp_path):
+    directory = str(tmp_path)
+    data = {'Reserve_Balance': balances(*[(user_id, 1.0) for user_id in range(10)])}
+    for snapshot in range(1, 6):
+        previous = {'Reserve_Balance': data['Reserve_Balance']}
+        data = {'Reserve_Balance': balances((0, float(snapshot)), *[(user_id, 1.0) for user_id in range(1, 10)])}
+        manifest = {'snapshot': snapshot, 'generated_at': f'2024-01-0{snapshot}T00:00:00'}
+        log = update_delta_feed(manifest, ['Reserve_Balance'], previous, data, directory=directory, history=3)
+
+    assert [patch['snapshot'] for patch in log['patches']] == [3, 4, 5]
+    assert log['oldest_base'] == 2
+    assert log['snapshot'] == 5
+    with open(os.path.join(directory, DELTA_FILE)) as f:
+        assert json.load(f) == log
+
+def test_first_snapshot_starts_a_new_feed(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, DELTA_FILE), 'w') as f:
+        json.dump({'patches': [{'base': 7, 'snapshot': 8, 'sections': {}}]}, f)
+    log = update_delta_feed({'snapshot': 1, 'generated_at': 'now'}, ['Reserve_Balance'], {}, {},
+                            directory=directory)
+    assert log == {'snapshot': 1, 'oldest_base': 1, 'patches': []}
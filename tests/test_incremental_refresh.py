@@ -0,0 +1,149 @@
+"""
+Tests for the incremental refresh cursors and for incremental vs full output
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from incremental_refresh import (
+    DELTA_SECTIONS, HORSE_AVG_COLUMNS, HORSE_KEYS, HORSE_MAX_COLUMNS, HORSE_SUM_COLUMNS,
+    apply_horse_delta, empty_state, frame_from_state, take_new_rows,
+)
+from result_store import section_frame
+
+@pytest.fixture(autouse=True)
+def small_windows(monkeypatch):
+    monkeypatch.setenv('INCREMENTAL_OVERLAP_IDS', '2')
+    monkeypatch.setenv('INCREMENTAL_PENDING_IDS', '5')
+
+def snapshots(ids, unsettled=(), zone='EU'):
+    """Snapshot delta rows of one horse"""
+    rows = pd.DataFrame({'Zone': zone, '_id': ids})
+    rows['final_position'] = [np.nan if i in unsettled else 1 + i % 4 for i in ids]
+    for col in HORSE_KEYS:
+        rows[col] = 1
+    rows['name'] = 'Horse 1'
+    for col in HORSE_AVG_COLUMNS[1:] + HORSE_SUM_COLUMNS:
+        rows[col] = 10
+    for col in HORSE_MAX_COLUMNS:
+        rows[col] = 'A'
+    return rows
+
+def test_first_read_keeps_unsettled_rows_pending():
+    cursors = {}
+    first, settled = take_new_rows('horse', cursors, snapshots([1, 2, 3, 4], unsettled=[3]))
+    assert first['_id'].tolist() == [1, 2, 3, 4]
+    assert settled.empty
+    assert cursors['EU']['watermark'] == 4
+    assert cursors['EU']['pending'] == [[3, 3]]
+    # Only settled rows inside the overlap are remembered as seen
+    assert sorted(item[1] for item in cursors['EU']['seen']) == [4]
+
+def test_overlap_reread_skips_rows_already_taken():
+    cursors = {}
+    take_new_rows('horse', cursors, snapshots([1, 2, 3, 4], unsettled=[3]))
+    first, settled = take_new_rows('horse', cursors, snapshots([3, 4, 5], unsettled=[3]))
+    assert first['_id'].tolist() == [5]
+    assert settled.empty
+    assert cursors['EU']['pending'] == [[3, 3]]
+
+def test_pending_row_is_returned_once_it_settles():
+    cursors = {}
+    take_new_rows('horse', cursors, snapshots([1, 2, 3, 4], unsettled=[3]))
+    first, settled = take_new_rows('horse', cursors, snapshots([3, 4]))
+    assert first.empty
+    assert settled['_id'].tolist() == [3]
+    assert cursors['EU']['pending'] == []
+    # A later overlap re-read does not return it again
+    first, settled = take_new_rows('horse', cursors, snapshots([3, 4]))
+    assert first.empty and settled.empty
+
+def test_rows_far_behind_the_watermark_are_given_up():
+    cursors = {}
+    take_new_rows('horse', cursors, snapshots([1, 2], unsettled=[1]))
+    take_new_rows('horse', cursors, snapshots([1, 10], unsettled=[1]))
+    assert cursors['EU']['pending'] == []
+    assert cursors['EU']['given_up'] == 1
+
+def test_zones_keep_their_own_cursors():
+    cursors = {}
+    rows = pd.concat([snapshots([7, 8], zone='EU'), snapshots([7], zone='NA')], ignore_index=True)
+    first, _ = take_new_rows('horse', cursors, rows)
+    assert len(first) == 3
+    assert cursors['EU']['watermark'] == 8
+    assert cursors['NA']['watermark'] == 7
+
+def test_unsettled_snapshot_is_counted_before_its_result():
+    state = empty_state('1', '2024-01-01')
+    apply_horse_delta(state, snapshots([1, 2], unsettled=[2]))
+    partials = frame_from_state(state['horse_partials'])
+    assert partials['races'].sum() == 2
+    assert partials['final_position_cnt'].sum() == 1
+    assert partials['wins'].sum() == 0
+
+    # Settling adds the result, not another race
+    rows = snapshots([2])
+    rows['final_position'] = 1.0
+    apply_horse_delta(state, rows)
+    partials = frame_from_state(state['horse_partials'])
+    assert partials['races'].sum() == 2
+    assert partials['final_position_cnt'].sum() == 2
+    assert partials['wins'].sum() == 1
+    assert partials['rating_sum'].sum() == 20
+
+def comparable(section):
+    """A section as a frame that compares equal regardless of row order and dtypes"""
+    df = section_frame(section)
+    df = df[sorted(df.columns)]
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(float).round(6)
+        else:
+            df[col] = df[col].astype(str)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    from benchmark_updater import bot_user_ids, generate_dataset
+    db_path = str(tmp_path / 'mirror.sqlite')
+    generate_dataset(db_path, entrants=3000, bots=2, horses_per_bot=10, days=10)
+    monkeypatch.setenv('LOCAL_MIRROR_PATH', db_path)
+    monkeypatch.setenv('BOT_USER_IDS', ','.join(map(str, bot_user_ids(2))))
+    for name, file in [('UPDATER_STATE_FILE', 'state.json'), ('QUERY_METRICS_FILE', 'metrics.jsonl'),
+                       ('SECTION_FRESHNESS_FILE', 'freshness.json'), ('SECTION_DATA_DIR', 'data')]:
+        monkeypatch.setenv(name, str(tmp_path / file))
+    monkeypatch.setenv('QUERY_EXPLAIN', '0')
+    monkeypatch.setenv('INCREMENTAL_OVERLAP_IDS', '1000')
+    monkeypatch.setenv('INCREMENTAL_PENDING_IDS', '200000')
+    return create_engine(f"sqlite:///{db_path}")
+
+def assert_incremental_matches_plain(updater, rebuild):
+    plain = updater.fetch_bot_data(mirror=True)
+    incremental = updater.fetch_bot_data(mirror=True, incremental=True, rebuild=rebuild)
+    for key in DELTA_SECTIONS['horse'] + DELTA_SECTIONS['entrant']:
+        pd.testing.assert_frame_equal(comparable(incremental[key]), comparable(plain[key]), obj=key)
+
+def test_incremental_matches_plain_with_unsettled_races(mirror):
+    import manual_report_updater as updater
+    with mirror.begin() as conn:
+        conn.execute(text("UPDATE full_WC_horse_snapshot SET final_position = NULL WHERE _id % 7 = 0"))
+    assert_incremental_matches_plain(updater, rebuild=True)
+
+    # The races settle and new ones arrive, some of them unsettled
+    with mirror.begin() as conn:
+        conn.execute(text("UPDATE full_WC_horse_snapshot SET final_position = 1 + _id % 12 WHERE final_position IS NULL"))
+        top = conn.execute(text("SELECT MAX(_id) FROM full_WC_horse_snapshot")).scalar()
+        events = conn.execute(text("SELECT MAX(_id) + 1 FROM full_WC_event")).scalar()
+        shifts = [
+            ('full_WC_event', {'_id': events}, ''),
+            ('full_WC_horse_snapshot', {'_id': top}, 'WHERE _id <= 300'),
+            ('full_WC_entrant', {'_id': top, 'horse_snapshot_id': top, 'event_id': events}, 'WHERE _id <= 300'),
+        ]
+        for table, shift, where in shifts:
+            columns = [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+            copied = ', '.join(f"{col} + {shift[col]}" if col in shift else f'"{col}"' for col in columns)
+            names = ', '.join(f'"{col}"' for col in columns)
+            conn.execute(text(f"INSERT INTO {table} ({names}) SELECT {copied} FROM {table} {where}"))
+        conn.execute(text(f"UPDATE full_WC_horse_snapshot SET final_position = NULL WHERE _id > {top} AND _id % 3 = 0"))
+    assert_incremental_matches_plain(updater, rebuild=False)
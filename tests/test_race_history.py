@@ -0,0 +1,45 @@
+"""
+Tests for the race history cursors and keyset pages
+"""
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from race_history import decode_cursor, encode_cursor, fetch_race_history
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({'race_date': pd.Timestamp('2024-01-05 10:30:00'), 'snapshot_id': 42})
+    assert decode_cursor(cursor) == ('2024-01-05 10:30:00', 42)
+
+def test_null_created_ts_round_trips_as_none():
+    for race_date in (None, float('nan'), pd.NaT):
+        assert decode_cursor(encode_cursor({'race_date': race_date, 'snapshot_id': 7})) == (None, 7)
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    from benchmark_updater import bot_user_ids, generate_dataset
+    from local_mirror import create_mirror_engine
+    db_path = str(tmp_path / 'mirror.sqlite')
+    generate_dataset(db_path, entrants=2000, bots=1, horses_per_bot=5, days=10)
+    monkeypatch.setenv('LOCAL_MIRROR_PATH', db_path)
+    engine = create_mirror_engine()
+    with engine.begin() as conn:
+        # Some snapshots without a created_ts, including ties on the dated ones
+        conn.execute(text("UPDATE full_WC_horse_snapshot SET created_ts = NULL WHERE _id % 9 = 0"))
+        conn.execute(text("UPDATE full_WC_horse_snapshot SET created_ts = '2024-01-01 00:00:00' WHERE _id % 9 = 1"))
+    return engine, bot_user_ids(1)[0]
+
+@pytest.mark.parametrize('section', ['Recent_Race_Performance', 'All_Horses_Complete_Races'])
+def test_pages_return_every_race_once_in_order(mirror, section):
+    engine, user_id = mirror
+    everything = fetch_race_history(engine, user_id, page_size=100000, section=section)['rows']
+    assert any(row['race_date'] is None for row in everything)
+
+    paged, cursor = [], None
+    while True:
+        page = fetch_race_history(engine, user_id, cursor=cursor, page_size=7, section=section)
+        paged += page['rows']
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert [row['snapshot_id'] for row in paged] == [row['snapshot_id'] for row in everything]
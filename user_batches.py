@@ -0,0 +1,38 @@
+"""
+Bounded user-id batches for large bot cohorts
+
+Every dashboard query filters on `user_id IN :user_ids`. For cohorts of tens of
+thousands of accounts that literal list is split into sorted batches of at most
+USER_ID_BATCH_SIZE ids, and each batch runs as its own query. Every section is
+ordered by user_id first, so concatenating the batch results in batch order
+(and re-applying the section's LIMIT) gives the same rows as one big query.
+"""
+
+import os
+import pandas as pd
+
+def get_user_id_batch_size():
+    """Get the maximum number of user ids per query from environment variables"""
+    return max(int(os.getenv('USER_ID_BATCH_SIZE', '1000')), 1)
+
+def split_user_ids(user_ids, batch_size=None):
+    """Sorted, de-duplicated user ids split into consecutive batches"""
+    batch_size = batch_size or get_user_id_batch_size()
+    user_ids = sorted(set(user_ids))
+    return [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)] or [[]]
+
+def batch_params(params, batches):
+    """One copy of the bind params per batch"""
+    return [dict(params, user_ids=batch) for batch in batches]
+
+def merge_record_batches(parts, limit=None):
+    """Concatenate per-batch records in batch order and re-apply the section LIMIT"""
+    records = [record for part in parts for record in part]
+    return records[:limit] if limit else records
+
+def merge_frame_batches(frames):
+    """Concatenate per-batch DataFrames in batch order"""
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)